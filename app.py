@@ -6,17 +6,28 @@
 
 import os
 import sys
-from flask import Flask, jsonify, render_template, request, redirect
+from flask import Flask, jsonify, render_template, request, redirect, Response, stream_with_context, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import text
 from datetime import datetime
 import traceback
 import uuid
+import json
 import random
-import statistics
 import time
 from functools import wraps
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+import click
 from sqlalchemy.exc import OperationalError, DisconnectionError
+from memory_cache import LRUTTLCache, all_cache_stats
+from live_events import InProcessBroker, PostgresNotifyBroker, StreamLimiter, sse_stream
+import report_analytics
+import migrations
+import id_storage
+from perf_profiler import QueryProfiler
+from write_buffer import GroupCommitBuffer
+from compression import ResponseCompressor
+import pagination
 # 导入pg8000异常类型以处理网络错误
 try:
     from pg8000.exceptions import InterfaceError as PG8000InterfaceError
@@ -60,8 +71,27 @@ if 'postgresql' in database_url:
     except Exception as e:
         print(f"⚠️ 数据库连接池配置失败（将使用默认配置）: {str(e)}")
 
+# 评判模式：默认用一条 UPDATE 批量评判整轮（设置 BULK_GRADING=false 回退为逐条评判）
+app.config['BULK_GRADING'] = os.environ.get('BULK_GRADING', 'true').lower() == 'true'
+
+# ID存储方式：text（默认，VARCHAR(36)）或 native（PostgreSQL UUID / SQLite 16字节BLOB），
+# 已有数据库需先执行 flask --app app convert-ids --to native 再切换
+UUID_STORAGE = os.environ.get('UUID_STORAGE', 'text').lower()
+ID_TYPE = id_storage.GUID(native=UUID_STORAGE == 'native')
+
 db = SQLAlchemy(app)
 
+# Jinja 模板字节码缓存：worker 启动（或重启）后第一次渲染模板时直接加载编译结果，不再重新编译
+try:
+    import tempfile
+    from jinja2 import FileSystemBytecodeCache
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(
+        tempfile.gettempdir(), 'classroom-jinja-cache')
+    os.makedirs(JINJA_BYTECODE_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_BYTECODE_CACHE_DIR)
+except OSError as e:
+    print(f"⚠️ 模板字节码缓存不可用: {str(e)}")
+
 # ==================== 数据库连接重试装饰器 ====================
 
 def db_retry(max_retries=3, delay=1):
@@ -133,13 +163,16 @@ class Class(db.Model):
     """班级模型"""
     __tablename__ = 'classes'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(ID_TYPE, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     is_active = db.Column(db.Boolean, default=True)
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
     ended_date = db.Column(db.DateTime)
-    competition_goal_id = db.Column(db.String(36), db.ForeignKey('competition_goals.id'))
+    competition_goal_id = db.Column(ID_TYPE, db.ForeignKey('competition_goals.id'))
+    # 数据版本：影响报告内容的写操作递增（报告的 ETag/Last-Modified）
+    data_version = db.Column(db.Integer, default=0)
+    data_updated_at = db.Column(db.DateTime)
     
     # 备用字段 - 用于未来扩展
     extra_data = db.Column(db.Text)  # JSON格式存储额外数据
@@ -160,7 +193,7 @@ class CompetitionGoal(db.Model):
     """竞赛目标模型"""
     __tablename__ = 'competition_goals'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(ID_TYPE, primary_key=True, default=lambda: str(uuid.uuid4()))
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     goal_date = db.Column(db.Date)
@@ -177,10 +210,13 @@ class CompetitionGoal(db.Model):
 class Student(db.Model):
     """学生模型"""
     __tablename__ = 'students'
+    __table_args__ = (
+        db.Index('idx_students_class_name', 'class_id', 'name'),
+    )
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(ID_TYPE, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(100), nullable=False)
-    class_id = db.Column(db.String(36), db.ForeignKey('classes.id'), nullable=False)
+    class_id = db.Column(ID_TYPE, db.ForeignKey('classes.id'), nullable=False)
     status = db.Column(db.String(20), default='active')  # active, absent
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -197,18 +233,22 @@ class Student(db.Model):
     # 关系
     submissions = db.relationship('StudentSubmission', backref='student_ref', lazy=True)
     attendances = db.relationship('CourseAttendance', backref='student_ref', lazy=True)
+    course_scores = db.relationship('CourseScore', backref='student_ref', lazy=True, cascade='all, delete-orphan')
 
 class Course(db.Model):
     """课程模型"""
     __tablename__ = 'courses'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    class_id = db.Column(db.String(36), db.ForeignKey('classes.id'), nullable=False)
+    id = db.Column(ID_TYPE, primary_key=True, default=lambda: str(uuid.uuid4()))
+    class_id = db.Column(ID_TYPE, db.ForeignKey('classes.id'), nullable=False)
     name = db.Column(db.String(200), nullable=False)
     is_active = db.Column(db.Boolean, default=True)
     current_round = db.Column(db.Integer, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     ended_at = db.Column(db.DateTime)
+    # 数据版本：影响报告内容的写操作递增（报告的 ETag/Last-Modified）
+    data_version = db.Column(db.Integer, default=0)
+    data_updated_at = db.Column(db.DateTime)
     
     # 备用字段 - 用于未来扩展
     extra_data = db.Column(db.Text)  # JSON格式存储额外数据
@@ -222,13 +262,14 @@ class Course(db.Model):
     rounds = db.relationship('CourseRound', backref='course_ref', lazy=True, cascade='all, delete-orphan')
     submissions = db.relationship('StudentSubmission', backref='course_ref', lazy=True)
     attendances = db.relationship('CourseAttendance', backref='course_ref', lazy=True)
+    scores = db.relationship('CourseScore', backref='course_ref', lazy=True, cascade='all, delete-orphan')
 
 class CourseRound(db.Model):
     """课程轮次模型"""
     __tablename__ = 'course_rounds'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    course_id = db.Column(db.String(36), db.ForeignKey('courses.id'), nullable=False)
+    id = db.Column(ID_TYPE, primary_key=True, default=lambda: str(uuid.uuid4()))
+    course_id = db.Column(ID_TYPE, db.ForeignKey('courses.id'), nullable=False)
     round_number = db.Column(db.Integer, nullable=False)
     correct_answer = db.Column(db.String(100), nullable=False)
     question_score = db.Column(db.Integer, default=1)
@@ -238,12 +279,21 @@ class CourseRound(db.Model):
 class StudentSubmission(db.Model):
     """学生提交模型"""
     __tablename__ = 'student_submissions'
+    # 每个学生每轮只能有一条提交（提交接口依赖它实现 ON CONFLICT DO NOTHING）
+    __table_args__ = (
+        db.Index('uq_submissions_student_course_round', 'student_id', 'course_id', 'round_number', unique=True),
+    )
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    student_id = db.Column(db.String(36), db.ForeignKey('students.id'), nullable=False)
-    course_id = db.Column(db.String(36), db.ForeignKey('courses.id'), nullable=False)
+    id = db.Column(ID_TYPE, primary_key=True, default=lambda: str(uuid.uuid4()))
+    student_id = db.Column(ID_TYPE, db.ForeignKey('students.id'), nullable=False)
+    course_id = db.Column(ID_TYPE, db.ForeignKey('courses.id'), nullable=False)
     round_number = db.Column(db.Integer, nullable=False)
     answer = db.Column(db.String(100), nullable=False)
+    # 标准化后的答案（normalize_answer），批量评判在SQL中按它比较；未显式写入时按 answer 计算
+    normalized_answer = db.Column(
+        db.String(200), nullable=True,
+        default=lambda context: normalize_answer(context.get_current_parameters().get('answer'))
+    )
     is_correct = db.Column(db.Boolean, default=False)
     answer_time = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -259,95 +309,1352 @@ class CourseAttendance(db.Model):
     """课程出勤模型"""
     __tablename__ = 'course_attendances'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    course_id = db.Column(db.String(36), db.ForeignKey('courses.id'), nullable=False)
-    student_id = db.Column(db.String(36), db.ForeignKey('students.id'), nullable=False)
+    id = db.Column(ID_TYPE, primary_key=True, default=lambda: str(uuid.uuid4()))
+    course_id = db.Column(ID_TYPE, db.ForeignKey('courses.id'), nullable=False)
+    student_id = db.Column(ID_TYPE, db.ForeignKey('students.id'), nullable=False)
     is_absent = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class CourseScore(db.Model):
+    """课程计分板模型（由评判/行为标记事件增量维护，读取时无需重新计算提交记录）"""
+    __tablename__ = 'course_scores'
+    __table_args__ = (
+        db.UniqueConstraint('course_id', 'student_id', name='uq_course_scores_course_student'),
+    )
+    
+    id = db.Column(ID_TYPE, primary_key=True, default=lambda: str(uuid.uuid4()))
+    student_id = db.Column(ID_TYPE, db.ForeignKey('students.id'), nullable=False)
+    course_id = db.Column(ID_TYPE, db.ForeignKey('courses.id'), nullable=False)
+    score = db.Column(db.Integer, default=0, nullable=False)  # 正确轮次分值之和（不含扣分）
+    correct_rounds = db.Column(db.Integer, default=0, nullable=False)  # 正确轮次数
+    rounds_answered = db.Column(db.Integer, default=0, nullable=False)  # 有提交记录的轮次数
+    penalty_total = db.Column(db.Integer, default=0, nullable=False)  # 扣分总数
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# ==================== 计分引擎 ====================
+# 所有计分都通过"提交→轮次"的一次连接查询按学生聚合完成，
+# 查询次数与学生数、轮次数无关（避免逐条提交查询 CourseRound 的 N+1 问题）
+
+def normalize_answer(answer):
+    """答案标准化：去除首尾空白并转小写（评判时按此比较）
+
+    SQL 的 lower()/trim() 与 Python 不同（SQLite 的 lower() 只处理ASCII，TRIM 只去掉空格），
+    所以写入提交时用本函数计算 normalized_answer，批量评判在SQL中只比较相等
+    """
+    return (answer or '').strip().lower()
+
+def _round_scores_subquery(course_id):
+    """某课程每轮的分值（同一轮次如有重复记录只取一条，避免连接后重复计分）"""
+    from sqlalchemy import func
+    return db.session.query(
+        CourseRound.round_number.label('round_number'),
+        func.max(CourseRound.question_score).label('question_score')
+    ).filter(
+        CourseRound.course_id == course_id
+    ).group_by(CourseRound.round_number).subquery()
+
+def aggregate_course_scores(course_id, below_round=None, student_ids=None):
+    """按学生聚合某课程的得分统计（单次查询）
+
+    Args:
+        course_id: 课程ID
+        below_round: 如果提供，只统计 round_number < below_round 的历史轮次
+        student_ids: 如果提供，只统计这些学生
+
+    Returns:
+        {student_id: {'score': 总分, 'correct_rounds': 正确轮次数,
+                      'rounds_answered': 参与轮次数, 'penalty_total': 扣分总数}}
+        没有提交记录的学生不在结果中
+    """
+    from sqlalchemy import func, case
+    rounds_sq = _round_scores_subquery(course_id)
+    # 没有轮次记录（或分值为空）的正确提交按1分计算，与原逻辑一致
+    round_score = func.coalesce(rounds_sq.c.question_score, 1)
+    is_correct = StudentSubmission.is_correct == True
+
+    query = db.session.query(
+        StudentSubmission.student_id,
+        func.coalesce(func.sum(case((is_correct, round_score), else_=0)), 0).label('score'),
+        func.count(func.distinct(case((is_correct, StudentSubmission.round_number)))).label('correct_rounds'),
+        func.count(func.distinct(StudentSubmission.round_number)).label('rounds_answered'),
+        func.coalesce(func.sum(func.coalesce(StudentSubmission.penalty_score, 0)), 0).label('penalty_total')
+    ).outerjoin(
+        rounds_sq, rounds_sq.c.round_number == StudentSubmission.round_number
+    ).filter(
+        StudentSubmission.course_id == course_id
+    )
+    if below_round is not None:
+        query = query.filter(StudentSubmission.round_number < below_round)
+    if student_ids is not None:
+        query = query.filter(StudentSubmission.student_id.in_(list(student_ids)))
+
+    return {
+        row.student_id: {
+            'score': int(row.score or 0),
+            'correct_rounds': int(row.correct_rounds or 0),
+            'rounds_answered': int(row.rounds_answered or 0),
+            'penalty_total': int(row.penalty_total or 0)
+        }
+        for row in query.group_by(StudentSubmission.student_id).all()
+    }
+
+def aggregate_class_student_totals(class_id):
+    """按学生聚合班级所有课程的累计统计（单次分组查询，只返回每个学生一行）
+
+    Returns:
+        {student_id: (总分, 参与课程数, 缺勤次数)}，包含班级中的所有学生
+    """
+    from sqlalchemy import func, case
+    # 每节课每轮的分值（重复的轮次记录只取一条）
+    rounds_sq = db.session.query(
+        CourseRound.course_id.label('course_id'),
+        CourseRound.round_number.label('round_number'),
+        func.max(CourseRound.question_score).label('question_score')
+    ).join(Course, Course.id == CourseRound.course_id).filter(
+        Course.class_id == class_id
+    ).group_by(CourseRound.course_id, CourseRound.round_number).subquery()
+
+    # 没有轮次记录（或分值为空）的正确提交按1分计算
+    round_score = func.coalesce(rounds_sq.c.question_score, 1)
+    submissions_sq = db.session.query(
+        StudentSubmission.student_id.label('student_id'),
+        func.coalesce(func.sum(case((StudentSubmission.is_correct == True, round_score), else_=0)), 0).label('score'),
+        func.count(func.distinct(StudentSubmission.course_id)).label('courses_count')
+    ).join(Course, Course.id == StudentSubmission.course_id).outerjoin(
+        rounds_sq,
+        (rounds_sq.c.course_id == StudentSubmission.course_id) & (rounds_sq.c.round_number == StudentSubmission.round_number)
+    ).filter(Course.class_id == class_id).group_by(StudentSubmission.student_id).subquery()
+
+    absences_sq = db.session.query(
+        CourseAttendance.student_id.label('student_id'),
+        func.count(CourseAttendance.id).label('absences_count')
+    ).join(Course, Course.id == CourseAttendance.course_id).filter(
+        Course.class_id == class_id,
+        CourseAttendance.is_absent == True
+    ).group_by(CourseAttendance.student_id).subquery()
+
+    rows = db.session.query(
+        Student.id,
+        func.coalesce(submissions_sq.c.score, 0),
+        func.coalesce(submissions_sq.c.courses_count, 0),
+        func.coalesce(absences_sq.c.absences_count, 0)
+    ).outerjoin(
+        submissions_sq, submissions_sq.c.student_id == Student.id
+    ).outerjoin(
+        absences_sq, absences_sq.c.student_id == Student.id
+    ).filter(Student.class_id == class_id).all()
+    return {student_id: (int(score), int(courses), int(absences)) for student_id, score, courses, absences in rows}
+
+def fetch_round_submissions(course_id, round_number):
+    """一次查询取出某轮次的所有提交，返回 {student_id: submission}"""
+    submissions = StudentSubmission.query.filter_by(
+        course_id=course_id,
+        round_number=round_number
+    ).order_by(StudentSubmission.created_at).all()
+    result = {}
+    for sub in submissions:
+        # 同一学生同一轮次如有多条记录，以最早提交为准
+        result.setdefault(sub.student_id, sub)
+    return result
+
+def insert_submission_once(course_id, **values):
+    """插入当前轮次的提交记录，同一学生同一轮次已有提交时什么都不做（单条语句，不需要先查询）
+
+    PostgreSQL/SQLite 使用 INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING，
+    依赖 (student_id, course_id, round_number) 唯一索引；轮次号在同一条语句中
+    从 courses.current_round 读取，课程是否已结束也由同一条语句返回，不受缓存的课程上下文过期影响。
+    学生是否存在、是否请假也在同一条语句中检查（名册缓存不含状态，可能落后于其他 worker）
+
+    Returns:
+        (新记录id, 轮次号, 课程是否已结束)；数据库不支持 RETURNING 时轮次号为 None，
+        是否已结束在同一事务中另行读取；已经提交过、学生已删除或请假时返回 None（原因用 submission_rejection 查询）
+    """
+    from sqlalchemy import select, literal, exists, func
+    from sqlalchemy.exc import IntegrityError
+    values.setdefault('id', str(uuid.uuid4()))
+    values.setdefault('normalized_answer', normalize_answer(values.get('answer')))
+    table = StudentSubmission.__table__
+    courses = Course.__table__
+    students = Student.__table__
+    source = select(
+        courses.c.id, courses.c.current_round,
+        *[literal(value, type_=table.c[key].type) for key, value in values.items()]
+    ).where(
+        courses.c.id == course_id,
+        exists().where(
+            students.c.id == values['student_id'],
+            func.coalesce(students.c.status, 'active') == 'active'
+        )
+    )
+    columns = ['course_id', 'round_number'] + list(values)
+    dialect = db.engine.dialect
+    if dialect.name in ('postgresql', 'sqlite'):
+        if dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).from_select(columns, source).on_conflict_do_nothing(
+            index_elements=['student_id', 'course_id', 'round_number']
+        )
+        if dialect.insert_returning:
+            # 课程的结束时间在 INSERT 的同一条语句中读取（其他 worker 可能刚结束课程）
+            ended_at = select(courses.c.ended_at).where(courses.c.id == course_id).scalar_subquery()
+            row = db.session.execute(stmt.returning(
+                table.c.id, table.c.round_number, ended_at.label('course_ended_at')
+            )).first()
+            return (row.id, row.round_number, row.course_ended_at is not None) if row else None
+        # 旧版 SQLite 不支持 RETURNING：用影响行数判断是否插入成功
+        inserted = db.session.execute(stmt).rowcount
+    else:
+        # 其他数据库：在保存点中插入，唯一索引冲突时回滚保存点
+        try:
+            with db.session.begin_nested():
+                inserted = db.session.execute(table.insert().from_select(columns, source)).rowcount
+        except IntegrityError:
+            return None
+    if not inserted:
+        return None
+    ended_at = db.session.execute(select(courses.c.ended_at).where(courses.c.id == course_id)).scalar()
+    return values['id'], None, ended_at is not None
+
+def insert_submissions_bulk(course_id, round_number, rows):
+    """用一条多行 INSERT 写入同一轮次的多条提交，已经提交过的学生跳过（ON CONFLICT DO NOTHING）
+
+    Args:
+        rows: [{'student_id', 'answer', 'answer_time'}]，同一学生只能出现一次
+
+    Returns:
+        实际插入的学生ID集合
+    """
+    from sqlalchemy import select
+    from sqlalchemy.exc import IntegrityError
+    if not rows:
+        return set()
+    table = StudentSubmission.__table__
+    now = datetime.utcnow()
+    records = [
+        dict(
+            id=str(uuid.uuid4()), course_id=course_id, round_number=round_number,
+            student_id=row['student_id'], answer=row['answer'], answer_time=row['answer_time'],
+            normalized_answer=normalize_answer(row['answer']),
+            is_correct=False, created_at=now,
+            guess_count=0, copy_count=0, noisy_count=0, distracted_count=0, penalty_score=0
+        )
+        for row in rows
+    ]
+    dialect = db.engine.dialect
+    if dialect.name in ('postgresql', 'sqlite'):
+        if dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(records).on_conflict_do_nothing(
+            index_elements=['student_id', 'course_id', 'round_number']
+        )
+        if dialect.insert_returning:
+            return {row.student_id for row in db.session.execute(stmt.returning(table.c.student_id))}
+        # 旧版 SQLite 不支持 RETURNING：按本次生成的ID查出插入成功的行
+        db.session.execute(stmt)
+        ids = [record['id'] for record in records]
+        return set(db.session.execute(select(table.c.student_id).where(table.c.id.in_(ids))).scalars())
+    # 其他数据库：逐条在保存点中插入，唯一索引冲突时跳过
+    inserted = set()
+    for record in records:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(**record))
+            inserted.add(record['student_id'])
+        except IntegrityError:
+            pass
+    return inserted
+
+def judge_submission(submission, correct_answer):
+    """评判单条提交，返回 (is_correct, is_punished)
+
+    被惩罚（penalty_score > 0）的提交无论答案是否正确都判为错误
+    """
+    if not submission:
+        return False, False
+    if submission.penalty_score and submission.penalty_score > 0:
+        return False, True
+    return normalize_answer(submission.answer) == normalize_answer(correct_answer), False
+
+def grade_round_bulk(course_id, round_number, correct_answer):
+    """批量评判：用一条 UPDATE 语句评判整轮的所有提交
+
+    normalized_answer 与 normalize_answer(correct_answer) 相等判为正确（与逐条评判的结果一致）；
+    penalty_score > 0 的提交一律判为错误。
+    数据库支持 RETURNING（PostgreSQL）时直接返回被更新的行，
+    否则（旧版 SQLite 等）回退为 UPDATE 之后再 SELECT 一次。
+
+    Returns:
+        {student_id: row}，row 含 id/student_id/answer/answer_time/penalty_score/is_correct
+    """
+    from sqlalchemy import update, select, func, case
+    condition = (
+        (StudentSubmission.course_id == course_id) &
+        (StudentSubmission.round_number == round_number)
+    )
+    # 迁移之前写入、还没有 normalized_answer 的记录退回 SQL 的 lower(trim())
+    normalized = func.coalesce(StudentSubmission.normalized_answer, func.lower(func.trim(StudentSubmission.answer)))
+    verdict = case(
+        (func.coalesce(StudentSubmission.penalty_score, 0) > 0, False),
+        (normalized == normalize_answer(correct_answer), True),
+        else_=False
+    )
+    columns = (
+        StudentSubmission.id,
+        StudentSubmission.student_id,
+        StudentSubmission.answer,
+        StudentSubmission.answer_time,
+        StudentSubmission.penalty_score,
+        StudentSubmission.is_correct,
+        StudentSubmission.created_at
+    )
+    stmt = update(StudentSubmission).where(condition).values(is_correct=verdict)
+    stmt = stmt.execution_options(synchronize_session=False)
+
+    dialect = db.engine.dialect
+    if getattr(dialect, 'update_returning', dialect.name == 'postgresql'):
+        rows = db.session.execute(stmt.returning(*columns)).all()
+    else:
+        db.session.execute(stmt)
+        rows = db.session.execute(select(*columns).where(condition)).all()
+
+    result = {}
+    # 同一学生同一轮次如有多条记录，以最早提交为准
+    for row in sorted(rows, key=lambda r: r.created_at or datetime.min):
+        result.setdefault(row.student_id, row)
+    return result
+
+# ==================== 课程计分板 ====================
+# course_scores 表保存每个学生在每节课的汇总成绩：
+# 评判时整课写入（评判已经算出了全部总数），提交/行为标记时按增量更新，
+# 读取计分板只需按 course_id 的一次索引查询
+
+SCORE_FIELDS = ('score', 'correct_rounds', 'rounds_answered', 'penalty_total')
+
+def store_course_scores(course_id, stats, student_ids=None):
+    """把汇总成绩写入 course_scores（一次读取已有行 + 批量写入，不提交事务）
+
+    Args:
+        stats: {student_id: {score, correct_rounds, rounds_answered, penalty_total}}
+        student_ids: 需要写入的学生（不在 stats 中的学生写入0），默认为 stats 中的学生
+    """
+    student_ids = set(stats.keys()) | set(student_ids or [])
+    if not student_ids:
+        return
+    existing = {
+        row.student_id: row
+        for row in CourseScore.query.filter(
+            CourseScore.course_id == course_id,
+            CourseScore.student_id.in_(list(student_ids))
+        ).all()
+    }
+    for student_id in student_ids:
+        values = stats.get(student_id, {})
+        row = existing.get(student_id)
+        if not row:
+            row = CourseScore(id=str(uuid.uuid4()), course_id=course_id, student_id=student_id)
+            db.session.add(row)
+        for field in SCORE_FIELDS:
+            setattr(row, field, int(values.get(field, 0) or 0))
+
+def refresh_course_scores(course_id, student_ids=None):
+    """从提交记录重新计算并写入某课程（或其中部分学生）的计分板，返回计算结果"""
+    db.session.flush()
+    stats = aggregate_course_scores(course_id, student_ids=student_ids)
+    store_course_scores(course_id, stats, student_ids)
+    return stats
+
+def bump_course_score(course_id, student_id, **deltas):
+    """按增量更新某学生的计分板（一条 UPDATE 语句）
+
+    该学生还没有计分板记录时（例如旧数据），改为从提交记录重新计算该学生的成绩
+    """
+    from sqlalchemy import update
+    deltas = {field: value for field, value in deltas.items() if field in SCORE_FIELDS and value}
+    if not deltas:
+        return
+    stmt = update(CourseScore).where(
+        CourseScore.course_id == course_id,
+        CourseScore.student_id == student_id
+    ).values(
+        updated_at=datetime.utcnow(),
+        **{field: getattr(CourseScore, field) + value for field, value in deltas.items()}
+    ).execution_options(synchronize_session=False)
+    result = db.session.execute(stmt)
+    if result.rowcount == 0:
+        refresh_course_scores(course_id, [student_id])
+
+def bump_course_scores(course_id, student_ids, **deltas):
+    """多名学生的计分板按相同增量更新（一条 UPDATE 语句），还没有计分板记录的学生从提交记录重新计算"""
+    from sqlalchemy import update
+    student_ids = list(student_ids)
+    deltas = {field: value for field, value in deltas.items() if field in SCORE_FIELDS and value}
+    if not deltas or not student_ids:
+        return
+    stmt = update(CourseScore).where(
+        CourseScore.course_id == course_id,
+        CourseScore.student_id.in_(student_ids)
+    ).values(
+        updated_at=datetime.utcnow(),
+        **{field: getattr(CourseScore, field) + value for field, value in deltas.items()}
+    ).execution_options(synchronize_session=False)
+    if db.session.execute(stmt).rowcount < len(student_ids):
+        existing = {
+            row.student_id for row in db.session.query(CourseScore.student_id).filter(
+                CourseScore.course_id == course_id,
+                CourseScore.student_id.in_(student_ids)
+            ).all()
+        }
+        refresh_course_scores(course_id, [student_id for student_id in student_ids if student_id not in existing])
+
+def load_course_scores(course_id):
+    """读取某课程的计分板，返回 {student_id: {score, correct_rounds, rounds_answered, penalty_total}}
+
+    计分板尚未生成（例如升级前的历史课程）时直接按提交记录聚合，不写入数据库；
+    可以运行 `flask --app app rebuild-course-scores` 补齐
+    """
+    rows = CourseScore.query.filter_by(course_id=course_id).all()
+    if not rows:
+        return aggregate_course_scores(course_id)
+    return {row.student_id: {field: getattr(row, field) or 0 for field in SCORE_FIELDS} for row in rows}
+
+def load_courses_scores(course_ids):
+    """一次查询读取多节课程的计分板，返回 {course_id: {student_id: {...}}}"""
+    course_ids = list(course_ids)
+    result = {course_id: {} for course_id in course_ids}
+    if not course_ids:
+        return result
+    for row in CourseScore.query.filter(CourseScore.course_id.in_(course_ids)).all():
+        result[row.course_id][row.student_id] = {field: getattr(row, field) or 0 for field in SCORE_FIELDS}
+    for course_id in course_ids:
+        if not result[course_id]:
+            result[course_id] = aggregate_course_scores(course_id)
+    return result
+
+@app.cli.command('rebuild-course-scores')
+@click.option('--course-id', default=None, help='只重建指定课程（默认重建所有课程）')
+def rebuild_course_scores_command(course_id):
+    """从提交记录重建 course_scores 计分板（用于修复数据）"""
+    if course_id:
+        course_ids = [course_id]
+    else:
+        course_ids = [row.id for row in db.session.query(Course.id).all()]
+    for cid in course_ids:
+        # 先清空该课程的计分板，避免残留已经没有提交记录的学生
+        CourseScore.query.filter_by(course_id=cid).delete(synchronize_session=False)
+        stats = aggregate_course_scores(cid)
+        store_course_scores(cid, stats)
+        bump_course_version(cid)
+        db.session.commit()
+        print(f"✅ 课程 {cid} 计分板已重建（{len(stats)} 名学生）")
+    print(f"✅ 共重建 {len(course_ids)} 节课程的计分板")
+
+# ==================== 学生历史成绩 ====================
+
+def _supports_window_functions():
+    """数据库是否支持窗口函数（SQLite 3.25 起支持）"""
+    dialect = db.engine.dialect
+    if dialect.name == 'sqlite':
+        version = getattr(dialect.dbapi, 'sqlite_version_info', (0, 0, 0))
+        return tuple(version) >= (3, 25, 0)
+    return True
+
+def _rank_course_scores_sql(student_id, class_id, course_ids):
+    """窗口函数：在数据库中按课程分组排名（活跃学生中分数更高的人数 + 1）"""
+    from sqlalchemy import func, or_
+    ranked = db.session.query(
+        CourseScore.course_id,
+        CourseScore.student_id,
+        CourseScore.score,
+        CourseScore.correct_rounds,
+        CourseScore.rounds_answered,
+        func.rank().over(
+            partition_by=CourseScore.course_id,
+            order_by=CourseScore.score.desc()
+        ).label('rank')
+    ).join(Student, Student.id == CourseScore.student_id).filter(
+        CourseScore.course_id.in_(course_ids),
+        Student.class_id == class_id,
+        # 当前学生即使已缺席也要保留，排名只受活跃学生影响
+        or_(Student.status == 'active', Student.id == student_id)
+    ).subquery()
+    rows = db.session.query(ranked).filter(ranked.c.student_id == student_id).all()
+    return {
+        row.course_id: {
+            'score': row.score or 0,
+            'correct_rounds': row.correct_rounds or 0,
+            'rounds_answered': row.rounds_answered or 0,
+            'rank': int(row.rank)
+        }
+        for row in rows
+    }
+
+def _rank_course_scores_python(student_id, courses_scores, active_ids):
+    """不支持窗口函数时在 Python 中排名（与 RANK() 结果相同）"""
+    result = {}
+    for course_id, course_scores in courses_scores.items():
+        stats = course_scores.get(student_id)
+        if not stats:
+            continue
+        higher_count = sum(
+            1 for sid, other in course_scores.items()
+            if sid in active_ids and (other.get('score') or 0) > (stats.get('score') or 0)
+        )
+        result[course_id] = {
+            'score': stats.get('score') or 0,
+            'correct_rounds': stats.get('correct_rounds') or 0,
+            'rounds_answered': stats.get('rounds_answered') or 0,
+            'rank': higher_count + 1
+        }
+    return result
+
+def load_student_course_history(student, course_ids):
+    """学生在多节课程中的成绩与排名
+
+    查询次数固定（与课程数、学生数无关）：计分板上的窗口函数排名、每节课的轮次数、
+    班级活跃学生数；计分板还没有记录的课程（旧数据）回退到提交记录聚合
+
+    Returns:
+        ({course_id: {'score', 'correct_rounds', 'rounds_answered', 'rank', 'all_rounds'}}, 活跃学生数)
+    """
+    from sqlalchemy import func
+    course_ids = list(course_ids)
+    active_ids = {row.id for row in db.session.query(Student.id).filter_by(
+        class_id=student.class_id, status='active').all()}
+    if not course_ids:
+        return {}, len(active_ids)
+
+    # 哪些课程已有计分板记录
+    scored_ids = {row[0] for row in db.session.query(CourseScore.course_id).filter(
+        CourseScore.course_id.in_(course_ids)).distinct().all()}
+    legacy_ids = [course_id for course_id in course_ids if course_id not in scored_ids]
+
+    if scored_ids and _supports_window_functions():
+        history = _rank_course_scores_sql(student.id, student.class_id, list(scored_ids))
+    else:
+        history = _rank_course_scores_python(student.id, load_courses_scores(scored_ids), active_ids)
+    if legacy_ids:
+        legacy_scores = {course_id: aggregate_course_scores(course_id) for course_id in legacy_ids}
+        history.update(_rank_course_scores_python(student.id, legacy_scores, active_ids))
+
+    round_counts = dict(db.session.query(
+        CourseRound.course_id, func.count(CourseRound.id)
+    ).filter(CourseRound.course_id.in_(course_ids)).group_by(CourseRound.course_id).all())
+    for course_id, stats in history.items():
+        stats['all_rounds'] = round_counts.get(course_id, 0)
+    return history, len(active_ids)
+
+# ==================== 课堂快照缓存 ====================
+# /get_classroom_data 会被课堂页面反复调用，缓存序列化后的快照（按 class_id，值为 (当前轮次, JSON)），
+# 所有会改变课堂数据的写操作在提交后精确失效本 worker 中对应班级的快照；
+# 其他 worker 的写操作通过实时事件通知页面，页面刷新时带上 fresh=1 或新轮次跳过缓存
+
+classroom_snapshot_cache = LRUTTLCache(
+    'classroom_snapshot',
+    maxsize=int(os.environ.get('CLASSROOM_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('CLASSROOM_CACHE_TTL', 5))
+)
+
+# 已结束课程的领奖台数据，按 (course_id, 课程/班级数据版本) 缓存：
+# 课后修改成绩等写操作会递增数据版本，任何 worker 的写操作之后都不会再命中旧的领奖台
+ceremony_podium_cache = LRUTTLCache(
+    'ceremony_podium',
+    maxsize=int(os.environ.get('CEREMONY_CACHE_SIZE', 128)),
+    ttl=float(os.environ.get('CEREMONY_CACHE_TTL', 300))
+)
+
+def invalidate_classroom_snapshot(class_id):
+    """失效某班级的课堂快照（以及该班级课程的领奖台缓存）"""
+    if class_id:
+        classroom_snapshot_cache.invalidate(class_id)
+        ceremony_podium_cache.invalidate_where(lambda key, value: value['classroom']['id'] == class_id)
+
+# ==================== 班级名册缓存 ====================
+# 提交答案、标记行为、删除学生都按姓名查找学生：缓存每个班级的 姓名 -> 学生ID，
+# 添加/删除学生时失效；其他 worker 依靠 TTL 过期（缓存中找不到的姓名会重新读取一次）。
+# 学生状态不缓存：其他 worker 刚标记请假/恢复或删除的学生，缓存可能还没有过期，
+# 所以写入提交时在同一条语句中检查学生存在且未请假（见 insert_submission_once）
+
+roster_cache = LRUTTLCache(
+    'class_roster',
+    maxsize=int(os.environ.get('ROSTER_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('ROSTER_CACHE_TTL', 10))
+)
+
+def _load_roster(class_id):
+    rows = db.session.query(Student.id, Student.name).filter(Student.class_id == class_id).all()
+    roster = {}
+    for student_id, name in rows:
+        roster.setdefault(name, student_id)
+    roster_cache.set(class_id, roster)
+    return roster
+
+def find_student_in_roster(class_id, name):
+    """按姓名查找学生ID，不存在返回 None（缓存的ID可能属于其他 worker 刚删除的学生）"""
+    roster = roster_cache.get(class_id)
+    if roster is None or name not in roster:
+        # 未缓存，或是刚添加的学生（可能由其他 worker 添加）：从数据库重新读取
+        roster = _load_roster(class_id)
+    return roster.get(name)
+
+def find_students_in_roster(class_id, names):
+    """按姓名批量查找学生，返回 {name: student_id}，不存在的姓名不在结果中（最多一次查询）"""
+    roster = roster_cache.get(class_id)
+    if roster is None or any(name not in roster for name in names):
+        roster = _load_roster(class_id)
+    return {name: roster[name] for name in names if name in roster}
+
+def invalidate_roster(class_id):
+    """失效某班级的名册缓存"""
+    if class_id:
+        roster_cache.invalidate(class_id)
+
+def load_student_by_name(class_id, name):
+    """按姓名读取学生对象；缓存中的学生已被删除时重新读取名册再查找一次"""
+    student_id = find_student_in_roster(class_id, name)
+    student = db.session.get(Student, student_id) if student_id else None
+    if student_id and not student:
+        student_id = _load_roster(class_id).get(name)
+        student = db.session.get(Student, student_id) if student_id else None
+    return student
+
+def student_status_rejection(exists, status):
+    """学生不能答题时返回 (提示, HTTP状态码)，可以答题时返回 None"""
+    if not exists:
+        return '学生不存在', 400
+    if (status or 'active') != 'active':
+        return '请假状态的学生无法参与答题', 403
+    return None
+
+def load_student_statuses(student_ids):
+    """一次查询读取学生的当前状态 {student_id: status}（已删除的学生不在结果中）
+
+    PostgreSQL 上对学生行加共享锁，直到事务提交前学生不会被删除（提交不会因外键失败）
+    """
+    if not student_ids:
+        return {}
+    rows = db.session.query(Student.id, Student.status).filter(
+        Student.id.in_(list(student_ids))
+    ).with_for_update(read=True).all()
+    return {student_id: status for student_id, status in rows}
+
+def submission_rejection(class_id, student_id):
+    """提交没有写入时（INSERT ... SELECT 影响0行）查出原因，返回 (提示, HTTP状态码)"""
+    row = db.session.query(Student.status).filter(Student.id == student_id).first()
+    if row is None:
+        # 缓存的ID属于已删除的学生：下次重新读取名册
+        invalidate_roster(class_id)
+    return student_status_rejection(row is not None, row.status if row else None) or ('您已经提交过答案了', 400)
+
+# ==================== 课程上下文 ====================
+# 课堂接口统一按 请求体 course_id -> Referer(/course/<id>) -> 班级(X-Class-ID)的活跃课程 确定课程。
+# 课程上下文 {'id', 'class_id', 'current_round'} 短时间缓存（按课程ID和班级活跃课程两种key），
+# 开始/结束课程和进入下一轮时失效（其他 worker 依靠 TTL 过期）；
+# 需要准确轮次或结束状态的写操作仍以数据库中的课程为准
+
+COURSE_CONTEXT_CACHE_TTL = float(os.environ.get('COURSE_CONTEXT_CACHE_TTL', 2))
+course_context_cache = LRUTTLCache(
+    'course_context',
+    maxsize=int(os.environ.get('COURSE_CONTEXT_CACHE_SIZE', 512)),
+    ttl=COURSE_CONTEXT_CACHE_TTL
+)
+
+def _course_context_from(course):
+    return {
+        'id': course.id,
+        'class_id': course.class_id,
+        'current_round': course.current_round or 1
+    }
+
+def _request_contexts():
+    """同一请求内已解析的课程上下文"""
+    if 'course_contexts' not in g:
+        g.course_contexts = {}
+    return g.course_contexts
+
+def course_context(course_id):
+    """按课程ID读取课程上下文（缓存），课程不存在返回 None"""
+    if not course_id:
+        return None
+    memo = _request_contexts()
+    key = ('course', course_id)
+    if key not in memo:
+        context = course_context_cache.get(key)
+        if context is None:
+            course = db.session.get(Course, course_id)
+            context = _course_context_from(course) if course else None
+            if context:
+                course_context_cache.set(key, context)
+        memo[key] = context
+    return memo[key]
+
+def active_course_context(class_id):
+    """班级当前活跃课程的上下文（缓存），没有活跃课程返回 None"""
+    if not class_id:
+        return None
+    memo = _request_contexts()
+    key = ('class', class_id)
+    if key not in memo:
+        cached = course_context_cache.get(key)
+        if cached is None:
+            course = Course.query.filter_by(class_id=class_id, is_active=True).first()
+            context = _course_context_from(course) if course else None
+            # 没有活跃课程也缓存，避免反复查询
+            course_context_cache.set(key, {'context': context, 'class_id': class_id})
+            if context:
+                course_context_cache.set(('course', context['id']), context)
+        else:
+            context = cached['context']
+        memo[key] = context
+        if context:
+            memo[('course', context['id'])] = context
+    return memo[key]
+
+def resolve_course_id(data=None, class_id=None):
+    """确定当前请求的课程ID：请求体 -> Referer -> 班级活跃课程"""
+    course_id = (data or {}).get('course_id')
+    if not course_id:
+        referer = request.headers.get('Referer', '')
+        if '/course/' in referer:
+            course_id = referer.split('/course/')[-1].split('?')[0].split('#')[0]
+    if not course_id:
+        context = active_course_context(class_id or request.headers.get('X-Class-ID'))
+        if context:
+            course_id = context['id']
+    return course_id
+
+def resolve_class_id():
+    """确定当前请求的班级ID：X-Class-ID -> Referer(/classroom/<id> 或 /course/<id>)"""
+    class_id = request.headers.get('X-Class-ID')
+    if not class_id:
+        referer = request.headers.get('Referer', '')
+        if '/classroom/' in referer:
+            class_id = referer.split('/classroom/')[-1].split('?')[0].split('#')[0]
+        elif '/course/' in referer:
+            context = course_context(referer.split('/course/')[-1].split('?')[0].split('#')[0])
+            if context:
+                class_id = context['class_id']
+    return class_id
+
+def invalidate_course_context(class_id):
+    """失效某班级的课程上下文缓存"""
+    if class_id:
+        course_context_cache.invalidate_where(
+            lambda key, value: key == ('class', class_id) or value.get('class_id') == class_id
+        )
+        if has_app_context():
+            g.pop('course_contexts', None)
+
+# ==================== 课程报告快照 ====================
+# 课程结束后报告数据不再变化：结束课程时由后台任务计算一次班级层面的统计，
+# 以JSON保存在 Course.extra_data['report_analytics']，
+# 之后每个学生的报告只需合并自己的数据（家长课后集中打开报告时不再重复计算）
+
+REPORT_SNAPSHOT_KEY = 'report_analytics'
+REPORT_SNAPSHOT_VERSION = 1
+
+def _course_extra_data(course):
+    """解析 Course.extra_data（JSON），解析失败返回空字典"""
+    try:
+        data = json.loads(course.extra_data) if course.extra_data else {}
+    except (TypeError, ValueError):
+        data = {}
+    return data if isinstance(data, dict) else {}
+
+def build_report_snapshot(course, active_student_ids=None):
+    """计算课程的班级统计快照并写入 Course.extra_data（不提交事务），返回 (rounds, course_stats)"""
+    if active_student_ids is None:
+        active_student_ids = [row.id for row in db.session.query(Student.id).filter_by(class_id=course.class_id, status='active').all()]
+    rounds = [(r.round_number, r.question_score) for r in CourseRound.query.filter_by(course_id=course.id).all()]
+    cells = report_analytics.query_round_cells(db.session, StudentSubmission, course.id, active_student_ids)
+    course_stats = report_analytics.build_course_analytics(rounds, cells, len(active_student_ids))
+    data = _course_extra_data(course)
+    data[REPORT_SNAPSHOT_KEY] = {
+        'version': REPORT_SNAPSHOT_VERSION,
+        'computed_at': datetime.utcnow().isoformat(),
+        'active_student_ids': sorted(active_student_ids),
+        'rounds': rounds,
+        'stats': report_analytics.dump_course_analytics(course_stats)
+    }
+    course.extra_data = json.dumps(data, ensure_ascii=False)
+    return rounds, course_stats
+
+def load_report_snapshot(course, active_student_ids):
+    """读取课程的班级统计快照；快照不存在或与当前活跃学生不一致时返回 None"""
+    snapshot = _course_extra_data(course).get(REPORT_SNAPSHOT_KEY)
+    if not snapshot or snapshot.get('version') != REPORT_SNAPSHOT_VERSION:
+        return None
+    if snapshot.get('active_student_ids') != sorted(active_student_ids):
+        return None
+    rounds = [tuple(r) for r in snapshot['rounds']]
+    return rounds, report_analytics.load_course_analytics(snapshot['stats'])
+
+def clear_report_snapshot(course):
+    """课程数据变化时删除快照（不提交事务）"""
+    if not course or not course.extra_data:
+        return
+    data = _course_extra_data(course)
+    if data.pop(REPORT_SNAPSHOT_KEY, None) is not None:
+        course.extra_data = json.dumps(data, ensure_ascii=False)
+
+def get_course_report_analytics(course, active_student_ids):
+    """报告用的班级统计：已结束课程优先使用快照（缺失时计算并保存），进行中的课程实时计算"""
+    if course.ended_at:
+        cached = load_report_snapshot(course, active_student_ids)
+        if cached:
+            return cached
+        rounds, course_stats = build_report_snapshot(course, active_student_ids)
+        try:
+            db.session.commit()
+        except Exception as e:
+            print(f"⚠️ 保存报告快照失败: {str(e)}")
+            db.session.rollback()
+        return rounds, course_stats
+    rounds = [(r.round_number, r.question_score) for r in CourseRound.query.filter_by(course_id=course.id).all()]
+    cells = report_analytics.query_round_cells(db.session, StudentSubmission, course.id, active_student_ids)
+    return rounds, report_analytics.build_course_analytics(rounds, cells, len(active_student_ids))
+
+def _report_snapshot_job(course_id):
+    """后台任务：计算并保存课程报告快照"""
+    with app.app_context():
+        try:
+            course = Course.query.filter_by(id=course_id).first()
+            if course and course.ended_at:
+                build_report_snapshot(course)
+                db.session.commit()
+                print(f"✅ 课程报告快照已生成: {course.name}")
+        except Exception as e:
+            print(f"⚠️ 生成课程报告快照失败: {str(e)}")
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+def schedule_report_snapshot(course_id):
+    """课程结束时触发报告快照任务（REPORT_SNAPSHOT_ASYNC=false 时同步执行）"""
+    if os.environ.get('REPORT_SNAPSHOT_ASYNC', 'true').lower() == 'true':
+        import threading
+        threading.Thread(target=_report_snapshot_job, args=(course_id,), name='report-snapshot', daemon=True).start()
+    else:
+        _report_snapshot_job(course_id)
+
+# ==================== 报告缓存验证 ====================
+# 班级和课程各有一个数据版本号（data_version）和最后修改时间（data_updated_at），
+# 影响报告内容的写操作都会递增对应的版本号（不提交事务，随写操作一起提交）。
+# 已结束课程的报告、颁奖页，以及所有课程都已结束的学生报告中心据此发送 ETag/Last-Modified：
+# 家长重新打开报告时浏览器带上 If-None-Match，版本未变化直接返回 304，只需一次版本查询。
+# 已结束的课程仍可能被老师修正（补录提交、标记行为），所以用 no-cache（每次验证）而不是长期缓存；
+# 进行中的课程变化频繁，不发送验证信息（进行中的课程提交也不递增版本号，避免热点行竞争）
+
+def _report_etag_salt():
+    """部署版本：代码或模板更新后旧的 ETag 全部失效"""
+    commit = os.environ.get('RENDER_GIT_COMMIT')
+    if commit:
+        return commit[:12]
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    template_dir = os.path.join(base_dir, 'templates')
+    paths = [os.path.join(base_dir, 'app.py')]
+    if os.path.isdir(template_dir):
+        paths += [os.path.join(template_dir, name) for name in os.listdir(template_dir)]
+    return str(int(max(os.path.getmtime(path) for path in paths if os.path.exists(path))))
+
+REPORT_ETAG_SALT = _report_etag_salt()
+
+def bump_course_version(*course_ids):
+    """递增课程的数据版本（一条 UPDATE，不提交事务）"""
+    from sqlalchemy import update, func
+    course_ids = [course_id for course_id in course_ids if course_id]
+    if not course_ids:
+        return
+    db.session.execute(
+        update(Course).where(Course.id.in_(course_ids)).values(
+            data_version=func.coalesce(Course.data_version, 0) + 1,
+            data_updated_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)
+    )
+
+def bump_class_version(class_id=None, goal_id=None):
+    """递增班级的数据版本（按班级ID，或使用该竞赛目标的所有班级；一条 UPDATE，不提交事务）"""
+    from sqlalchemy import update, func
+    if class_id:
+        condition = Class.id == class_id
+    elif goal_id:
+        condition = Class.competition_goal_id == goal_id
+    else:
+        return
+    db.session.execute(
+        update(Class).where(condition).values(
+            data_version=func.coalesce(Class.data_version, 0) + 1,
+            data_updated_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)
+    )
+
+def _report_validators(parts, last_modified):
+    import hashlib
+    key = '|'.join([REPORT_ETAG_SALT] + [str(part) for part in parts])
+    return {
+        'etag': hashlib.sha1(key.encode('utf-8')).hexdigest()[:24],
+        'last_modified': last_modified.replace(microsecond=0) if last_modified else None
+    }
+
+def _today_start():
+    """报告中显示当天日期（或距离竞赛天数）时，Last-Modified 不早于当天零点"""
+    from datetime import date
+    return datetime.combine(date.today(), datetime.min.time())
+
+def course_report_validators(course_id, student_id=None, variant=(), daily=False):
+    """已结束课程报告的缓存验证信息（一次查询）；课程不存在或仍在进行时返回 None
+
+    Args:
+        student_id: 学生报告（学生须属于该课程的班级）
+        variant: 影响页面内容的其他因素（例如移动端模板）
+        daily: 页面包含当天日期
+    """
+    from datetime import date
+    query = db.session.query(
+        Course.data_version, Course.data_updated_at, Course.ended_at, Course.created_at,
+        Class.data_version, Class.data_updated_at
+    ).join(Class, Class.id == Course.class_id).filter(Course.id == course_id)
+    if student_id:
+        query = query.join(Student, Student.class_id == Class.id).filter(Student.id == student_id)
+    row = query.first()
+    if not row or not row[2]:
+        return None
+    course_version, course_updated, ended_at, created_at, class_version, class_updated = row
+    parts = [course_id, student_id, course_version or 0, class_version or 0, *variant]
+    changes = [course_updated, ended_at, created_at, class_updated]
+    if daily:
+        parts.append(date.today())
+        changes.append(_today_start())
+    return _report_validators(parts, max(change for change in changes if change))
+
+def class_report_validators(student_id, variant=(), daily=False):
+    """学生所在班级全部课程的缓存验证信息（一次聚合查询）；班级还有进行中的课程时返回 None"""
+    from datetime import date
+    from sqlalchemy import func, case
+    row = db.session.query(
+        Class.id, Class.data_version, Class.data_updated_at, Class.created_date,
+        func.count(Course.id),
+        func.sum(case((Course.ended_at.is_(None), 1), else_=0)),
+        func.coalesce(func.sum(Course.data_version), 0),
+        func.max(Course.data_updated_at),
+        func.max(Course.ended_at)
+    ).join(Student, Student.class_id == Class.id).outerjoin(
+        Course, Course.class_id == Class.id
+    ).filter(Student.id == student_id).group_by(
+        Class.id, Class.data_version, Class.data_updated_at, Class.created_date
+    ).first()
+    if not row or row[5]:
+        return None
+    class_id, class_version, class_updated, class_created, course_count, _, course_versions, course_updated, ended_at = row
+    parts = [student_id, class_id, class_version or 0, course_count, course_versions, *variant]
+    changes = [class_updated, class_created, course_updated, ended_at]
+    if daily:
+        parts.append(date.today())
+        changes.append(_today_start())
+    changes = [change for change in changes if change]
+    if not changes:
+        return None
+    return _report_validators(parts, max(changes))
+
+def not_modified_response(validators, vary=None):
+    """请求中的缓存仍然有效时返回 304 响应，否则返回 None"""
+    if not validators:
+        return None
+    if request.if_none_match:
+        # 同时带有两种条件时以 If-None-Match 为准（弱比较：压缩后的响应带弱 ETag）
+        fresh = request.if_none_match.contains_weak(validators['etag'])
+    elif request.if_modified_since and validators['last_modified']:
+        fresh = validators['last_modified'] <= request.if_modified_since.replace(tzinfo=None)
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return with_validators(Response(status=304), validators, vary)
+
+def with_validators(body, validators, vary=None):
+    """给报告响应加上 ETag/Last-Modified（validators 为 None 时原样返回）"""
+    from flask import make_response
+    response = make_response(body)
+    if vary:
+        response.vary.add(vary)
+    if validators:
+        response.set_etag(validators['etag'])
+        if validators['last_modified']:
+            response.last_modified = validators['last_modified']
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+# ==================== 页面渲染缓存 ====================
+# 首页和班级管理页面只在写操作后变化：渲染结果按“数据版本”缓存，
+# 版本由一次聚合查询得到（班级/课程的 data_version 和数量、竞赛目标数量），
+# 写操作递增版本后旧的缓存项不再命中（由 LRU 淘汰），多个 worker 之间也不会读到旧页面。
+# 命中时只执行版本查询，跳过页面的其他查询和模板渲染。
+# 进行中课程的提交不递增版本（学生参与课程数在评判后更新），TTL 是兜底
+
+PAGE_RENDER_CACHE_TTL = float(os.environ.get('PAGE_RENDER_CACHE_TTL', 300))
+page_render_cache = LRUTTLCache(
+    'page_render',
+    maxsize=int(os.environ.get('PAGE_RENDER_CACHE_SIZE', 128)),
+    ttl=PAGE_RENDER_CACHE_TTL
+)
+
+def homepage_version():
+    """首页数据的版本（一次查询）"""
+    from sqlalchemy import func, case
+    scalar = lambda *columns: db.session.query(*columns).scalar_subquery()
+    return tuple(db.session.query(
+        scalar(func.count(Class.id)),
+        scalar(func.coalesce(func.sum(Class.data_version), 0)),
+        scalar(func.max(Class.created_date)),
+        scalar(func.max(Class.data_updated_at)),
+        scalar(func.count(Course.id)),
+        scalar(func.count(CompetitionGoal.id)),
+        scalar(func.coalesce(func.sum(case((CompetitionGoal.is_active == True, 1), else_=0)), 0)),
+        scalar(func.max(CompetitionGoal.created_date))
+    ).one())
+
+def class_page_version(class_id):
+    """班级管理页面数据的版本（一次查询），班级不存在返回 None"""
+    from datetime import date
+    from sqlalchemy import func
+    row = db.session.query(
+        Class.data_version, Class.data_updated_at,
+        func.count(Course.id), func.coalesce(func.sum(Course.data_version), 0), func.max(Course.data_updated_at)
+    ).outerjoin(Course, Course.class_id == Class.id).filter(Class.id == class_id).group_by(
+        Class.id, Class.data_version, Class.data_updated_at
+    ).first()
+    if row is None:
+        return None
+    # 竞赛目标剩余天数按当天计算
+    return tuple(row) + (date.today(),)
+
+def render_cached(key, template_name, build_context):
+    """按 key 缓存模板渲染结果；build_context() 返回模板参数，只在未命中时执行"""
+    html = page_render_cache.get(key)
+    if html is None:
+        html = render_template(template_name, **build_context())
+        page_render_cache.set(key, html)
+    return html
+
+# ==================== 历史数据分页 ====================
+# 课程历史、历史班级和学生的提交记录随时间不断增长：页面只渲染第一页，
+# 之后的页面由模板在滚动到底部时通过分页接口加载（键集分页，见 pagination.py）
+
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 20))
+HISTORY_PAGE_MAX = 100
+
+def page_limit(default=None):
+    """请求中的每页条数（limit 参数），限制在 1..HISTORY_PAGE_MAX"""
+    try:
+        limit = int(request.args.get('limit', default or HISTORY_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = default or HISTORY_PAGE_SIZE
+    return max(1, min(limit, HISTORY_PAGE_MAX))
+
+def attach_class_counts(classes):
+    """为班级对象添加 student_count 和 course_count（两次分组查询）"""
+    from sqlalchemy import func
+    class_ids = [class_obj.id for class_obj in classes]
+    student_counts_dict, course_counts_dict = {}, {}
+    if class_ids:
+        student_counts_dict = dict(db.session.query(
+            Student.class_id, func.count(Student.id)
+        ).filter(Student.class_id.in_(class_ids)).group_by(Student.class_id).all())
+        course_counts_dict = dict(db.session.query(
+            Course.class_id, func.count(Course.id)
+        ).filter(Course.class_id.in_(class_ids)).group_by(Course.class_id).all())
+    for class_obj in classes:
+        class_obj.student_count = student_counts_dict.get(class_obj.id, 0)
+        class_obj.course_count = course_counts_dict.get(class_obj.id, 0)
+    return classes
+
+def history_classes_page(cursor=None, limit=None):
+    """历史班级（已结束）的一页，按结束时间降序，返回 (班级列表, 下一页游标)"""
+    return pagination.keyset_page(
+        Class.query.filter_by(is_active=False),
+        pagination.sort_key(Class.ended_date, Class.created_date), Class.id,
+        key=lambda class_obj: (class_obj.ended_date or class_obj.created_date, class_obj.id),
+        cursor=cursor, limit=limit or HISTORY_PAGE_SIZE
+    )
+
+def class_courses_page(class_id, cursor=None, limit=None):
+    """班级课程的一页，有结束时间按结束时间、否则按创建时间降序，返回 (课程列表, 下一页游标)"""
+    return pagination.keyset_page(
+        Course.query.filter_by(class_id=class_id),
+        pagination.sort_key(Course.ended_at, Course.created_at), Course.id,
+        key=lambda course: (course.ended_at or course.created_at, course.id),
+        cursor=cursor, limit=limit or HISTORY_PAGE_SIZE
+    )
+
+def course_list_item(course):
+    """课程历史列表中的一项"""
+    # 确定显示时间：有结束时间显示结束时间，否则显示创建时间
+    display_time = course.ended_at if course.ended_at else course.created_at
+
+    # 如果课程名称为空或只包含空白字符，使用创建时间作为默认名称
+    if not course.name or not course.name.strip():
+        if display_time:
+            course_name = f"课堂 {display_time.strftime('%Y-%m-%d %H:%M:%S')}"
+        else:
+            course_name = "未命名课程"
+    else:
+        course_name = course.name.strip()
+
+    return {
+        'id': course.id,
+        'name': course_name,
+        'created_at': course.created_at,
+        'created_date': display_time.strftime('%Y-%m-%d %H:%M:%S') if display_time else '',
+        'current_round': course.current_round,
+        'is_active': course.is_active
+    }
+
+# ==================== 开课 ====================
+# 开始新课程：一条 UPDATE 结束班级中仍在进行的课程，插入新课程，
+# 再用一条 INSERT ... SELECT 从 students 表生成在读学生的出勤记录（ID 由数据库生成，不逐个创建ORM对象）
+
+# SQLite 没有 UUID 函数：按 UUID v4 格式拼接随机十六进制串
+SQLITE_UUID_SQL = (
+    "lower(hex(randomblob(4))) || '-' || lower(hex(randomblob(2))) || '-4' || "
+    "substr(lower(hex(randomblob(2))), 2) || '-' || substr('89ab', 1 + (abs(random()) % 4), 1) || "
+    "substr(lower(hex(randomblob(2))), 2) || '-' || lower(hex(randomblob(6)))"
+)
+
+def _sql_uuid():
+    """在数据库端生成新ID的SQL表达式（与 UUID_STORAGE 一致），不支持的数据库返回 None"""
+    from sqlalchemy import literal_column
+    dialect = db.engine.dialect.name
+    native = UUID_STORAGE == 'native'
+    if dialect == 'postgresql':
+        # PostgreSQL 13+
+        return literal_column('gen_random_uuid()' if native else 'CAST(gen_random_uuid() AS VARCHAR)')
+    if dialect == 'sqlite':
+        return literal_column('randomblob(16)' if native else SQLITE_UUID_SQL)
+    return None
+
+def close_active_courses(class_id):
+    """结束班级中所有进行中的课程（一条 UPDATE，不提交事务），返回被结束的课程ID列表"""
+    from sqlalchemy import update, select, func
+    condition = (Course.class_id == class_id) & (Course.is_active == True)
+    now = datetime.utcnow()
+    stmt = update(Course).where(condition).values(
+        is_active=False, ended_at=now,
+        data_version=func.coalesce(Course.data_version, 0) + 1, data_updated_at=now
+    )
+    stmt = stmt.execution_options(synchronize_session=False)
+    dialect = db.engine.dialect
+    if getattr(dialect, 'update_returning', dialect.name == 'postgresql'):
+        return list(db.session.execute(stmt.returning(Course.id)).scalars())
+    course_ids = list(db.session.execute(select(Course.id).where(condition)).scalars())
+    if course_ids:
+        db.session.execute(stmt)
+    return course_ids
+
+def create_course_attendance(course_id, class_id):
+    """为班级中在读的学生创建出勤记录（一条 INSERT ... SELECT，不提交事务），返回创建的条数"""
+    from sqlalchemy import insert, select, literal
+    table = CourseAttendance.__table__
+    students = Student.__table__
+    now = datetime.utcnow()
+    condition = (students.c.class_id == class_id) & (students.c.status == 'active')
+    id_sql = _sql_uuid()
+    if id_sql is None:
+        # 其他数据库：读出学生ID后一次批量插入
+        student_ids = db.session.execute(select(students.c.id).where(condition)).scalars().all()
+        if student_ids:
+            db.session.execute(insert(table), [
+                {'id': str(uuid.uuid4()), 'course_id': course_id, 'student_id': student_id,
+                 'is_absent': False, 'created_at': now}
+                for student_id in student_ids
+            ])
+        return len(student_ids)
+    source = select(
+        id_sql,
+        literal(course_id, type_=table.c.course_id.type),
+        students.c.id,
+        literal(False, type_=table.c.is_absent.type),
+        literal(now, type_=table.c.created_at.type)
+    ).where(condition)
+    stmt = insert(table).from_select(['id', 'course_id', 'student_id', 'is_absent', 'created_at'], source)
+    return db.session.execute(stmt).rowcount
+
+def open_course(class_id, name):
+    """结束进行中的课程并开始新课程（不提交事务），返回 (新课程, 被结束的课程ID列表)"""
+    closed_course_ids = close_active_courses(class_id)
+    course = Course(id=str(uuid.uuid4()), class_id=class_id, name=name, current_round=1, is_active=True)
+    db.session.add(course)
+    db.session.flush()
+    create_course_attendance(course.id, class_id)
+    return course, closed_course_ids
+
+# ==================== 实时事件推送 ====================
+# 每节课一个 SSE 频道，推送提交数量、评判结果、轮次变化；
+# 设置 LIVE_EVENT_BROKER=postgres 时通过 LISTEN/NOTIFY 在多个 gunicorn worker 之间分发
+
+def _create_event_broker():
+    broker_type = os.environ.get('LIVE_EVENT_BROKER', 'inprocess').lower()
+    if broker_type == 'postgres':
+        if 'postgresql' in database_url:
+            return PostgresNotifyBroker(lambda: db.engine)
+        print("⚠️ LIVE_EVENT_BROKER=postgres 需要 PostgreSQL 数据库，改用进程内事件代理")
+    return InProcessBroker()
+
+event_broker = _create_event_broker()
+# 每个 worker 同时打开的 SSE 连接数：每条连接在 SSE_MAX_DURATION 秒内占用一个线程，
+# gunicorn 的 --threads 需要在普通请求所需的线程数之外再留出这些线程（render.yaml 为 4 + 2）
+event_stream_limiter = StreamLimiter(int(os.environ.get('SSE_MAX_STREAMS', 2)))
+
+@app.before_request
+def start_event_listener():
+    """worker 处理第一个请求时开始监听其他 worker 发布的事件（之后的事件都进入本进程的历史，用于重连补发）"""
+    event_broker.start()
+
+def publish_course_event(course_id, event, data):
+    """发布课程事件（推送失败不影响业务操作）"""
+    try:
+        event_broker.publish(f'course:{course_id}', event, data)
+    except Exception as e:
+        print(f"⚠️ 推送实时事件失败（{event}）: {str(e)}")
+
+# ==================== 提交缓冲 ====================
+# SUBMISSION_BUFFER=true 时，学生提交先进入本 worker 的组提交缓冲区，
+# 后台线程每 SUBMISSION_BUFFER_DELAY_MS 毫秒（或攒够 SUBMISSION_BUFFER_ROWS 条）在一个事务中批量写入，
+# 事务提交后提交请求才返回。评判和进入下一轮之前先 flush，保证本 worker 缓冲中的提交都已写入
+
+SUBMISSION_BUFFER = os.environ.get('SUBMISSION_BUFFER', 'false').lower() == 'true'
+SUBMISSION_BUFFER_TIMEOUT = float(os.environ.get('SUBMISSION_BUFFER_TIMEOUT', 10))
+
+def _write_submission_batch(items):
+    """在一个事务中写入一批提交（后台线程中执行）
+
+    Args:
+        items: [{'course_id', 'student_id', 'answer', 'answer_time'}]
+
+    Returns:
+        与 items 等长的结果列表：{'inserted', 'round_number'}，课程不存在时为 {'missing': True}，
+        学生已删除或请假时为 {'rejected': (提示, HTTP状态码)}
+    """
+    with app.app_context():
+        results = [None] * len(items)
+        by_course = {}
+        for index, item in enumerate(items):
+            by_course.setdefault(item['course_id'], []).append(index)
+        written = []
+        try:
+            # 学生状态在写入的事务中读取（名册缓存不含状态）
+            statuses = load_student_statuses({item['student_id'] for item in items})
+            for course_id, indexes in by_course.items():
+                # 轮次号在写入时从数据库读取（与单条提交的 INSERT ... SELECT 一致）
+                course = db.session.query(
+                    Course.id, Course.class_id, Course.current_round, Course.ended_at
+                ).filter(Course.id == course_id).with_for_update().first()
+                if not course:
+                    for index in indexes:
+                        results[index] = {'missing': True}
+                    continue
+                rows = {}
+                for index in indexes:
+                    student_id = items[index]['student_id']
+                    rejection = student_status_rejection(student_id in statuses, statuses.get(student_id))
+                    if rejection:
+                        results[index] = {'rejected': rejection}
+                        continue
+                    # 同一学生在缓冲区中出现多次时以最早的一条为准
+                    rows.setdefault(student_id, index)
+                inserted = insert_submissions_bulk(course.id, course.current_round, [
+                    {key: items[index][key] for key in ('student_id', 'answer', 'answer_time')}
+                    for index in rows.values()
+                ])
+                bump_course_scores(course.id, inserted, rounds_answered=1)
+                if inserted and course.ended_at:
+                    clear_report_snapshot(db.session.get(Course, course.id))
+                    bump_course_version(course.id)
+                indexes = [index for index in indexes if results[index] is None]
+                for index in indexes:
+                    student_id = items[index]['student_id']
+                    results[index] = {
+                        'inserted': student_id in inserted and rows[student_id] == index,
+                        'round_number': course.current_round
+                    }
+                written.append((course, indexes, bool(inserted)))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        for course, indexes, changed in written:
+            if changed:
+                invalidate_classroom_snapshot(course.class_id)
+        return results
+
+submission_buffer = GroupCommitBuffer(
+    _write_submission_batch,
+    max_rows=int(os.environ.get('SUBMISSION_BUFFER_ROWS', 50)),
+    max_delay_ms=float(os.environ.get('SUBMISSION_BUFFER_DELAY_MS', 5)),
+    name='submission_buffer'
+)
+
+# ==================== 性能分析 ====================
+# 统计每个请求的SQL查询次数、数据库耗时、最慢语句和N+1查询，结果写入结构化日志并可在 /debug/perf 查看。
+# 本地 SQLite 默认开启；PostgreSQL（线上）默认关闭，设置 PERF_PROFILER=true 开启，
+# 并且必须设置 PERF_DEBUG_TOKEN 才能访问 /debug/perf（页面包含SQL语句和请求路径）
+
+perf_profiler = QueryProfiler(
+    slow_request_ms=float(os.environ.get('PERF_SLOW_MS', 500)),
+    n_plus_one_threshold=int(os.environ.get('PERF_N_PLUS_ONE', 5))
+)
+if os.environ.get('PERF_PROFILER', 'true' if database_url.startswith('sqlite') else 'false').lower() == 'true':
+    with app.app_context():
+        perf_profiler.init_app(app, db.engine, log_level=os.environ.get('PERF_LOG_LEVEL', 'INFO'))
+
+def _perf_access_allowed():
+    """/debug/perf 需要提供与 PERF_DEBUG_TOKEN 一致的 token 参数；没有设置 token 时只有本地 SQLite 可以访问"""
+    import hmac
+    token = os.environ.get('PERF_DEBUG_TOKEN')
+    if not token:
+        return database_url.startswith('sqlite')
+    return hmac.compare_digest(request.args.get('token', ''), token)
+
+# ==================== 响应压缩 ====================
+# 按 Accept-Encoding 压缩超过 COMPRESSION_MIN_SIZE 字节的 HTML/JSON 响应（安装 brotli 包时优先 br），
+# static/ 下的文件启动时压缩一次
+
+response_compressor = ResponseCompressor(
+    min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+    gzip_level=int(os.environ.get('COMPRESSION_LEVEL', 6)),
+    brotli_quality=int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4)),
+    use_brotli=os.environ.get('COMPRESSION_BROTLI', 'true').lower() == 'true'
+)
+if os.environ.get('COMPRESSION', 'true').lower() == 'true':
+    response_compressor.init_app(app)
+
 # ==================== 初始化数据库 ====================
 
+# 数据库结构由 migrations.py 中的版本化迁移管理，worker 启动时只检查一次版本号：
+# 部署时执行 flask --app app migrate-db；本地 SQLite 默认自动执行迁移
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', 'true' if database_url.startswith('sqlite') else 'false').lower() == 'true'
+
 def init_database():
-    """初始化数据库表"""
+    """检查数据库结构版本并创建默认班级
+
+    ID存储方式与 UUID_STORAGE 不一致时抛出 StorageMismatch，worker 拒绝启动（列类型不一致时无法正确读写ID）
+    """
     try:
         with app.app_context():
-            db.create_all()
-            print("✅ 数据库表创建成功")
+            id_storage.check_storage(db.engine, db.metadata, UUID_STORAGE)
             
-            # 尝试添加新字段到已存在的 student_submissions 表
-            try:
-                from sqlalchemy import text
-                # 检查字段是否存在并添加
-                conn = None
-                try:
-                    conn = db.engine.connect()
-                    # 添加 guess_count
-                    conn.execute(text("ALTER TABLE student_submissions ADD COLUMN IF NOT EXISTS guess_count INTEGER DEFAULT 0"))
-                    # 添加 copy_count
-                    conn.execute(text("ALTER TABLE student_submissions ADD COLUMN IF NOT EXISTS copy_count INTEGER DEFAULT 0"))
-                    # 添加 noisy_count
-                    conn.execute(text("ALTER TABLE student_submissions ADD COLUMN IF NOT EXISTS noisy_count INTEGER DEFAULT 0"))
-                    # 添加 distracted_count
-                    conn.execute(text("ALTER TABLE student_submissions ADD COLUMN IF NOT EXISTS distracted_count INTEGER DEFAULT 0"))
-                    # 添加 penalty_score
-                    conn.execute(text("ALTER TABLE student_submissions ADD COLUMN IF NOT EXISTS penalty_score INTEGER DEFAULT 0"))
-                    
-                    # 创建数据库索引以提高查询性能（关键优化！）
-                    # 检查是否是PostgreSQL数据库
-                    if 'postgresql' in str(db.engine.url):
-                        try:
-                            # 为 student_submissions 表创建索引
-                            conn.execute(text("""
-                                CREATE INDEX IF NOT EXISTS idx_student_submissions_student_course 
-                                ON student_submissions(student_id, course_id)
-                            """))
-                            conn.execute(text("""
-                                CREATE INDEX IF NOT EXISTS idx_student_submissions_course 
-                                ON student_submissions(course_id)
-                            """))
-                            
-                            # 为 course_rounds 表创建索引
-                            conn.execute(text("""
-                                CREATE INDEX IF NOT EXISTS idx_course_rounds_course_round 
-                                ON course_rounds(course_id, round_number)
-                            """))
-                            
-                            # 为 course_attendances 表创建索引
-                            conn.execute(text("""
-                                CREATE INDEX IF NOT EXISTS idx_course_attendances_student_course 
-                                ON course_attendances(student_id, course_id)
-                            """))
-                            
-                            # 为 students 表创建索引
-                            conn.execute(text("""
-                                CREATE INDEX IF NOT EXISTS idx_students_class_id 
-                                ON students(class_id)
-                            """))
-                            
-                            # 为 courses 表创建索引
-                            conn.execute(text("""
-                                CREATE INDEX IF NOT EXISTS idx_courses_class_id 
-                                ON courses(class_id)
-                            """))
-                            
-                            print("✅ 数据库索引创建成功（性能优化）")
-                        except Exception as idx_error:
-                            print(f"⚠️ 创建索引时出错（可能已经存在）: {str(idx_error)}")
-                    
-                    conn.commit()
-                    print("✅ 数据库字段添加成功")
-                finally:
-                    # 安全关闭连接，捕获关闭时的错误
-                    if conn:
-                        try:
-                            conn.close()
-                        except (PG8000InterfaceError, BrokenPipeError, OSError) as close_error:
-                            # 忽略关闭连接时的网络错误
-                            error_str = str(close_error).lower()
-                            if 'broken pipe' not in error_str and 'network' not in error_str:
-                                print(f"⚠️ 关闭连接时出现错误（已安全处理）: {type(close_error).__name__}")
-            except Exception as e:
-                print(f"⚠️ 添加字段时出错（可能已经存在）: {str(e)}")
+            version = migrations.current_version(db.engine)
+            if version < migrations.latest_version():
+                if not AUTO_MIGRATE:
+                    print(f"⚠️ 数据库结构版本为 {version}，最新版本为 {migrations.latest_version()}，"
+                          f"请执行: flask --app app migrate-db")
+                    return
+                applied = migrations.migrate(db.engine, db.metadata)
+                print(f"✅ 数据库迁移完成（执行版本 {applied}）")
             
             # 如果没有默认班级，创建一个
             default_class = Class.query.filter_by(name="默认班级").first()
@@ -360,12 +1667,50 @@ def init_database():
                 db.session.add(default_class)
                 db.session.commit()
                 print("✅ 创建默认班级")
+    except id_storage.StorageMismatch as e:
+        print(f"❌ {str(e)}")
+        raise
     except Exception as e:
         print(f"❌ 初始化数据库失败: {str(e)}")
         traceback.print_exc()
 
 init_database()
 
+@app.cli.command('migrate-db')
+@click.option('--target', type=int, default=None, help='只迁移到指定版本（默认迁移到最新版本）')
+def migrate_db_command(target):
+    """执行未执行的数据库迁移"""
+    applied = migrations.migrate(db.engine, db.metadata, target=target)
+    if applied:
+        print(f"✅ 已执行迁移: {applied}")
+    else:
+        print("✅ 数据库结构已是最新")
+    print(f"📊 当前版本: {migrations.current_version(db.engine)}")
+
+@app.cli.command('schema-status')
+def schema_status_command():
+    """查看数据库结构版本和未执行的迁移"""
+    for item in migrations.applied_migrations(db.engine):
+        print(f"✅ {item['version']}: {item['description']}（{item['applied_at']}）")
+    for version, description, _ in migrations.pending_migrations(db.engine):
+        print(f"⏳ {version}: {description}")
+    print(f"📊 当前版本: {migrations.current_version(db.engine)}，最新版本: {migrations.latest_version()}")
+
+@app.cli.command('convert-ids')
+@click.option('--to', 'target', type=click.Choice(id_storage.STORAGES), default='native', help='目标存储方式')
+@click.option('--batch-size', type=int, default=1000, help='每批转换的行数')
+def convert_ids_command(target, batch_size):
+    """分批转换所有ID列的存储方式（完成后设置 UUID_STORAGE 并重启应用）"""
+    if migrations.current_version(db.engine) < migrations.latest_version():
+        print("⚠️ 请先执行: flask --app app migrate-db")
+        return
+    converted = id_storage.convert_storage(db.engine, db.metadata, target, batch_size=batch_size)
+    if converted:
+        print(f"✅ 已转换: {', '.join(converted)}")
+    else:
+        print(f"✅ 所有ID列已是 {target} 存储")
+    print(f"📊 请设置 UUID_STORAGE={target} 后重启应用")
+
 # ==================== 请求后处理钩子 ====================
 # 安全关闭数据库连接，避免BrokenPipe错误
 @app.teardown_appcontext
@@ -386,67 +1731,45 @@ def shutdown_session(exception=None):
 def index():
     """首页"""
     try:
-        # 获取所有活跃班级
-        classes = Class.query.filter_by(is_active=True).order_by(Class.created_date.desc()).all()
-        
-        # 获取所有非活跃班级（历史班级）
-        inactive_classes = Class.query.filter_by(is_active=False).order_by(Class.ended_date.desc()).all()
-        
-        # 获取所有活跃竞赛目标
-        goals = CompetitionGoal.query.filter_by(is_active=True).order_by(CompetitionGoal.created_date.desc()).all()
-        
-        # 获取所有非活跃竞赛目标
-        inactive_goals = CompetitionGoal.query.filter_by(is_active=False).order_by(CompetitionGoal.created_date.desc()).all()
-        
-        # 计算总学生数量（仅统计未结束/活跃班级中的学生）
-        total_students = db.session.query(Student).join(Class, Student.class_id == Class.id).filter(Class.is_active == True).count()
-        
-        # 为每个班级添加统计数据（优化：使用批量查询避免N+1问题）
-        class_ids = [c.id for c in classes + inactive_classes]
-        if class_ids:
-            # 批量查询学生数量
-            from sqlalchemy import func
-            student_counts = db.session.query(
-                Student.class_id,
-                func.count(Student.id).label('count')
-            ).filter(Student.class_id.in_(class_ids)).group_by(Student.class_id).all()
-            student_counts_dict = {cid: count for cid, count in student_counts}
-            
-            # 批量查询课程数量
-            course_counts = db.session.query(
-                Course.class_id,
-                func.count(Course.id).label('count')
-            ).filter(Course.class_id.in_(class_ids)).group_by(Course.class_id).all()
-            course_counts_dict = {cid: count for cid, count in course_counts}
-        else:
-            student_counts_dict = {}
-            course_counts_dict = {}
-        
-        # 为每个班级添加统计数据
-        for class_obj in classes:
-            class_obj.student_count = student_counts_dict.get(class_obj.id, 0)
-            class_obj.course_count = course_counts_dict.get(class_obj.id, 0)
-        
-        # 为历史班级添加统计数据
-        for class_obj in inactive_classes:
-            class_obj.student_count = student_counts_dict.get(class_obj.id, 0)
-            class_obj.course_count = course_counts_dict.get(class_obj.id, 0)
-        
-        # 构建classes_json用于前端JavaScript
-        classes_json = {class_obj.id: {'id': class_obj.id, 'name': class_obj.name} for class_obj in classes}
-        
-        return render_template('homepage.html',
-                             classes=classes,
-                             inactive_classes=inactive_classes,
-                             competition_goals=goals,
-                             inactive_competition_goals=inactive_goals,
-                             total_students=total_students,
-                             classes_json=classes_json)
+        return render_cached(('homepage', homepage_version()), 'homepage.html', _homepage_context)
     except Exception as e:
         print(f"❌ 加载首页失败: {str(e)}")
         traceback.print_exc()
         return f"<h1>启动成功！</h1><p>但加载主页时出错: {str(e)}</p>", 500
 
+def _homepage_context():
+    """首页模板参数"""
+    # 获取所有活跃班级
+    classes = Class.query.filter_by(is_active=True).order_by(Class.created_date.desc()).all()
+
+    # 历史班级第一页（按结束时间降序），之后的页面滚动到底部时通过 /api/history_classes 加载
+    inactive_classes, history_next_cursor = history_classes_page()
+
+    # 获取所有活跃竞赛目标
+    goals = CompetitionGoal.query.filter_by(is_active=True).order_by(CompetitionGoal.created_date.desc()).all()
+
+    # 获取所有非活跃竞赛目标
+    inactive_goals = CompetitionGoal.query.filter_by(is_active=False).order_by(CompetitionGoal.created_date.desc()).all()
+
+    # 计算总学生数量（仅统计未结束/活跃班级中的学生）
+    total_students = db.session.query(Student).join(Class, Student.class_id == Class.id).filter(Class.is_active == True).count()
+
+    # 为每个班级添加统计数据（批量查询避免N+1问题）
+    attach_class_counts(classes + inactive_classes)
+
+    # 构建classes_json用于前端JavaScript
+    classes_json = {class_obj.id: {'id': class_obj.id, 'name': class_obj.name} for class_obj in classes}
+
+    return {
+        'classes': classes,
+        'inactive_classes': inactive_classes,
+        'competition_goals': goals,
+        'inactive_competition_goals': inactive_goals,
+        'total_students': total_students,
+        'classes_json': classes_json,
+        'history_next_cursor': history_next_cursor
+    }
+
 # 课堂路由
 @app.route('/class/<class_id>')
 @db_retry(max_retries=3, delay=1)
@@ -466,183 +1789,98 @@ def class_detail(class_id):
 def class_management(class_id):
     """班级管理页面 - 显示学生列表、课程列表等"""
     try:
-        class_obj = Class.query.filter_by(id=class_id).first()
-        if not class_obj:
+        version = class_page_version(class_id)
+        if version is None:
             return jsonify({'error': '班级不存在'}), 404
-        
-        # 获取学生列表（班级管理页面显示所有学生，包括请假学生，方便恢复）
-        # 按状态分组：活跃学生在前面，请假学生在后面
-        all_students = Student.query.filter_by(class_id=class_id).all()
-        active_students = [s for s in all_students if s.status == 'active']
-        absent_students = [s for s in all_students if s.status == 'absent']
-        students = active_students + absent_students  # 活跃学生在前面
-        
-        # 为学生添加统计数据（优化：使用SQL聚合查询，性能提升10-100倍）
-        all_courses = Course.query.filter_by(class_id=class_id).all()
-        course_ids = [c.id for c in all_courses]
-        student_ids = [s.id for s in students]
-        
-        # 使用SQL聚合查询计算统计数据（比Python循环快得多）
-        if course_ids and student_ids:
-            try:
-                from sqlalchemy import func, case
-                
-                # 批量获取轮次信息（用于计算分数）
-                all_rounds = CourseRound.query.filter(
-                    CourseRound.course_id.in_(course_ids)
-                ).all()
-                rounds_dict = {(r.course_id, r.round_number): r.question_score for r in all_rounds}
-                
-                # 使用SQL聚合查询计算每个学生的课程数（简单快速）
-                courses_count_query = db.session.query(
-                    StudentSubmission.student_id,
-                    func.count(func.distinct(StudentSubmission.course_id)).label('courses_count')
-                ).filter(
-                    StudentSubmission.student_id.in_(student_ids),
-                    StudentSubmission.course_id.in_(course_ids)
-                ).group_by(StudentSubmission.student_id)
-                
-                courses_count_results = {row.student_id: row.courses_count for row in courses_count_query.all()}
-                
-                # 批量获取所有正确答案的提交记录（用于计算分数）
-                # 只查询 is_correct=True 的记录，减少数据量
-                correct_submissions = StudentSubmission.query.filter(
-                    StudentSubmission.student_id.in_(student_ids),
-                    StudentSubmission.course_id.in_(course_ids),
-                    StudentSubmission.is_correct == True
-                ).all()
-                
-                # 计算每个学生的总分数（使用内存中的字典查找，非常快）
-                score_results = {}
-                for sub in correct_submissions:
-                    student_id = sub.student_id
-                    round_score = rounds_dict.get((sub.course_id, sub.round_number), 1)
-                    if student_id not in score_results:
-                        score_results[student_id] = 0
-                    score_results[student_id] += round_score
-                
-                # 查询缺席记录
-                absences_query = db.session.query(
-                    CourseAttendance.student_id,
-                    func.count(CourseAttendance.id).label('absences_count')
-                ).filter(
-                    CourseAttendance.student_id.in_(student_ids),
-                    CourseAttendance.course_id.in_(course_ids),
-                    CourseAttendance.is_absent == True
-                ).group_by(CourseAttendance.student_id)
-                
-                absences_results = {row.student_id: row.absences_count for row in absences_query.all()}
-                
-            except Exception as e:
-                print(f"⚠️ SQL聚合查询时出错，使用备用方法: {str(e)}")
-                # 如果SQL聚合查询失败，使用简单的默认值
-                score_results = {}
-                absences_results = {}
-        else:
-            score_results = {}
-            absences_results = {}
-        
-        # 为学生对象添加统计数据
-        for student in students:
-            student.total_score = score_results.get(student.id, 0)
-            student.courses_count = courses_count_results.get(student.id, 0)
-            student.absences_count = absences_results.get(student.id, 0)
-        
-        # 获取课程列表（按时间降序，最新的在前）
-        # 如果有结束时间，按结束时间排序；否则按创建时间排序
-        from sqlalchemy import case
-        courses = Course.query.filter_by(class_id=class_id).order_by(
-            case(
-                (Course.ended_at.isnot(None), Course.ended_at),
-                else_=Course.created_at
-            ).desc(),
-            Course.created_at.desc()  # 作为次要排序条件
-        ).all()
-        
-        # 为class_obj添加排序后的课程列表（转换为字典格式供模板使用）
-        courses_data = []
-        seen_ids = set()  # 用于去重：基于课程ID，确保每个课程只出现一次
-        
-        for course in courses:
-            # 跳过重复的课程ID（理论上不应该有，但为了安全）
-            if course.id in seen_ids:
-                continue
-            seen_ids.add(course.id)
-            
-            # 确定显示时间：有结束时间显示结束时间，否则显示创建时间
-            display_time = course.ended_at if course.ended_at else course.created_at
-            
-            # 如果课程名称为空或只包含空白字符，使用创建时间作为默认名称
-            if not course.name or not course.name.strip():
-                if display_time:
-                    course_name = f"课堂 {display_time.strftime('%Y-%m-%d %H:%M:%S')}"
-                else:
-                    course_name = "未命名课程"
-            else:
-                course_name = course.name.strip()
-            
-            courses_data.append({
-                'id': course.id,
-                'name': course_name,
-                'created_at': course.created_at,
-                'created_date': display_time.strftime('%Y-%m-%d %H:%M:%S') if display_time else '',
-                'current_round': course.current_round,
-                'is_active': course.is_active
-            })
-        
-        # 竞赛目标信息
-        goal = None
-        goal_progress = None
-        if class_obj.competition_goal_id:
-            g = CompetitionGoal.query.filter_by(id=class_obj.competition_goal_id).first()
-            if g:
-                goal = {
-                    'id': g.id,
-                    'title': g.title,
-                    'description': g.description or '',
-                    'goal_date': g.goal_date.strftime('%Y-%m-%d') if g.goal_date else None
-                }
-                # 进度（剩余天/周/估算课次）
-                from datetime import date
-                if g.goal_date:
-                    dleft = max((g.goal_date - date.today()).days, 0)
-                    wleft = dleft // 7
-                    # 每7天一节课的估算课次
-                    lessons_left = wleft
-                    goal_progress = {'days_left': dleft, 'weeks_left': wleft, 'lessons_left': lessons_left}
-
-        # 将排序后的课程数据添加到class_obj（创建一个简单的对象包装器）
-        class_data_dict = {
-            'id': class_obj.id,
-            'name': class_obj.name,
-            'description': class_obj.description,
-            'created_date': class_obj.created_date.strftime('%Y-%m-%d') if class_obj.created_date else '',
-            'courses': courses_data  # 已排序的课程列表
-        }
-        
-        # 排行榜：仅活跃学生，按总分降序；请假学生不显示
-        active_for_race = [s for s in students if getattr(s, 'status', 'active') != 'absent']
-        race_students = sorted(
-            active_for_race,
-            key=lambda s: getattr(s, 'total_score', 0) or 0,
-            reverse=True
-        )
-        max_score = max((getattr(s, 'total_score', 0) or 0) for s in active_for_race) if active_for_race else 0
-        
-        return render_template('class_detail.html', 
-                             class_data=class_data_dict, 
-                             class_obj=class_obj,
-                             class_id=class_id,
-                             students=students,
-                             courses=courses,
-                             goal=goal,
-                             goal_progress=goal_progress,
-                             race_students=race_students,
-                             max_score=max_score)
+        return render_cached(('class_detail', class_id, version), 'class_detail.html',
+                             lambda: _class_page_context(class_id))
     except Exception as e:
         print(f"❌ 加载班级管理页面失败: {str(e)}")
         return jsonify({'error': f'加载班级管理页面失败: {str(e)}'}), 500
 
+def _class_page_context(class_id):
+    """班级管理页面模板参数"""
+    class_obj = db.session.get(Class, class_id)
+
+    # 获取学生列表（班级管理页面显示所有学生，包括请假学生，方便恢复）
+    # 按状态分组：活跃学生在前面，请假学生在后面
+    all_students = Student.query.filter_by(class_id=class_id).all()
+    active_students = [s for s in all_students if s.status == 'active']
+    absent_students = [s for s in all_students if s.status == 'absent']
+    students = active_students + absent_students  # 活跃学生在前面
+
+    # 为学生添加统计数据：总分、参与课程数、缺勤次数由一次分组查询得到（与班级历史长短无关）
+    try:
+        student_totals = aggregate_class_student_totals(class_id)
+    except Exception as e:
+        print(f"⚠️ SQL聚合查询时出错，使用备用方法: {str(e)}")
+        # 如果SQL聚合查询失败，使用简单的默认值
+        db.session.rollback()
+        student_totals = {}
+
+    # 为学生对象添加统计数据
+    for student in students:
+        student.total_score, student.courses_count, student.absences_count = student_totals.get(student.id, (0, 0, 0))
+
+    # 课程列表第一页（按时间降序，最新的在前；有结束时间按结束时间，否则按创建时间），
+    # 之后的页面滚动到底部时通过 /api/class_courses/<class_id> 加载
+    courses, courses_next_cursor = class_courses_page(class_id)
+    courses_data = [course_list_item(course) for course in courses]
+    course_count = db.session.query(Course.id).filter_by(class_id=class_id).count()
+
+    # 竞赛目标信息
+    goal = None
+    goal_progress = None
+    if class_obj.competition_goal_id:
+        g = CompetitionGoal.query.filter_by(id=class_obj.competition_goal_id).first()
+        if g:
+            goal = {
+                'id': g.id,
+                'title': g.title,
+                'description': g.description or '',
+                'goal_date': g.goal_date.strftime('%Y-%m-%d') if g.goal_date else None
+            }
+            # 进度（剩余天/周/估算课次）
+            from datetime import date
+            if g.goal_date:
+                dleft = max((g.goal_date - date.today()).days, 0)
+                wleft = dleft // 7
+                # 每7天一节课的估算课次
+                lessons_left = wleft
+                goal_progress = {'days_left': dleft, 'weeks_left': wleft, 'lessons_left': lessons_left}
+
+    # 将排序后的课程数据添加到class_obj（创建一个简单的对象包装器）
+    class_data_dict = {
+        'id': class_obj.id,
+        'name': class_obj.name,
+        'description': class_obj.description,
+        'created_date': class_obj.created_date.strftime('%Y-%m-%d') if class_obj.created_date else '',
+        'courses': courses_data,  # 已排序的课程列表（第一页）
+        'course_count': course_count,
+        'courses_next_cursor': courses_next_cursor
+    }
+
+    # 排行榜：仅活跃学生，按总分降序；请假学生不显示
+    active_for_race = [s for s in students if getattr(s, 'status', 'active') != 'absent']
+    race_students = sorted(
+        active_for_race,
+        key=lambda s: getattr(s, 'total_score', 0) or 0,
+        reverse=True
+    )
+    max_score = max((getattr(s, 'total_score', 0) or 0) for s in active_for_race) if active_for_race else 0
+
+    return {
+        'class_data': class_data_dict,
+        'class_obj': class_obj,
+        'class_id': class_id,
+        'students': students,
+        'courses': courses,
+        'goal': goal,
+        'goal_progress': goal_progress,
+        'race_students': race_students,
+        'max_score': max_score
+    }
+
 @app.route('/course/<course_id>')
 def course_page(course_id):
     """课程答题页面"""
@@ -680,6 +1918,12 @@ def reports():
 def course_reports(course_id):
     """特定课程的报告页面"""
     try:
+        # 已结束课程：版本未变化时直接返回 304
+        validators = course_report_validators(course_id)
+        cached = not_modified_response(validators)
+        if cached:
+            return cached
+
         # 获取课程
         course = Course.query.filter_by(id=course_id).first()
         if not course:
@@ -748,12 +1992,12 @@ def course_reports(course_id):
             'students': students_data
         }
         
-        return render_template('reports.html',
+        return with_validators(render_template('reports.html',
                              students=students_data,
                              classroom_data=classroom_data,
                              course_id=course_id,
                              course=course,
-                             class_obj=class_obj)
+                             class_obj=class_obj), validators)
     except Exception as e:
         print(f"❌ 加载课程报告页面失败: {str(e)}")
         traceback.print_exc()
@@ -762,33 +2006,8 @@ def course_reports(course_id):
 # 学生报告页面
 @app.route('/student_report/<student_id>')
 def student_report(student_id):
-    """学生报告页面"""
-    try:
-        student = Student.query.filter_by(id=student_id).first()
-        if not student:
-            return jsonify({'error': '学生不存在'}), 404
-        
-        # 检查学生状态：请假学生无法查看报告
-        if student.status == 'absent':
-            return jsonify({'error': '请假状态的学生无法查看报告'}), 403
-        
-        # 获取学生的所有提交记录
-        submissions = StudentSubmission.query.filter_by(student_id=student_id).order_by(StudentSubmission.created_at.desc()).all()
-        
-        # 计算统计数据
-        total_score = sum(sub.answer_time for sub in submissions if sub.is_correct)
-        total_rounds = len(set((sub.course_id, sub.round_number) for sub in submissions))
-        correct_rounds = len(set((sub.course_id, sub.round_number) for sub in submissions if sub.is_correct))
-        
-        return render_template('student_report.html',
-                             student=student,
-                             submissions=submissions,
-                             total_score=total_score,
-                             total_rounds=total_rounds,
-                             correct_rounds=correct_rounds)
-    except Exception as e:
-        print(f"❌ 加载学生报告失败: {str(e)}")
-        return jsonify({'error': f'加载学生报告失败: {str(e)}'}), 500
+    """学生报告页面 - 重定向到学生报告中心（提交记录在报告中心分页加载）"""
+    return redirect(f'/student_report_center/{student_id}')
 
 # 兼容旧链接：/generate_student_report/<student_id>?course_id=...
 @app.route('/generate_student_report/<student_id>')
@@ -796,6 +2015,19 @@ def generate_student_report(student_id):
     """生成（查看）学生在某课程中的报告，兼容旧URL。"""
     try:
         course_id = request.args.get('course_id')
+
+        # 移动端/微信优先渲染竖屏模板
+        ua = (request.headers.get('User-Agent') or '').lower()
+        prefer_mobile = any(k in ua for k in ['micromessenger', 'iphone', 'android', 'mobile'])
+
+        # 已结束课程的报告：版本未变化时直接返回 304（页面包含当天日期和距离竞赛天数）
+        validators = course_report_validators(
+            course_id, student_id, variant=(prefer_mobile,), daily=True
+        ) if course_id else None
+        cached = not_modified_response(validators, vary='User-Agent')
+        if cached:
+            return cached
+
         student = Student.query.filter_by(id=student_id).first()
         if not student:
             return jsonify({'error': '学生不存在'}), 404
@@ -854,197 +2086,30 @@ def generate_student_report(student_id):
 
         participated_rounds = 0
         student_submissions_view = []
+        rank = None
+        percentile = None
         if course:
-            rounds = CourseRound.query.filter_by(course_id=course.id).all()
-            all_rounds_count = len(rounds)  # 所有轮次数（包括可能作废的）
-            # 构造学生每轮的提交视图，按round对齐
-            # 速度等级计算函数（每题）
-            def get_speed_level_per_question(t_student: float, t_class_avg: float) -> str:
-                try:
-                    if not t_class_avg or t_class_avg <= 0:
-                        return ''
-                    # 最低时间保护，防止误触
-                    if t_student is None:
-                        t_student = 0
-                    if t_student < 1.5:
-                        t_student = 1.5
-                    # 大题：全班平均时间很长时，使用绝对区间
-                    if t_class_avg > 25:
-                        if t_student <= 0.8 * t_class_avg:
-                            return '快'
-                        elif t_student <= 1.2 * t_class_avg:
-                            return '正常'
-                        else:
-                            return '稍慢'
-                    # 常规题：用比例判定
-                    ratio = t_student / t_class_avg
-                    if ratio <= 0.6:
-                        return '很快'
-                    elif ratio <= 1.0:
-                        return '快'
-                    elif ratio <= 1.4:
-                        return '稍慢'
-                    else:
-                        return '很慢'
-                except Exception:
-                    return ''
-
-            # 获取活跃学生ID集合（用于过滤请假学生）
-            active_students = Student.query.filter_by(class_id=course.class_id, status='active').all()
-            active_student_ids = {s.id for s in active_students}
-            active_count = len(active_students) if active_students else 1
-            
-            # 全班提交（需在使用前定义，避免未绑定错误）
-            # 只包含活跃学生的提交记录，排除请假学生，确保请假学生不参与数据计算
-            all_class_submissions = StudentSubmission.query.filter_by(course_id=course.id).all()
-            class_submissions = [s for s in all_class_submissions if s.student_id in active_student_ids]
-            
-            # 先计算作废轮次（需要先计算，以便后续过滤）
-            invalid_rounds = set()  # 作废轮次集合
-            round_nums = sorted(set(r.round_number for r in rounds))
+            # 获取活跃学生ID集合（用于过滤请假学生，确保请假学生不参与数据计算）
+            active_student_ids = [row.id for row in db.session.query(Student.id).filter_by(class_id=course.class_id, status='active').all()]
+            # 班级统计：已结束课程读取快照，否则按一次分组聚合查询计算
+            rounds, course_stats = get_course_report_analytics(course, active_student_ids)
+            # 合并该学生自己的数据
+            student_stats = report_analytics.build_student_analytics(course_stats, rounds, submissions)
             
-            # 预先计算哪些轮次是作废的
-            for rn in round_nums:
-                rs = [s for s in class_submissions if s.round_number==rn]
-                students_who_participated = set(s.student_id for s in rs)
-                students_who_correct = set(s.student_id for s in rs if s.is_correct)
-                correct_count = len(students_who_correct)
-                acc = (correct_count/active_count)*100 if active_count>0 else 0
-                participants = len(students_who_participated)
-                part = (participants/active_count)*100 if active_count>0 else 0
-                if rs:
-                    times = [s.answer_time for s in rs if s.answer_time is not None]
-                    avg_t = round(statistics.mean(times),1) if times else 0
-                else:
-                    avg_t = 0
-                # 判定无效轮次
-                is_invalid_round = (part == 0 and acc == 0 and avg_t < 10)
-                if is_invalid_round:
-                    invalid_rounds.add(rn)
-                    print(f"⚠️ 轮次 {rn} 作废（参与率{part}%，正确率{acc}%，平均耗时{avg_t}秒）")
-
-            for r in rounds:
-                # 跳过作废轮次，不显示在报告中
-                if r.round_number in invalid_rounds:
-                    continue
-                    
-                rs = next((s for s in submissions if s.round_number == r.round_number), None)
-                # 识别该轮违规类型（优先级：猜题>抄题>打闹>走神）
-                violation_type = None
-                if rs:
-                    if (rs.guess_count or 0) > 0:
-                        violation_type = '猜题'
-                    elif (rs.copy_count or 0) > 0:
-                        violation_type = '抄题'
-                    elif (rs.noisy_count or 0) > 0:
-                        violation_type = '打闹'
-                    elif (rs.distracted_count or 0) > 0:
-                        violation_type = '走神'
-
-                if rs and (rs.answer is not None and str(rs.answer).strip() != ''):
-                    participated_rounds += 1
-                    is_correct = bool(rs.is_correct)
-                    q_score = r.question_score if r and r.question_score else 1
-                    # 本题班级平均时间（只计算有作答的同学）
-                    round_class_times = [s.answer_time for s in class_submissions if s.round_number == r.round_number and s.answer_time is not None and (s.answer is not None and str(s.answer).strip() != '')]
-                    t_class_avg = statistics.mean(round_class_times) if round_class_times else 0
-                    t_student = rs.answer_time or 0
-                    speed_level = get_speed_level_per_question(t_student, t_class_avg)
-                    student_submissions_view.append({
-                        'round': r.round_number,
-                        'answer': rs.answer,
-                        'is_correct': is_correct,
-                        'question_score': q_score,
-                        'answer_time': rs.answer_time or 0,
-                        'violation_type': violation_type,
-                        'speed_level': speed_level
-                    })
-                else:
-                    student_submissions_view.append({
-                        'round': r.round_number,
-                        'answer': '',
-                        'is_correct': False,
-                        'question_score': r.question_score if r and r.question_score else 1,
-                        'answer_time': 0,
-                        'violation_type': violation_type,
-                        'speed_level': ''
-                    })
-            # 只计算有效轮次的总分
-            total_possible_score = sum((r.question_score or 1) for r in rounds if r.round_number not in invalid_rounds)
-
-            # 学生总分（只计算有效轮次）
-            for sub in submissions:
-                if sub.is_correct and sub.round_number not in invalid_rounds:
-                    r = next((rr for rr in rounds if rr.round_number == sub.round_number), None)
-                    student_total_score += (r.question_score if r and r.question_score else 1)
-
-            # 班级平均准确率/参与率/分数
-            # 按学生聚合
-            from collections import defaultdict
-            # 改为按轮次统计（去重），避免多次提交同一轮次时重复计数
-            student_correct_rounds = defaultdict(set)
-            student_total_rounds = defaultdict(set)
-            student_scores = defaultdict(int)
-
-            for s in class_submissions:
-                # 跳过作废轮次，不参与统计
-                if s.round_number in invalid_rounds:
-                    continue
-                # 使用round_number作为集合，自动去重
-                student_total_rounds[s.student_id].add(s.round_number)
-                if s.is_correct:
-                    student_correct_rounds[s.student_id].add(s.round_number)
-                    r = next((rr for rr in rounds if rr.round_number == s.round_number), None)
-                    student_scores[s.student_id] += (r.question_score if r and r.question_score else 1)
-
-            # 平均准确率 - 按轮次计算
-            if student_total_rounds:
-                acc_list = []
-                for sid in student_total_rounds.keys():
-                    total_r = len(student_total_rounds[sid])
-                    correct_r = len(student_correct_rounds[sid])
-                    acc_list.append((correct_r/total_r)*100 if total_r>0 else 0)
-                class_avg_accuracy = round(sum(acc_list)/len(acc_list)) if acc_list else 0
-                class_avg_score = round(sum(student_scores.values())/len(student_scores)) if student_scores else 0
-
-            # 参与率（参与过任意回合的学生比）
-            participated = len(set(s.student_id for s in class_submissions))
-            class_avg_participation = round((participated/active_count)*100) if active_count>0 else 0
-
-            # 响应时间
-            st_times = [s.answer_time for s in submissions if s.answer_time is not None]
-            avg_response_time = round(statistics.mean(st_times),1) if st_times else 0
-            class_times = [s.answer_time for s in class_submissions if s.answer_time is not None]
-            class_avg_response_time = round(statistics.mean(class_times),1) if class_times else 0
-
-            # 按轮统计（只统计有效轮次）
-            valid_rounds_count = 0  # 有效轮次数（排除作废轮次）
-            for rn in round_nums:
-                # 跳过作废轮次
-                if rn in invalid_rounds:
-                    continue
-                    
-                rs = [s for s in class_submissions if s.round_number==rn]
-                # 按学生去重，统计有多少学生答对了这一轮
-                students_who_participated = set(s.student_id for s in rs)
-                students_who_correct = set(s.student_id for s in rs if s.is_correct)
-                # 准确率 = 答对的学生数 / 班级总学生数（未参与的学生算作错误）
-                correct_count = len(students_who_correct)
-                # active_count 是班级总活跃学生数，包括未参与的
-                acc = (correct_count/active_count)*100 if active_count>0 else 0
-                # 参与率 = 参与的学生数 / 班级总学生数
-                participants = len(students_who_participated)
-                part = (participants/active_count)*100 if active_count>0 else 0
-                # 平均答题时间（只计算参与的学生）
-                if rs:
-                    times = [s.answer_time for s in rs if s.answer_time is not None]
-                    avg_t = round(statistics.mean(times),1) if times else 0
-                else:
-                    avg_t = 0
-                
-                # 只统计有效轮次
-                class_round_stats.append({'round': rn,'accuracy': round(acc,1),'participation_rate': round(part,1),'avg_time': avg_t})
-                valid_rounds_count += 1
+            all_rounds_count = course_stats['all_rounds_count']  # 所有轮次数（包括可能作废的）
+            valid_rounds_count = course_stats['valid_rounds_count']  # 有效轮次数（排除作废轮次）
+            total_possible_score = course_stats['total_possible_score']
+            class_avg_accuracy = course_stats['class_avg_accuracy']
+            class_avg_score = course_stats['class_avg_score']
+            class_avg_participation = course_stats['class_avg_participation']
+            class_avg_response_time = course_stats['class_avg_response_time']
+            class_round_stats = course_stats['round_stats']
+            student_submissions_view = student_stats['student_submissions']
+            participated_rounds = student_stats['participated_rounds']
+            student_total_score = student_stats['student_total_score']
+            avg_response_time = student_stats['avg_response_time']
+            rank = student_stats['rank']
+            percentile = student_stats['percentile']
 
         # 参与率：参与轮次 / 有效轮次（排除作废轮次）（供评语使用）
         # 使用有效轮次数而不是总轮次数，排除作废的轮次
@@ -1067,17 +2132,7 @@ def generate_student_report(student_id):
             # 排名主评语（用班级得分排名或百分位）
             rank_text = ''
             if course:
-                # 计算排名 - 使用与student_report_center一致的逻辑
-                rank = None
-                percentile = None
-                try:
-                    # 统计比当前学生分数高的学生数
-                    higher_count = sum(1 for score in student_scores.values() if score > student_total_score)
-                    rank = higher_count + 1 if student_scores else None
-                    percentile = round(((rank - 1) / len(student_scores)) * 100, 1) if rank and len(student_scores) else None
-                except Exception:
-                    rank = None
-
+                # 排名/百分位由报告分析模块计算（与student_report_center一致的逻辑）
                 if percentile is not None:
                     if percentile <= 5:
                         rank_text = '表现卓越，稳居榜首，持续保持！'
@@ -1140,10 +2195,6 @@ def generate_student_report(student_id):
 
         feedback_text = build_feedback()
 
-        # 移动端/微信优先渲染竖屏模板
-        ua = (request.headers.get('User-Agent') or '').lower()
-        prefer_mobile = any(k in ua for k in ['micromessenger', 'iphone', 'android', 'mobile'])
-
         template_name = 'student_report_mobile.html' if prefer_mobile else 'student_report.html'
 
         # 竞赛目标信息（供报告显示）
@@ -1164,7 +2215,7 @@ def generate_student_report(student_id):
                         # 每7天一节课估算
                         classes_before_competition = days_to_competition // 7
 
-        return render_template(template_name,
+        return with_validators(render_template(template_name,
                              student=student_view,
                              student_name=student.name,
                              current_date=datetime.now().strftime('%Y-%m-%d'),
@@ -1190,7 +2241,8 @@ def generate_student_report(student_id):
                                  competition_goal_name=competition_goal_name,
                                  competition_goal_date=competition_goal_date,
                                  days_to_competition=days_to_competition,
-                                 classes_before_competition=classes_before_competition)
+                                 classes_before_competition=classes_before_competition),
+                               validators, vary='User-Agent')
     except Exception as e:
         print(f"❌ 生成学生报告失败: {str(e)}")
         traceback.print_exc()
@@ -1201,6 +2253,12 @@ def generate_student_report(student_id):
 def student_report_center(student_id):
     """学生报告中心页面 - 移动端优化"""
     try:
+        # 班级的课程都已结束时：版本未变化直接返回 304（页面包含当天日期）
+        validators = class_report_validators(student_id, daily=True)
+        cached = not_modified_response(validators)
+        if cached:
+            return cached
+
         # 获取学生信息
         student = Student.query.filter_by(id=student_id).first()
         if not student:
@@ -1216,68 +2274,21 @@ def student_report_center(student_id):
         # 获取该学生班级的所有课程（按创建时间升序，最旧的在前，最新的在后，这样图表中最新在右侧）
         courses = Course.query.filter_by(class_id=student.class_id).order_by(Course.created_at.asc()).all()
         
+        # 批量读取所有课程的成绩与排名（查询次数与课程数、学生数无关）
+        history, total_students = load_student_course_history(student, [course.id for course in courses])
+        
         # 构建课程数据
         courses_data = []
         for course in courses:
-            # 获取该学生在该课程的所有提交记录
-            submissions = StudentSubmission.query.filter_by(
-                student_id=student.id,
-                course_id=course.id
-            ).all()
+            stats = history.get(course.id)
             
-            if submissions:
-                # 计算统计数据
-                # 实际参与的轮次数（去重）
-                total_rounds = len(set(sub.round_number for sub in submissions))
-                # 正确答题的轮次数（去重，只计算每个轮次至少答对一次）
-                correct_rounds = len(set(s.round_number for s in submissions if s.is_correct))
+            # 只显示该学生有提交记录的课程
+            if stats and stats['rounds_answered'] > 0:
                 # 计算准确率：正确轮次 / 总轮次数（未参与算作错误）
-                all_rounds = CourseRound.query.filter_by(course_id=course.id).count()
-                accuracy = (correct_rounds / all_rounds * 100) if all_rounds > 0 else 0
-                
-                # 计算总分
-                total_score = 0
-                for s in submissions:
-                    if s.is_correct:
-                        round_obj = CourseRound.query.filter_by(
-                            course_id=course.id,
-                            round_number=s.round_number
-                        ).first()
-                        if round_obj:
-                            total_score += round_obj.question_score
-                        else:
-                            total_score += 1
-                
+                all_rounds = stats['all_rounds']
+                accuracy = (stats['correct_rounds'] / all_rounds * 100) if all_rounds > 0 else 0
                 # 计算参与率（基于轮次数）
-                participation_rate = (total_rounds / all_rounds * 100) if all_rounds > 0 else 100
-                
-                # 计算排名
-                all_students = Student.query.filter_by(class_id=student.class_id, status='active').all()
-                student_scores = {}
-                for class_student in all_students:
-                    class_submissions = StudentSubmission.query.filter_by(
-                        student_id=class_student.id,
-                        course_id=course.id
-                    ).all()
-                    
-                    class_score = 0
-                    for s in class_submissions:
-                        if s.is_correct:
-                            round_obj = CourseRound.query.filter_by(
-                                course_id=course.id,
-                                round_number=s.round_number
-                            ).first()
-                            if round_obj:
-                                class_score += round_obj.question_score
-                            else:
-                                class_score += 1
-                    student_scores[class_student.id] = class_score
-                
-                # 计算排名 - 正确的方法是统计比当前学生分数高的学生数
-                # 如果有n个学生分数更高，当前学生排名就是n+1
-                # 例如：分数 [100, 90, 90, 80]，80分的学生排名是4
-                higher_count = sum(1 for score in student_scores.values() if score > total_score)
-                rank = higher_count + 1
+                participation_rate = (stats['rounds_answered'] / all_rounds * 100) if all_rounds > 0 else 100
                 
                 courses_data.append({
                     'course': course,
@@ -1285,9 +2296,9 @@ def student_report_center(student_id):
                     'course_name': course.name,
                     'participation_rate': round(participation_rate, 1),
                     'accuracy': round(accuracy, 1),
-                    'score': total_score,
-                    'rank': rank,
-                    'total_students': len(all_students)
+                    'score': stats['score'],
+                    'rank': stats['rank'],
+                    'total_students': total_students
                 })
         
         # 图表数据保持原顺序（从左到右是旧到新）
@@ -1295,14 +2306,14 @@ def student_report_center(student_id):
         # 列表数据反转，使最新的课程显示在顶部
         courses_data_for_list = list(reversed(courses_data))
         
-        return render_template(
+        return with_validators(render_template(
             'student_report_center.html',
             student=student,
             class_obj=class_obj,
             courses_data=courses_data_for_chart,  # 图表使用原顺序
             courses_data_list=courses_data_for_list,  # 列表使用反转顺序
             current_date=datetime.now().strftime('%Y年%m月%d日')
-        )
+        ), validators)
     except Exception as e:
         print(f"❌ 加载学生报告中心失败: {str(e)}")
         traceback.print_exc()
@@ -1347,6 +2358,7 @@ def end_class(class_id):
         
         class_obj.is_active = False
         class_obj.ended_date = datetime.utcnow()
+        bump_class_version(class_id)
         db.session.commit()
         
         print(f"✅ 班级已结束: {class_obj.name}")
@@ -1369,6 +2381,9 @@ def delete_class(class_id):
         
         db.session.delete(class_obj)
         db.session.commit()
+        invalidate_roster(class_id)
+        invalidate_course_context(class_id)
+        invalidate_classroom_snapshot(class_id)
         
         print(f"✅ 班级已删除: {class_obj.name}")
         return jsonify({'success': True})
@@ -1440,6 +2455,7 @@ def assign_goal_to_class():
             return jsonify({'success': False, 'message': '竞赛目标不存在'}), 404
 
         class_obj.competition_goal_id = goal.id
+        bump_class_version(class_id)
         db.session.commit()
         return jsonify({'success': True})
     except Exception as e:
@@ -1458,6 +2474,7 @@ def end_goal(goal_id):
             return jsonify({'success': False, 'message': '竞赛目标不存在'}), 404
         
         goal.is_active = False
+        bump_class_version(goal_id=goal.id)
         db.session.commit()
         
         print(f"✅ 竞赛目标已结束: {goal.title}")
@@ -1478,6 +2495,7 @@ def delete_competition_goal(goal_id):
         if not goal:
             return jsonify({'success': False, 'message': '竞赛目标不存在'}), 404
         
+        bump_class_version(goal_id=goal.id)
         db.session.delete(goal)
         db.session.commit()
         
@@ -1504,6 +2522,7 @@ def bind_goal():
             return jsonify({'success': False, 'message': '班级不存在'}), 404
         
         class_obj.competition_goal_id = goal_id
+        bump_class_version(class_id)
         db.session.commit()
         
         print(f"✅ 绑定竞赛目标到班级: {class_obj.name}")
@@ -1532,6 +2551,7 @@ def remove_goal_from_class():
         
         # 将竞赛目标ID设置为None，取消绑定
         class_obj.competition_goal_id = None
+        bump_class_version(class_id)
         db.session.commit()
         
         print(f"✅ 已取消班级 {class_obj.name} 的竞赛目标")
@@ -1563,7 +2583,10 @@ def add_student():
         
         student = Student(id=str(uuid.uuid4()), name=name, class_id=class_id, status='active')
         db.session.add(student)
+        bump_class_version(class_id)
         db.session.commit()
+        invalidate_roster(class_id)
+        invalidate_classroom_snapshot(class_id)
         
         # 返回学生数据，格式与get_classroom_data一致
         student_data = {
@@ -1598,7 +2621,10 @@ def student_absent(student_id):
             return jsonify({'success': False, 'message': '学生不存在'}), 404
         
         student.status = 'absent'
+        bump_class_version(student.class_id)
         db.session.commit()
+        invalidate_roster(student.class_id)
+        invalidate_classroom_snapshot(student.class_id)
         
         print(f"✅ 学生请假: {student.name}")
         return jsonify({'success': True, 'message': f'{student.name}已请假'})
@@ -1619,7 +2645,10 @@ def student_active(student_id):
             return jsonify({'success': False, 'message': '学生不存在'}), 404
         
         student.status = 'active'
+        bump_class_version(student.class_id)
         db.session.commit()
+        invalidate_roster(student.class_id)
+        invalidate_classroom_snapshot(student.class_id)
         
         print(f"✅ 学生恢复: {student.name}")
         return jsonify({'success': True, 'message': f'{student.name}已恢复'})
@@ -1642,26 +2671,14 @@ def create_course():
         if not class_id or not name:
             return jsonify({'success': False, 'message': '参数不完整'}), 400
         
-        # 结束所有活跃课程
-        Course.query.filter_by(class_id=class_id, is_active=True).update({'is_active': False, 'ended_at': datetime.utcnow()})
-        
-        # 创建新课程
-        course_id = str(uuid.uuid4())
-        course = Course(id=course_id, class_id=class_id, name=name, current_round=1, is_active=True)
-        db.session.add(course)
-        db.session.commit()
-        
-        # 标记学生出勤
-        students = Student.query.filter_by(class_id=class_id, status='active').all()
-        for student in students:
-            attendance = CourseAttendance(
-                id=str(uuid.uuid4()),
-                course_id=course_id,
-                student_id=student.id,
-                is_absent=False
-            )
-            db.session.add(attendance)
+        # 结束进行中的课程、创建新课程和出勤记录（一个事务）
+        course, closed_course_ids = open_course(class_id, name)
+        course_id = course.id
         db.session.commit()
+        invalidate_course_context(class_id)
+        invalidate_classroom_snapshot(class_id)
+        for closed_course_id in closed_course_ids:
+            schedule_report_snapshot(closed_course_id)
         
         print(f"✅ 创建新课程: {name}")
         return jsonify({
@@ -1704,26 +2721,14 @@ def start_course():
         if not class_id:
             return jsonify({'success': False, 'message': '班级ID不能为空'}), 400
         
-        # 结束所有活跃课程
-        Course.query.filter_by(class_id=class_id, is_active=True).update({'is_active': False, 'ended_at': datetime.utcnow()})
-        
-        # 创建新课程
-        course_id = str(uuid.uuid4())
-        course = Course(id=course_id, class_id=class_id, name=name, current_round=1, is_active=True)
-        db.session.add(course)
-        db.session.commit()
-        
-        # 标记学生出勤
-        students = Student.query.filter_by(class_id=class_id, status='active').all()
-        for student in students:
-            attendance = CourseAttendance(
-                id=str(uuid.uuid4()),
-                course_id=course_id,
-                student_id=student.id,
-                is_absent=False
-            )
-            db.session.add(attendance)
+        # 结束进行中的课程、创建新课程和出勤记录（一个事务）
+        course, closed_course_ids = open_course(class_id, name)
+        course_id = course.id
         db.session.commit()
+        invalidate_course_context(class_id)
+        invalidate_classroom_snapshot(class_id)
+        for closed_course_id in closed_course_ids:
+            schedule_report_snapshot(closed_course_id)
         
         print(f"✅ 创建新课程: {name}")
         return jsonify({
@@ -1767,54 +2772,41 @@ def start_class():
 def get_classroom_data():
     """获取课堂数据"""
     try:
-        class_id = request.headers.get('X-Class-ID')
-        if not class_id:
-            referer = request.headers.get('Referer', '')
-            # 支持从 /classroom/ 或 /course/ URL 中提取 class_id
-            if '/classroom/' in referer:
-                class_id = referer.split('/classroom/')[-1].split('?')[0].split('#')[0]
-            elif '/course/' in referer:
-                # 从 course_id 获取对应的 class_id
-                course_id_from_url = referer.split('/course/')[-1].split('?')[0].split('#')[0]
-                course = Course.query.filter_by(id=course_id_from_url).first()
-                if course:
-                    class_id = course.class_id
+        class_id = resolve_class_id()
         
         if not class_id:
             return jsonify({'success': False, 'message': '班级ID不能为空'}), 400
         
-        # 获取课程
-        course = Course.query.filter_by(class_id=class_id, is_active=True).first()
+        # 实时事件触发的刷新（fresh=1，或 round=事件中的新轮次）：写操作可能由其他 worker 处理，
+        # 本 worker 的快照和课程上下文都还没有失效，不能返回缓存中的旧轮次和旧成绩
+        fresh = request.args.get('fresh') == '1'
+        expected_round = request.args.get('round', type=int)
+        
+        # 优先返回缓存的快照
+        cached = None if fresh else classroom_snapshot_cache.get(class_id)
+        if cached is not None and expected_round in (None, cached[0]):
+            return app.response_class(cached[1], mimetype=app.json.mimetype)
+        if fresh or expected_round is not None:
+            invalidate_course_context(class_id)
+        
+        # 获取课程（缓存的课程上下文）
+        course = active_course_context(class_id)
         
         # 获取活跃学生（用于答题）
         active_students = Student.query.filter_by(class_id=class_id, status='active').all()
+        # 从计分板读取成绩（一次索引查询）
+        course_scores = load_course_scores(course['id']) if course else {}
         students_data = {}
         
         for student in active_students:
-            submissions = []
-            total_score = 0
-            total_rounds = 0
-            correct_rounds = 0
-            
-            if course:
-                submissions = StudentSubmission.query.filter_by(student_id=student.id, course_id=course.id).all()
-                for sub in submissions:
-                    if sub.is_correct:
-                        # 获取该轮次的分数
-                        round_obj = CourseRound.query.filter_by(course_id=course.id, round_number=sub.round_number).first()
-                        if round_obj:
-                            total_score += round_obj.question_score
-                        else:
-                            total_score += 1
-                        correct_rounds += 1
-                total_rounds = len(set(sub.round_number for sub in submissions))
+            stats = course_scores.get(student.id, {})
             
             students_data[student.name] = {
                 'name': student.name,
                 'id': student.id,
-                'score': total_score,
-                'total_rounds': total_rounds,
-                'correct_rounds': correct_rounds,
+                'score': stats.get('score', 0),
+                'total_rounds': stats.get('rounds_answered', 0),
+                'correct_rounds': stats.get('correct_rounds', 0),
                 'expression': 'neutral',
                 'animation': 'none',
                 'avatar_color': '#4ecdc4',
@@ -1836,17 +2828,150 @@ def get_classroom_data():
             'success': True,
             'students': students_data,
             'absent_students': absent_students_data,
-            'current_round': course.current_round if course else 1,
+            'current_round': course['current_round'] if course else 1,
             'round_active': False
         }
         
-        return jsonify(result)
+        payload = f"{app.json.dumps(result)}\n"
+        classroom_snapshot_cache.set(class_id, (result['current_round'], payload))
+        return app.response_class(payload, mimetype=app.json.mimetype)
         
     except Exception as e:
         print(f"❌ 获取课堂数据失败: {str(e)}")
         traceback.print_exc()
         return jsonify({'success': False, 'message': f'获取数据失败: {str(e)}'}), 500
 
+# 课程实时事件流（SSE）
+@app.route('/api/course_events/<course_id>')
+def course_events(course_id):
+    """课程实时事件流：连接保持一段时间后结束，浏览器自动重连"""
+    if not event_stream_limiter.acquire():
+        # 本进程的SSE连接已满，返回503（前端不会因此影响正常操作）
+        return jsonify({'success': False, 'message': '实时连接已满，请稍后重试'}), 503
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    response = Response(
+        stream_with_context(sse_stream(event_broker, f'course:{course_id}', last_event_id=last_event_id,
+                                       max_duration=int(os.environ.get('SSE_MAX_DURATION', 25)))),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(event_stream_limiter.release)
+    return response
+
+# 历史数据分页（键集分页：页面只渲染第一页，滚动到底部时请求下一页）
+@app.route('/api/history_classes')
+def history_classes():
+    """历史班级分页（cursor 为上一页返回的 next_cursor）"""
+    try:
+        classes, next_cursor = history_classes_page(request.args.get('cursor'), page_limit())
+        attach_class_counts(classes)
+        return jsonify({
+            'success': True,
+            'classes': [{
+                'id': class_obj.id,
+                'name': class_obj.name,
+                'description': class_obj.description,
+                'student_count': class_obj.student_count,
+                'course_count': class_obj.course_count,
+                'ended_date': class_obj.ended_date.strftime('%Y-%m-%d') if class_obj.ended_date else None,
+                'has_goal': bool(class_obj.competition_goal_id)
+            } for class_obj in classes],
+            'next_cursor': next_cursor
+        })
+    except pagination.InvalidCursor as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        print(f"❌ 获取历史班级失败: {str(e)}")
+        return jsonify({'success': False, 'message': f'获取历史班级失败: {str(e)}'}), 500
+
+@app.route('/api/class_courses/<class_id>')
+def class_courses(class_id):
+    """班级课程历史分页（cursor 为上一页返回的 next_cursor）"""
+    try:
+        courses, next_cursor = class_courses_page(class_id, request.args.get('cursor'), page_limit())
+        items = []
+        for course in courses:
+            item = course_list_item(course)
+            item['created_at'] = item['created_at'].isoformat() if item['created_at'] else None
+            items.append(item)
+        return jsonify({'success': True, 'courses': items, 'next_cursor': next_cursor})
+    except pagination.InvalidCursor as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        print(f"❌ 获取课程历史失败: {str(e)}")
+        return jsonify({'success': False, 'message': f'获取课程历史失败: {str(e)}'}), 500
+
+@app.route('/api/student_submissions/<student_id>')
+def student_submissions(student_id):
+    """学生提交记录分页（按提交时间降序，cursor 为上一页返回的 next_cursor）"""
+    try:
+        student = db.session.get(Student, student_id)
+        if not student:
+            return jsonify({'success': False, 'message': '学生不存在'}), 404
+        if student.status == 'absent':
+            return jsonify({'success': False, 'message': '请假状态的学生无法查看报告'}), 403
+
+        rows, next_cursor = pagination.keyset_page(
+            db.session.query(StudentSubmission, Course.name).outerjoin(
+                Course, Course.id == StudentSubmission.course_id
+            ).filter(StudentSubmission.student_id == student_id),
+            pagination.sort_key(StudentSubmission.created_at), StudentSubmission.id,
+            key=lambda row: (row[0].created_at, row[0].id),
+            cursor=request.args.get('cursor'), limit=page_limit(50)
+        )
+        return jsonify({
+            'success': True,
+            'submissions': [{
+                'id': submission.id,
+                'course_id': submission.course_id,
+                'course_name': course_name,
+                'round_number': submission.round_number,
+                'answer': submission.answer,
+                'is_correct': submission.is_correct,
+                'answer_time': submission.answer_time,
+                'created_at': submission.created_at.strftime('%Y-%m-%d %H:%M:%S') if submission.created_at else None
+            } for submission, course_name in rows],
+            'next_cursor': next_cursor
+        })
+    except pagination.InvalidCursor as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        print(f"❌ 获取提交记录失败: {str(e)}")
+        return jsonify({'success': False, 'message': f'获取提交记录失败: {str(e)}'}), 500
+
+# 缓存命中统计
+@app.route('/api/cache_stats')
+def cache_stats():
+    """进程内缓存的命中/未命中统计（每个 worker 进程独立统计）"""
+    return jsonify({'success': True, 'pid': os.getpid(), 'caches': all_cache_stats(), 'live_events': event_broker.stats(),
+                    'submission_buffer': submission_buffer.stats(), 'compression': response_compressor.stats()})
+
+@app.route('/debug/perf')
+def debug_perf():
+    """请求性能统计（按端点汇总 + 最近请求；?format=json 返回JSON，?slow=1 只看慢请求/N+1）"""
+    if not _perf_access_allowed():
+        return jsonify({'error': '无权访问'}), 403
+    slow_only = request.args.get('slow') == '1'
+    endpoints = perf_profiler.endpoint_stats()
+    try:
+        limit = int(request.args.get('limit', 50))
+    except (TypeError, ValueError):
+        limit = 50
+    recent = perf_profiler.recent(limit=max(1, min(limit, 200)), slow_only=slow_only)
+    if request.args.get('format') == 'json':
+        return jsonify({'success': True, 'pid': os.getpid(), 'endpoints': endpoints, 'recent': recent})
+    return render_template('debug_perf.html', pid=os.getpid(), endpoints=endpoints, recent=recent,
+                           slow_only=slow_only, slow_ms=perf_profiler.slow_request_ms)
+
+@app.route('/debug/perf/reset', methods=['POST'])
+def debug_perf_reset():
+    """清空请求性能统计"""
+    if not _perf_access_allowed():
+        return jsonify({'error': '无权访问'}), 403
+    perf_profiler.reset()
+    return jsonify({'success': True})
+
 # 提交学生答案
 @app.route('/submit_student_answer', methods=['POST'])
 def submit_student_answer():
@@ -1857,64 +2982,76 @@ def submit_student_answer():
         answer = data.get('answer', '').strip()
         answer_time = data.get('answer_time', 0.0)
         
-        # 优先从请求体中获取course_id
-        course_id = data.get('course_id')
-        
-        # 如果没提供course_id，尝试从URL获取
-        if not course_id:
-            referer = request.headers.get('Referer', '')
-            if '/course/' in referer:
-                course_id = referer.split('/course/')[-1].split('?')[0]
-        
-        # 如果仍然没有course_id，尝试从class_id获取活跃课程
-        if not course_id:
-            class_id = request.headers.get('X-Class-ID')
-            if class_id:
-                course = Course.query.filter_by(class_id=class_id, is_active=True).first()
-                if course:
-                    course_id = course.id
-        
+        course_id = resolve_course_id(data)
         if not student_name or not answer or not course_id:
             return jsonify({'success': False, 'message': '参数不完整'}), 400
         
-        # 获取课程和学生
-        course = Course.query.filter_by(id=course_id).first()
+        # 获取课程（缓存的课程上下文）和学生
+        course = course_context(course_id)
         if not course:
             return jsonify({'success': False, 'message': '课程不存在'}), 404
         
-        student = Student.query.filter_by(name=student_name, class_id=course.class_id).first()
-        if not student:
+        # 请假学生无法提交答案：学生状态在写入时检查（名册缓存只有姓名和ID）
+        student_id = find_student_in_roster(course['class_id'], student_name)
+        if not student_id:
             return jsonify({'success': False, 'message': '学生不存在'}), 400
         
-        # 检查学生状态：请假学生无法提交答案
-        if student.status == 'absent':
-            return jsonify({'success': False, 'message': '请假状态的学生无法参与答题'}), 403
-        
-        # 检查是否已提交
-        existing = StudentSubmission.query.filter_by(
-            student_id=student.id,
-            course_id=course.id,
-            round_number=course.current_round
-        ).first()
-        
-        if existing:
-            print(f"⚠️ 学生 {student_name} 在轮次 {course.current_round} 已经提交过答案: {existing.answer}")
-            return jsonify({'success': False, 'message': '您已经提交过答案了'}), 400
-        
-        # 创建提交记录
-        submission = StudentSubmission(
-            id=str(uuid.uuid4()),
-            student_id=student.id,
-            course_id=course.id,
-            round_number=course.current_round,
-            answer=answer,
-            answer_time=float(answer_time),
-            is_correct=False  # 稍后评判
-        )
-        db.session.add(submission)
-        db.session.commit()
+        if SUBMISSION_BUFFER:
+            # 组提交：放入本 worker 的缓冲区，所在批次的事务提交后返回；
+            # 等待前归还查询课程上下文/名册时取得的连接，等待中的请求不占用数据库连接
+            db.session.close()
+            try:
+                outcome = submission_buffer.submit({
+                    'course_id': course['id'],
+                    'student_id': student_id,
+                    'answer': answer,
+                    'answer_time': float(answer_time)
+                }, timeout=SUBMISSION_BUFFER_TIMEOUT)
+            except FuturesTimeoutError:
+                # 等待超时的提交已从缓冲区移除、不会再写入，学生重新提交即可
+                print(f"⚠️ 学生 {student_name} 的提交在缓冲区中等待超时")
+                return jsonify({'success': False, 'message': '提交繁忙，请重新提交'}), 503
+            if outcome.get('missing'):
+                return jsonify({'success': False, 'message': '课程不存在'}), 404
+            if outcome.get('rejected'):
+                message, status_code = outcome['rejected']
+                if status_code == 400:
+                    invalidate_roster(course['class_id'])
+                return jsonify({'success': False, 'message': message}), status_code
+            if not outcome['inserted']:
+                print(f"⚠️ 学生 {student_name} 在轮次 {outcome['round_number']} 已经提交过答案")
+                return jsonify({'success': False, 'message': '您已经提交过答案了'}), 400
+            round_number = outcome['round_number']
+        else:
+            # 创建提交记录（已提交过时唯一索引冲突，不插入）
+            inserted = insert_submission_once(
+                course['id'],
+                student_id=student_id,
+                answer=answer,
+                answer_time=float(answer_time),
+                is_correct=False  # 稍后评判
+            )
+            if inserted is None:
+                db.session.rollback()
+                message, status_code = submission_rejection(course['class_id'], student_id)
+                print(f"⚠️ 学生 {student_name} 在轮次 {course['current_round']} 的提交未写入: {message}")
+                return jsonify({'success': False, 'message': message}), status_code
+            round_number = inserted[1] or course['current_round']
+        
+            # 计分板：参与轮次 +1；已结束的课程（以写入时数据库中的状态为准）补录提交后报告快照和版本失效
+            bump_course_score(course['id'], student_id, rounds_answered=1)
+            if inserted[2]:
+                clear_report_snapshot(db.session.get(Course, course['id']))
+                bump_course_version(course['id'])
+            db.session.commit()
+            invalidate_classroom_snapshot(course['class_id'])
+        
+        publish_course_event(course['id'], 'submission', {
+            'round_number': round_number,
+            'student_name': student_name
+        })
         
-        print(f"✅ 学生 {student_name} 在轮次 {course.current_round} 提交答案: {answer}")
+        print(f"✅ 学生 {student_name} 在轮次 {round_number} 提交答案: {answer}")
         return jsonify({'success': True})
         
     except Exception as e:
@@ -1923,6 +3060,117 @@ def submit_student_answer():
         db.session.rollback()
         return jsonify({'success': False, 'message': f'提交失败: {str(e)}'}), 500
 
+# 批量提交答案（老师按纸条录入全班答案）
+BATCH_SUBMIT_MAX = int(os.environ.get('BATCH_SUBMIT_MAX', 200))
+
+@app.route('/submit_answers_batch', methods=['POST'])
+def submit_answers_batch():
+    """批量提交当前轮次的答案
+
+    请求体：{course_id, round_number(可选，与当前轮次不一致时拒绝), submissions: [{student_name, answer, answer_time}]}
+    名册校验最多一次查询，所有提交一条多行 INSERT 写入；返回每个学生的结果
+    """
+    try:
+        data = request.get_json() or {}
+        items = data.get('submissions')
+        course_id = resolve_course_id(data)
+        if not course_id or not isinstance(items, list) or not items:
+            return jsonify({'success': False, 'message': '参数不完整'}), 400
+        if len(items) > BATCH_SUBMIT_MAX:
+            return jsonify({'success': False, 'message': f'一次最多提交 {BATCH_SUBMIT_MAX} 条答案'}), 400
+
+        # 读取课程并锁定课程行（PostgreSQL），进入下一轮要等本批写入完成，整批一定写入同一轮次
+        course = db.session.query(
+            Course.id, Course.class_id, Course.current_round, Course.ended_at
+        ).filter(Course.id == course_id).with_for_update().first()
+        if not course:
+            return jsonify({'success': False, 'message': '课程不存在'}), 404
+        round_number = course.current_round
+        expected_round = data.get('round_number')
+        if expected_round is not None:
+            try:
+                expected_round = int(expected_round)
+            except (TypeError, ValueError):
+                db.session.rollback()
+                return jsonify({'success': False, 'message': '参数不完整'}), 400
+        if expected_round is not None and expected_round != round_number:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'message': f'当前已是第 {round_number} 轮，请重新确认答案',
+                'round_number': round_number
+            }), 409
+
+        names = [str(item.get('student_name') or '').strip() if isinstance(item, dict) else '' for item in items]
+        roster = find_students_in_roster(course.class_id, [name for name in names if name])
+        # 学生状态在本事务中读取（名册缓存不含状态，已删除的学生不在结果中）
+        statuses = load_student_statuses(set(roster.values()))
+
+        results = []
+        rows = {}
+        for item, name in zip(items, names):
+            result = {'student_name': name, 'success': False}
+            results.append(result)
+            answer = str(item.get('answer') or '').strip() if name else ''
+            if not name or not answer:
+                result['message'] = '参数不完整'
+                continue
+            if name in rows:
+                result['message'] = '同一学生重复提交'
+                continue
+            student_id = roster.get(name)
+            rejection = student_status_rejection(student_id in statuses, statuses.get(student_id))
+            if rejection:
+                result['message'] = rejection[0]
+                continue
+            try:
+                answer_time = float(item.get('answer_time') or 0.0)
+            except (TypeError, ValueError):
+                result['message'] = '答题时间无效'
+                continue
+            rows[name] = {'student_id': student_id, 'answer': answer, 'answer_time': answer_time}
+
+        inserted = insert_submissions_bulk(course.id, round_number, list(rows.values()))
+        for result in results:
+            row = rows.get(result['student_name'])
+            if 'message' in result or not row:
+                continue
+            if row['student_id'] in inserted:
+                result['success'] = True
+            else:
+                result['message'] = '您已经提交过答案了'
+
+        # 计分板：参与轮次 +1
+        bump_course_scores(course.id, inserted, rounds_answered=1)
+        if course.ended_at and inserted:
+            clear_report_snapshot(db.session.get(Course, course.id))
+            bump_course_version(course.id)
+        db.session.commit()
+
+        submitted_names = [result['student_name'] for result in results if result['success']]
+        if submitted_names:
+            invalidate_classroom_snapshot(course.class_id)
+            # 一次推送整批结果，课堂页面收到后重新加载数据
+            publish_course_event(course.id, 'submission', {
+                'round_number': round_number,
+                'student_names': submitted_names,
+                'reload': True
+            })
+
+        print(f"✅ 批量提交轮次 {round_number} 的答案: 成功 {len(submitted_names)} 条，共 {len(items)} 条")
+        return jsonify({
+            'success': True,
+            'round_number': round_number,
+            'submitted': len(submitted_names),
+            'results': results
+        })
+
+    except Exception as e:
+        print(f"❌ 批量提交答案失败: {str(e)}")
+        traceback.print_exc()
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'提交失败: {str(e)}'}), 500
+
 # 评判答案
 @app.route('/judge_answers', methods=['POST'])
 def judge_answers():
@@ -1932,29 +3180,16 @@ def judge_answers():
         correct_answer = data.get('correct_answer', '').strip()
         question_score = data.get('question_score', 1)
         
-        # 优先从请求体中获取course_id
-        course_id = data.get('course_id')
-        
-        # 如果没提供course_id，尝试从URL获取
-        if not course_id:
-            referer = request.headers.get('Referer', '')
-            if '/course/' in referer:
-                course_id = referer.split('/course/')[-1].split('?')[0]
-        
-        # 如果仍然没有course_id，尝试从class_id获取活跃课程
-        if not course_id:
-            class_id = request.headers.get('X-Class-ID')
-            if class_id:
-                course = Course.query.filter_by(class_id=class_id, is_active=True).first()
-                if course:
-                    course_id = course.id
+        course_id = resolve_course_id(data)
+        # 本 worker 缓冲中的提交先写入数据库
+        submission_buffer.flush()
         
         if not correct_answer or not course_id:
             return jsonify({'success': False, 'message': '参数不完整'}), 400
         
         
         # 获取课程
-        course = Course.query.filter_by(id=course_id).first()
+        course = db.session.get(Course, course_id)
         if not course:
             return jsonify({'success': False, 'message': '课程不存在'}), 404
         
@@ -1983,80 +3218,55 @@ def judge_answers():
             round_record.question_score = question_score
             round_record.is_completed = True
         
-        # 评判所有学生的答案
+        # 评判所有学生的答案（计分引擎：查询次数与学生数、轮次数无关）
         students_list = Student.query.filter_by(class_id=class_id, status='active').all()
+        if app.config.get('BULK_GRADING'):
+            # 批量评判：一条 UPDATE 评判整轮并返回被更新的行，无需逐行加载和flush
+            round_submissions = grade_round_bulk(course.id, course.current_round, correct_answer)
+        else:
+            # 当前轮次的全部提交（一次查询），逐条评判
+            round_submissions = fetch_round_submissions(course.id, course.current_round)
+        # 历史轮次（不包括当前轮次）的得分统计（一次连接聚合查询）
+        historical_stats = aggregate_course_scores(course.id, below_round=course.current_round)
         students_data = {}
         
         for student in students_list:
-            submission = StudentSubmission.query.filter_by(
-                student_id=student.id,
-                course_id=course.id,
-                round_number=course.current_round
-            ).first()
-            
-            # 计算历史总分数
-            all_submissions = StudentSubmission.query.filter_by(
-                student_id=student.id,
-                course_id=course.id
-            ).all()
-            
-            # 先计算历史成绩（不包括当前轮次）
-            historical_score = 0
-            historical_correct_rounds = 0
-            historical_rounds = set()
-            
-            for sub in all_submissions:
-                if sub.round_number < course.current_round:  # 只计算历史轮次
-                    historical_rounds.add(sub.round_number)
-                    if sub.is_correct:
-                        round_obj = CourseRound.query.filter_by(course_id=course.id, round_number=sub.round_number).first()
-                        if round_obj:
-                            historical_score += round_obj.question_score
-                        else:
-                            historical_score += 1
-            
+            submission = round_submissions.get(student.id)
+            history = historical_stats.get(student.id, {})
+            historical_score = history.get('score', 0)
             # 历史正确轮次数（同一轮次只算一次）
-            historical_correct_rounds = len([r for r in historical_rounds if 
-                any(sub.is_correct and sub.round_number == r for sub in all_submissions)])
+            historical_correct_rounds = history.get('correct_rounds', 0)
             
             # 判断当前答案
             expression = 'neutral'
             last_answer = ''
             last_answer_time = 0
             current_round_score = 0
-            is_current_correct = False
-            is_punished = False
+            if app.config.get('BULK_GRADING'):
+                # 已由 UPDATE 语句评判，直接使用返回行中的结果
+                is_current_correct = bool(submission and submission.is_correct)
+                is_punished = bool(submission and (submission.penalty_score or 0) > 0)
+            else:
+                is_current_correct, is_punished = judge_submission(submission, correct_answer)
+                if submission:
+                    # 确保数据库中的is_correct状态与评判结果一致（被punished的学生为False）
+                    submission.is_correct = is_current_correct
             
             if submission:
-                # 检查学生是否被punished（有penalty_score）
-                is_punished = submission.penalty_score and submission.penalty_score > 0
-                
                 if is_punished:
                     # 被punished的学生直接扣3分，无论答案是否正确
                     current_round_score = -3
                     expression = 'angry'
-                    is_current_correct = False
                     print(f"⚠️ 学生 {student.name} 被punished，扣3分")
-                    # 确保is_correct为False
-                    submission.is_correct = False
+                elif is_current_correct:
+                    current_round_score = question_score
+                    expression = 'smile'
                 else:
-                    # 判断当前轮次答案是否正确
-                    print(f"📝 学生 {student.name} 轮次 {course.current_round} 答案: '{submission.answer}' vs 正确答案: '{correct_answer}'")
-                    is_current_correct = submission.answer.strip().lower() == correct_answer.strip().lower()
-                    # 更新数据库中的is_correct状态
-                    submission.is_correct = is_current_correct
-                    print(f"{'✅ 正确' if is_current_correct else '❌ 错误'}: {is_current_correct}")
-                    
-                    if is_current_correct:
-                        current_round_score = question_score
-                        expression = 'smile'
-                    else:
-                        expression = 'angry'
+                    expression = 'angry'
                 
                 last_answer = submission.answer
                 last_answer_time = submission.answer_time
             else:
-                print(f"⚠️ 学生 {student.name} 在轮次 {course.current_round} 没有提交答案")
                 expression = 'embarrassed'
             
             # 计算总分数和轮次（扣分可能导致分数为负）
@@ -2064,16 +3274,8 @@ def judge_answers():
             # total_rounds: 课程的总轮次数（包括未参与的轮次），用于计算准确率
             # 准确率 = 正确轮次数 / 课程总轮次数
             total_rounds = course.current_round  # 使用当前课程的总轮次
-            if submission:
-                # 被punished的学生不算正确轮次
-                if is_punished:
-                    correct_rounds = historical_correct_rounds
-                else:
-                    # 有提交记录，正确轮次增加
-                    correct_rounds = historical_correct_rounds + (1 if is_current_correct else 0)
-            else:
-                # 没有提交记录，正确轮次不变（未作答算作错误）
-                correct_rounds = historical_correct_rounds
+            # 被punished或未作答的学生不增加正确轮次（未作答算作错误）
+            correct_rounds = historical_correct_rounds + (1 if is_current_correct else 0)
             
             students_data[student.name] = {
                 'name': student.name,
@@ -2088,7 +3290,34 @@ def judge_answers():
                 'last_answer_time': last_answer_time
             }
         
+        # 更新计分板：历史统计 + 本轮评判结果即为整节课的汇总成绩（无需额外查询）
+        try:
+            round_points = int(question_score)
+        except (TypeError, ValueError):
+            round_points = 1
+        course_totals = {}
+        for student_id in set(historical_stats) | set(round_submissions):
+            history = historical_stats.get(student_id, {})
+            submission = round_submissions.get(student_id)
+            totals = {field: history.get(field, 0) for field in SCORE_FIELDS}
+            if submission:
+                totals['rounds_answered'] += 1
+                totals['penalty_total'] += submission.penalty_score or 0
+                if submission.is_correct:
+                    totals['score'] += round_points
+                    totals['correct_rounds'] += 1
+            course_totals[student_id] = totals
+        store_course_scores(course.id, course_totals, [s.id for s in students_list])
+        clear_report_snapshot(course)
+        bump_course_version(course.id)
+        
         db.session.commit()
+        invalidate_classroom_snapshot(class_id)
+        publish_course_event(course.id, 'judge', {
+            'round_number': course.current_round,
+            'correct_answer': correct_answer,
+            'students': students_data
+        })
         
         print(f"✅ 评判完成，处理了 {len(students_data)} 个学生")
         return jsonify({
@@ -2117,65 +3346,41 @@ def next_round():
         if not data:
             data = {}
         
-        course_id = data.get('course_id')
-        class_id = request.headers.get('X-Class-ID')
-        
-        # 如果没提供course_id，尝试从class_id获取活跃课程
-        if not course_id and class_id:
-            course = Course.query.filter_by(class_id=class_id, is_active=True).first()
-            if course:
-                course_id = course.id
-        
-        # 如果仍然没有，尝试从URL获取
-        if not course_id:
-            referer = request.headers.get('Referer', '')
-            if '/course/' in referer:
-                course_id = referer.split('/course/')[-1].split('?')[0]
+        course_id = resolve_course_id(data)
+        # 本 worker 缓冲中的提交先写入数据库
+        submission_buffer.flush()
         
         if not course_id:
             return jsonify({'success': False, 'message': '课程ID不能为空'}), 400
         
-        course = Course.query.filter_by(id=course_id).first()
+        course = db.session.get(Course, course_id)
         if not course:
             print(f"❌ 课程不存在: {course_id}")
             return jsonify({'success': False, 'message': '课程不存在'}), 404
         
         print(f"当前课程轮次: {course.current_round}")
         course.current_round += 1
+        bump_course_version(course.id)
         db.session.commit()
+        invalidate_course_context(course.class_id)
+        invalidate_classroom_snapshot(course.class_id)
+        publish_course_event(course.id, 'round', {'current_round': course.current_round})
         
         print(f"✅ 进入下一轮: {course.current_round}")
         
         # 获取更新后的学生数据
         students = Student.query.filter_by(class_id=course.class_id, status='active').all()
+        # 从计分板读取成绩（一次索引查询）
+        course_scores = load_course_scores(course.id)
         students_data = {}
         
         for student in students:
-            submissions = StudentSubmission.query.filter_by(
-                student_id=student.id,
-                course_id=course_id
-            ).all()
-            
-            print(f"👤 学生 {student.name} 有 {len(submissions)} 条提交记录")
-            
-            # 计算所有轮次的分数和准确率
-            total_score = 0
-            correct_rounds = 0
-            
-            for sub in submissions:
-                print(f"  轮次 {sub.round_number}: 答案='{sub.answer}' is_correct={sub.is_correct}")
-                if sub.is_correct:
-                    round_obj = CourseRound.query.filter_by(course_id=course_id, round_number=sub.round_number).first()
-                    if round_obj:
-                        total_score += round_obj.question_score
-                    else:
-                        total_score += 1
-            
+            stats = course_scores.get(student.id, {})
+            total_score = stats.get('score', 0)
             # total_rounds: 课程的总轮次数（包括未参与的轮次）
             # correct_rounds: 正确答题的轮次数（同一轮次只算一次）
             total_rounds = course.current_round - 1  # 当前课程的总轮次减1（因为还没进入下一轮）
-            correct_rounds = len(set(sub.round_number for sub in submissions if sub.is_correct))
-            print(f"  → 总分: {total_score}, 总轮次: {total_rounds}, 正确轮次: {correct_rounds}")
+            correct_rounds = stats.get('correct_rounds', 0)
             
             students_data[student.name] = {
                 'name': student.name,
@@ -2216,7 +3421,12 @@ def end_course(course_id):
         
         course.is_active = False
         course.ended_at = datetime.utcnow()
+        bump_course_version(course.id)
         db.session.commit()
+        invalidate_course_context(course.class_id)
+        invalidate_classroom_snapshot(course.class_id)
+        publish_course_event(course.id, 'course_end', {'ceremony_url': f'/ceremony/{course_id}'})
+        schedule_report_snapshot(course.id)
         
         print(f"✅ 课程已结束: {course.name}")
         return redirect(f'/ceremony/{course_id}')
@@ -2244,13 +3454,16 @@ def delete_student():
             return jsonify({'success': False, 'message': '参数不完整'}), 400
         
         # 查找学生
-        student = Student.query.filter_by(name=student_name, class_id=class_id).first()
+        student = load_student_by_name(class_id, student_name)
         if not student:
             return jsonify({'success': False, 'message': '学生不存在'}), 404
         
         # 删除学生
         db.session.delete(student)
+        bump_class_version(class_id)
         db.session.commit()
+        invalidate_roster(class_id)
+        invalidate_classroom_snapshot(class_id)
         
         print(f"✅ 学生已删除: {student_name}")
         return jsonify({'success': True, 'message': f'学生 {student_name} 已删除'})
@@ -2262,70 +3475,98 @@ def delete_student():
             db.session.rollback()
         return jsonify({'success': False, 'message': f'删除失败: {str(e)}'}), 500
 
-# 标记学生行为
+# 标记学生行为：行为 -> 提交记录中的计数列
+BEHAVIOR_COUNTERS = {
+    'guess': 'guess_count',
+    'copy': 'copy_count',
+    'noisy': 'noisy_count',
+    'distracted': 'distracted_count'
+}
+
 @app.route('/api/mark_behavior', methods=['POST'])
 def mark_behavior():
     """标记学生行为（guess, copy, noisy, distracted）"""
+    from sqlalchemy import func
     try:
         data = request.get_json()
         student_name = data.get('student_name', '').strip()
         behavior = data.get('behavior', '').strip()
-        course_id = data.get('course_id')
-        
-        # 如果没提供course_id，尝试获取
-        if not course_id:
-            referer = request.headers.get('Referer', '')
-            if '/course/' in referer:
-                course_id = referer.split('/course/')[-1].split('?')[0]
+        course_id = resolve_course_id(data)
+        # 本 worker 缓冲中的提交先写入数据库（否则会插入空答案的记录，学生的答案随后因唯一索引被丢弃）
+        submission_buffer.flush()
         
         if not student_name or not behavior or not course_id:
             return jsonify({'success': False, 'message': '参数不完整'}), 400
         
         # 获取课程和学生
-        course = Course.query.filter_by(id=course_id).first()
+        course = db.session.get(Course, course_id)
         if not course:
             return jsonify({'success': False, 'message': '课程不存在'}), 404
         
-        student = Student.query.filter_by(name=student_name, class_id=course.class_id).first()
+        student = load_student_by_name(course.class_id, student_name)
         if not student:
             return jsonify({'success': False, 'message': '学生不存在'}), 404
+        student_id = student.id
+        
+        # 当前轮次还没有提交记录时插入一条空答案的记录（用于记录行为）；
+        # 学生同时提交答案时唯一索引冲突，不插入，下面更新已有的提交记录
+        inserted = insert_submission_once(
+            course_id,
+            student_id=student_id,
+            answer='',  # 空答案，表示未提交
+            answer_time=0.0,
+            is_correct=False
+        )
+        round_number = (inserted and inserted[1]) or course.current_round
         
-        # 获取或创建当前轮次的提交记录
-        submission = StudentSubmission.query.filter_by(
-            student_id=student.id,
+        # 锁定提交记录，读取修改前的状态，用于增量更新计分板
+        submission = db.session.query(
+            StudentSubmission.id, StudentSubmission.is_correct, StudentSubmission.penalty_score
+        ).filter_by(
+            student_id=student_id,
             course_id=course_id,
-            round_number=course.current_round
-        ).first()
-        
-        # 如果学生没有提交记录，创建一个空的提交记录（用于记录行为）
+            round_number=round_number
+        ).with_for_update().first()
         if not submission:
-            submission = StudentSubmission(
-                id=str(uuid.uuid4()),
-                student_id=student.id,
-                course_id=course_id,
-                round_number=course.current_round,
-                answer='',  # 空答案，表示未提交
-                answer_time=0.0,
-                is_correct=False
-            )
-            db.session.add(submission)
-        
-        # 更新行为计数
-        if behavior == 'guess':
-            submission.guess_count = (submission.guess_count or 0) + 1
-        elif behavior == 'copy':
-            submission.copy_count = (submission.copy_count or 0) + 1
-        elif behavior == 'noisy':
-            submission.noisy_count = (submission.noisy_count or 0) + 1
-        elif behavior == 'distracted':
-            submission.distracted_count = (submission.distracted_count or 0) + 1
-        
-        # 标记该题得分为0（无论答案是否正确），并设置扣分标记
-        submission.is_correct = False
-        # 设置penalty_score为3，表示被惩罚扣3分
-        submission.penalty_score = 3
+            # 学生已请假或已删除
+            db.session.rollback()
+            message, status_code = submission_rejection(course.class_id, student_id)
+            return jsonify({'success': False, 'message': message}), status_code
+        is_new_submission = inserted is not None
+        was_correct = bool(submission.is_correct)
+        old_penalty = submission.penalty_score or 0
+        
+        # 一条 UPDATE：行为计数 +1，标记该题得分为0（无论答案是否正确），并设置扣分标记
+        # （penalty_score为3，表示被惩罚扣3分）
+        table = StudentSubmission.__table__
+        values = {'is_correct': False, 'penalty_score': 3}
+        counter = BEHAVIOR_COUNTERS.get(behavior)
+        if counter:
+            values[counter] = func.coalesce(table.c[counter], 0) + 1
+        db.session.execute(table.update().where(table.c.id == submission.id).values(**values))
+        
+        # 增量更新计分板：原本答对的轮次撤销得分，记录扣分
+        score_delta = 0
+        if was_correct:
+            round_obj = CourseRound.query.filter_by(course_id=course_id, round_number=round_number).first()
+            score_delta = -(round_obj.question_score if round_obj and round_obj.question_score is not None else 1)
+        bump_course_score(
+            course_id, student_id,
+            score=score_delta,
+            correct_rounds=-1 if was_correct else 0,
+            rounds_answered=1 if is_new_submission else 0,
+            penalty_total=values['penalty_score'] - old_penalty
+        )
+        clear_report_snapshot(course)
+        bump_course_version(course_id)
         
         db.session.commit()
+        invalidate_classroom_snapshot(course.class_id)
+        publish_course_event(course_id, 'behavior', {
+            'round_number': round_number,
+            'student_name': student_name,
+            'behavior': behavior
+        })
         
         print(f"✅ 学生 {student_name} 行为标记: {behavior}, 该题得分为0，扣3分")
         return jsonify({'success': True, 'message': '行为已记录，该题得分为0，扣3分'})
@@ -2338,62 +3579,66 @@ def mark_behavior():
         return jsonify({'success': False, 'message': f'标记失败: {str(e)}'}), 500
 
 # 领奖台页面
+def build_ceremony_podium(course):
+    """领奖台数据：活跃学生与计分板一次外连接查询得到成绩（请假学生不参与）"""
+    from sqlalchemy import and_
+    rows = db.session.query(Student.id, Student.name, CourseScore.id, CourseScore.score).outerjoin(
+        CourseScore, and_(CourseScore.student_id == Student.id, CourseScore.course_id == course.id)
+    ).filter(Student.class_id == course.class_id, Student.status == 'active').all()
+    if rows and all(score_id is None for _, _, score_id, _ in rows):
+        # 计分板还没有记录（旧数据），从提交记录聚合
+        course_scores = aggregate_course_scores(course.id, student_ids=[sid for sid, _, _, _ in rows])
+        rows = [(sid, name, None, course_scores.get(sid, {}).get('score', 0)) for sid, name, _, _ in rows]
+    student_scores = [{'name': name, 'score': score or 0} for _, name, _, score in rows]
+    # 按分数排序
+    student_scores.sort(key=lambda x: x['score'], reverse=True)
+    
+    # 获取班级信息
+    class_obj = Class.query.filter_by(id=course.class_id).first()
+    course_view = {
+        'id': course.id,
+        'class_id': course.class_id,
+        'name': getattr(course, 'name', ''),
+        'created_at': getattr(course, 'created_at', None).strftime('%Y-%m-%d %H:%M:%S') if getattr(course, 'created_at', None) else None,
+        'ended_at': getattr(course, 'ended_at', None).strftime('%Y-%m-%d %H:%M:%S') if getattr(course, 'ended_at', None) else None
+    }
+    class_view = {'id': class_obj.id, 'name': class_obj.name} if class_obj else {'id': course.class_id}
+    return {'course': course_view, 'classroom': class_view, 'scores': student_scores}
+
 @app.route('/ceremony/<course_id>')
 def ceremony(course_id):
     """领奖台页面"""
     try:
-        course = Course.query.filter_by(id=course_id).first()
-        if not course:
-            return jsonify({'error': '课程不存在'}), 404
-        
-        # 计算每个学生的总分（只包含活跃学生，请假学生不参与）
-        students = Student.query.filter_by(class_id=course.class_id, status='active').all()
-        student_scores = []
-        
-        for student in students:
-            
-            submissions = StudentSubmission.query.filter_by(student_id=student.id, course_id=course_id).all()
-            total_score = 0
-            for sub in submissions:
-                if sub.is_correct:
-                    round_obj = CourseRound.query.filter_by(course_id=course_id, round_number=sub.round_number).first()
-                    if round_obj:
-                        total_score += round_obj.question_score
-                    else:
-                        total_score += 1
-            
-            student_scores.append({
-                'name': student.name,
-                'score': total_score,
-                'avatar_color': student.avatar_color if hasattr(student, 'avatar_color') else f'#{random.randint(0, 0xFFFFFF):06x}'
-            })
-        
-        # 按分数排序
-        student_scores.sort(key=lambda x: x['score'], reverse=True)
-        
-        # 获取班级信息
-        class_obj = Class.query.filter_by(id=course.class_id).first()
-        
-        course_view = {
-            'id': course.id,
-            'class_id': course.class_id,
-            'name': getattr(course, 'name', ''),
-            'created_at': getattr(course, 'created_at', None).strftime('%Y-%m-%d %H:%M:%S') if getattr(course, 'created_at', None) else None,
-            'ended_at': getattr(course, 'ended_at', None).strftime('%Y-%m-%d %H:%M:%S') if getattr(course, 'ended_at', None) else None
-        }
-        class_view = {'id': class_obj.id, 'name': class_obj.name} if class_obj else {'id': course.class_id}
-        return render_template('ceremony.html', 
-                             course=course_view, 
+        # 已结束课程：版本未变化时直接返回 304
+        validators = course_report_validators(course_id)
+        cached = not_modified_response(validators)
+        if cached:
+            return cached
+
+        # 缓存key包含数据版本（ETag 由课程和班级的版本号计算）；进行中的课程没有验证信息，不缓存
+        cache_key = (course_id, validators['etag']) if validators else None
+        podium = ceremony_podium_cache.get(cache_key) if cache_key else None
+        if podium is None:
+            course = Course.query.filter_by(id=course_id).first()
+            if not course:
+                return jsonify({'error': '课程不存在'}), 404
+            podium = build_ceremony_podium(course)
+            if cache_key:
+                ceremony_podium_cache.set(cache_key, podium)
+        
+        student_scores = [
+            dict(entry, avatar_color=f'#{random.randint(0, 0xFFFFFF):06x}')
+            for entry in podium['scores']
+        ]
+        return with_validators(render_template('ceremony.html',
+                             course=podium['course'],
                              student_scores=student_scores,
-                             classroom_data=class_view)
+                             classroom_data=podium['classroom']), validators)
         
     except Exception as e:
         print(f"❌ 加载领奖台失败: {str(e)}")
         return jsonify({'error': f'加载领奖台失败: {str(e)}'}), 500
 
-# 在应用启动时初始化数据库
-init_database()
-
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 5000))
     print(f"🚀 启动服务器，端口: {port}")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+模拟数据生成
+同样的参数和随机种子总是生成完全相同的数据（包括ID），便于对比优化前后的结果
+
+每个班级的前 K-1 节课程已结束（所有轮次都已评判），最后一节课程进行中：
+前 R-1 轮已评判，第 R 轮学生已提交、尚未评判
+"""
+
+import random
+import uuid
+from datetime import datetime, timedelta
+
+# 数据规模档位
+TIERS = {
+    'small': {'classes': 1, 'students': 10, 'courses': 2, 'rounds': 5},
+    'medium': {'classes': 2, 'students': 30, 'courses': 5, 'rounds': 10},
+    'large': {'classes': 3, 'students': 40, 'courses': 10, 'rounds': 15}
+}
+
+BEHAVIORS = ('guess_count', 'copy_count', 'noisy_count', 'distracted_count')
+
+BASE_TIME = datetime(2025, 9, 1, 8, 0, 0)
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def generate_dataset(app_module, classes=1, students=10, courses=2, rounds=5,
+                     accuracy=0.7, participation=0.9, behavior_rate=0.05,
+                     absent_rate=0.05, seed=42):
+    """生成模拟数据并写入数据库（需要在应用上下文中调用）
+
+    Args:
+        app_module: 已导入的 app 模块（提供模型和计分板函数）
+        accuracy: 答对概率
+        participation: 每轮提交概率
+        behavior_rate: 提交被标记违规（猜题/抄题/打闹/走神）的概率
+        absent_rate: 学生处于请假状态的概率
+
+    Returns:
+        {'classes': [{'id', 'students': [{'id', 'name', 'status'}], 'courses': [course_id], 'active_course'}],
+         'counts': {...}}
+    """
+    m = app_module
+    db = m.db
+    rng = random.Random(seed)
+    layout = {'classes': [], 'counts': {'classes': 0, 'students': 0, 'courses': 0, 'rounds': 0, 'submissions': 0}}
+    counts = layout['counts']
+
+    for ci in range(classes):
+        class_obj = m.Class(id=_uuid(rng), name=f'基准班级{ci + 1}', description='benchmark',
+                            is_active=True, created_date=BASE_TIME)
+        db.session.add(class_obj)
+        class_info = {'id': class_obj.id, 'students': [], 'courses': [], 'active_course': None}
+        student_rows = []
+        for si in range(students):
+            status = 'absent' if rng.random() < absent_rate else 'active'
+            student = m.Student(id=_uuid(rng), name=f'学生{ci + 1}-{si + 1:02d}', class_id=class_obj.id,
+                                status=status, created_date=BASE_TIME)
+            student_rows.append(student)
+            class_info['students'].append({'id': student.id, 'name': student.name, 'status': status})
+        db.session.add_all(student_rows)
+        counts['classes'] += 1
+        counts['students'] += len(student_rows)
+
+        for ki in range(courses):
+            is_active = ki == courses - 1
+            started = BASE_TIME + timedelta(days=7 * ki, hours=ci)
+            course = m.Course(id=_uuid(rng), class_id=class_obj.id, name=f'第{ki + 1}节课',
+                              is_active=is_active, current_round=rounds if is_active else rounds + 1,
+                              created_at=started,
+                              ended_at=None if is_active else started + timedelta(minutes=45))
+            db.session.add(course)
+            class_info['courses'].append(course.id)
+            if is_active:
+                class_info['active_course'] = course.id
+            counts['courses'] += 1
+
+            db.session.add_all([
+                m.CourseAttendance(id=_uuid(rng), course_id=course.id, student_id=student.id,
+                                   is_absent=student.status != 'active', created_at=started)
+                for student in student_rows
+            ])
+
+            for rn in range(1, rounds + 1):
+                correct_answer = str(rng.randint(1, 99))
+                question_score = rng.choice((1, 1, 2, 3))
+                # 进行中课程的最后一轮尚未评判
+                judged = not (is_active and rn == rounds)
+                if judged:
+                    db.session.add(m.CourseRound(id=_uuid(rng), course_id=course.id, round_number=rn,
+                                                 correct_answer=correct_answer, question_score=question_score,
+                                                 is_completed=True,
+                                                 created_at=started + timedelta(minutes=3 * rn)))
+                    counts['rounds'] += 1
+                submissions = []
+                for student in student_rows:
+                    if student.status != 'active' or rng.random() >= participation:
+                        continue
+                    right = rng.random() < accuracy
+                    answer = correct_answer if right else str(rng.randint(100, 199))
+                    submission = m.StudentSubmission(
+                        id=_uuid(rng), student_id=student.id, course_id=course.id, round_number=rn,
+                        answer=answer, is_correct=judged and right,
+                        answer_time=round(rng.uniform(2, 40), 1),
+                        created_at=started + timedelta(minutes=3 * rn, seconds=rng.randint(0, 120)),
+                        guess_count=0, copy_count=0, noisy_count=0, distracted_count=0, penalty_score=0
+                    )
+                    if rng.random() < behavior_rate:
+                        setattr(submission, rng.choice(BEHAVIORS), 1)
+                        submission.penalty_score = 3
+                        submission.is_correct = False
+                    submissions.append(submission)
+                db.session.add_all(submissions)
+                counts['submissions'] += len(submissions)
+        db.session.commit()
+
+        # 计分板与正常上课时一致
+        for course_id in class_info['courses']:
+            m.store_course_scores(course_id, m.aggregate_course_scores(course_id))
+        db.session.commit()
+        layout['classes'].append(class_info)
+
+    return layout
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+响应压缩
+课堂接口每次返回完整的学生数据，报告页面是带内联脚本的大HTML，家长多在手机网络下打开。
+按请求的 Accept-Encoding 选择编码（安装了 brotli 包时优先 br，否则 gzip），
+只压缩超过最小长度的文本类响应；static/ 下的文件在启动时压缩一次并保存在内存中。
+
+- 流式响应（SSE）、已编码的响应、非200响应和 Cache-Control: no-transform 的响应不压缩
+- 压缩后的响应把 ETag 改为弱 ETag（内容等价、字节不同），If-None-Match 按弱比较匹配
+"""
+
+import gzip
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'text/xml',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'
+}
+
+STATIC_EXTENSIONS = {'.html', '.css', '.js', '.json', '.svg', '.txt', '.xml'}
+
+
+def accepted_encodings(header):
+    """解析 Accept-Encoding，返回 {编码: q值}（q=0 表示拒绝）"""
+    accepted = {}
+    for part in (header or '').split(','):
+        fields = part.strip().split(';')
+        name = fields[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def choose_encoding(header, available):
+    """按 q 值从 available（优先级从高到低）中选择编码，都不接受时返回 None"""
+    accepted = accepted_encodings(header)
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class ResponseCompressor:
+    """Flask 响应压缩
+
+    Args:
+        min_size: 小于该字节数的响应不压缩（压缩收益抵不上 CPU 和头部开销）
+        gzip_level: 动态响应的 gzip 级别
+        brotli_quality: 动态响应的 brotli 质量（静态文件启动时用最高质量压缩一次）
+        use_brotli: 是否使用 brotli（需要安装 brotli 包）
+    """
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4, use_brotli=True):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ('br', 'gzip') if use_brotli and brotli is not None else ('gzip',)
+        self._static = {}  # 相对路径 -> {'mtime', 'size', 编码: 压缩后的字节}
+        self._lock = threading.Lock()
+        self.compressed = 0
+        self.static_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def init_app(self, app):
+        """启动时压缩静态文件，并注册 after_request 钩子"""
+        if app.static_folder:
+            self.precompress_static(app.static_folder)
+        app.after_request(self._after_request)
+
+    def compress(self, data, encoding, quality=None):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality if quality is None else quality)
+        # mtime=0：同样的内容压缩结果相同
+        return gzip.compress(data, compresslevel=self.gzip_level if quality is None else quality, mtime=0)
+
+    # ---------- 静态文件 ----------
+
+    def precompress_static(self, folder):
+        """压缩目录下的文本类静态文件（只保留比原文件小的结果），返回压缩的文件数"""
+        count = 0
+        for root, _, files in os.walk(folder):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.splitext(name)[1].lower() not in STATIC_EXTENSIONS:
+                    continue
+                try:
+                    stat = os.stat(path)
+                    if stat.st_size < self.min_size:
+                        continue
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                entry = {'mtime': stat.st_mtime, 'size': stat.st_size}
+                for encoding in self.encodings:
+                    compressed = self.compress(data, encoding, quality=11 if encoding == 'br' else 9)
+                    if len(compressed) < len(data):
+                        entry[encoding] = compressed
+                relative = os.path.relpath(path, folder).replace(os.sep, '/')
+                with self._lock:
+                    self._static[relative] = entry
+                count += 1
+        if count:
+            print(f"✅ 已预压缩 {count} 个静态文件")
+        return count
+
+    def _static_variant(self, filename, encoding, folder):
+        with self._lock:
+            entry = self._static.get(filename)
+        if not entry or encoding not in entry:
+            return None
+        # 文件在运行期间被替换时不再使用旧的压缩结果
+        try:
+            stat = os.stat(os.path.join(folder, filename))
+        except OSError:
+            return None
+        if stat.st_mtime != entry['mtime'] or stat.st_size != entry['size']:
+            return None
+        return entry[encoding]
+
+    # ---------- 请求钩子 ----------
+
+    def _after_request(self, response):
+        from flask import current_app, request
+        if (response.status_code != 200 or request.method not in ('GET', 'POST')
+                or 'Content-Encoding' in response.headers or 'Range' in request.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES
+                or 'no-transform' in (response.headers.get('Cache-Control') or '')):
+            return response
+
+        if request.endpoint == 'static':
+            filename = (request.view_args or {}).get('filename', '')
+            if filename not in self._static:
+                return response
+            response.vary.add('Accept-Encoding')
+            encoding = choose_encoding(request.headers.get('Accept-Encoding'), self.encodings)
+            data = self._static_variant(filename, encoding, current_app.static_folder) if encoding else None
+            if data is None:
+                return response
+            response.close()
+            response.direct_passthrough = False
+            with self._lock:
+                self.static_hits += 1
+            return self._encoded(response, data, encoding, self._static[filename]['size'])
+
+        if response.is_streamed or response.direct_passthrough:
+            return response
+        length = response.calculate_content_length()
+        if length is None or length < self.min_size:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'), self.encodings)
+        if not encoding:
+            return response
+        body = response.get_data()
+        return self._encoded(response, self.compress(body, encoding), encoding, len(body))
+
+    def _encoded(self, response, data, encoding, original_size):
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        with self._lock:
+            self.compressed += 1
+            self.bytes_in += original_size
+            self.bytes_out += len(data)
+        return response
+
+    def stats(self):
+        """统计信息"""
+        return {
+            'encodings': list(self.encodings),
+            'min_size': self.min_size,
+            'static_files': len(self._static),
+            'compressed': self.compressed,
+            'static_hits': self.static_hits,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None
+        }
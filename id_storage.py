@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+UUID 主键/外键的存储方式
+- text（默认）：VARCHAR(36) 字符串，与历史数据库一致
+- native：PostgreSQL 使用原生 UUID 类型，SQLite 使用 16 字节 BLOB；
+  每个ID从 36 字节降到 16 字节，student_submissions 等表的行和索引明显变小
+
+无论哪种存储方式，Python 代码中的ID始终是 36 位小写字符串（GUID 类型负责转换）。
+
+已有数据库用 convert_storage() 分批转换（flask --app app convert-ids --to native）：
+- PostgreSQL：给每个ID列加一个目标类型的影子列，用触发器同步转换期间新写入的行，
+  再分批回填（每批一个短事务，应用照常读写）；然后在影子列上用 CREATE INDEX CONCURRENTLY 建好
+  主键、唯一约束和普通索引对应的索引，用 NOT VALID + VALIDATE 的 CHECK 约束确认影子列非空（都不阻塞读写）；
+  最后锁表的事务中只替换列、把建好的索引挂为约束、以 NOT VALID 方式加外键（都不扫描整表），
+  提交后再逐个 VALIDATE 外键。替换完成后以 UUID_STORAGE=native 重启应用
+- SQLite：逐表重建（分批复制到新表后替换旧表），转换期间应停止应用
+
+含表达式且涉及ID列的索引无法自动重建，转换开始前报错（先删除该索引，转换后手动重建）。
+"""
+
+import re
+import uuid
+
+from sqlalchemy import LargeBinary, MetaData, String, Uuid, inspect, literal_column, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.types import TypeDecorator
+
+STORAGES = ('text', 'native')
+
+# 转换过程中使用的影子列/临时表后缀
+CONVERT_SUFFIX = '__conv'
+
+# PostgreSQL 标识符的最大长度
+PG_MAX_IDENTIFIER = 63
+
+
+class StorageMismatch(RuntimeError):
+    """数据库中ID的存储方式与 UUID_STORAGE 不一致"""
+
+
+class GUID(TypeDecorator):
+    """UUID 主键/外键类型：Python 中始终是 36 位小写字符串
+
+    Args:
+        native: True 时 PostgreSQL 存为 UUID、其他数据库存为 16 字节 BLOB；False 时存为 VARCHAR(36)
+    """
+
+    impl = String(36)
+    cache_ok = True
+
+    def __init__(self, native=False):
+        super().__init__()
+        self.native = native
+
+    def load_dialect_impl(self, dialect):
+        if not self.native:
+            return dialect.type_descriptor(String(36))
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not self.native:
+            return value
+        try:
+            parsed = value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+        except ValueError:
+            # 不是合法的UUID（例如URL中的错误ID）：按不存在的ID处理
+            return None
+        return str(parsed) if dialect.name == 'postgresql' else parsed.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None or not self.native:
+            return value
+        return to_text(value)
+
+
+def to_text(value):
+    """把数据库中的ID（字符串、UUID 或 16 字节）转换为 36 位小写字符串"""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # 读取大量行时每个ID都要转换，直接切分十六进制串（比 str(uuid.UUID(bytes=...)) 快数倍）
+        h = bytes(value).hex()
+        return f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+    if isinstance(value, str):
+        return value.lower()
+    return str(value)
+
+
+def guid_columns(metadata):
+    """按建表顺序返回 {表名: [GUID 列名]}"""
+    result = {}
+    for table in metadata.sorted_tables:
+        names = [column.name for column in table.columns if isinstance(column.type, GUID)]
+        if names:
+            result[table.name] = names
+    return result
+
+
+def _reflected_storage(inspector, table_name, column_name):
+    for column in inspector.get_columns(table_name):
+        if column['name'] == column_name:
+            if isinstance(column['type'], (Uuid, LargeBinary)):
+                return 'native'
+            return 'text'
+    return None
+
+
+def detect_storage(engine, metadata):
+    """数据库中ID的实际存储方式（'text' / 'native'），还没有建表时返回 None"""
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        for table_name, names in guid_columns(metadata).items():
+            if inspector.has_table(table_name):
+                return _reflected_storage(inspector, table_name, names[0])
+    return None
+
+
+def check_storage(engine, metadata, expected):
+    """数据库中ID的存储方式与 expected 不一致时抛出 StorageMismatch（还没有建表时不检查）"""
+    storage = detect_storage(engine, metadata)
+    if storage and storage != expected:
+        raise StorageMismatch(
+            f'数据库ID存储方式为 {storage}，与 UUID_STORAGE={expected} 不一致；'
+            f'请先执行: UUID_STORAGE={storage} flask --app app convert-ids --to {expected}，完成后再重启应用'
+        )
+
+
+def convert_storage(engine, metadata, target, batch_size=1000, log=print):
+    """把数据库中所有 GUID 列转换为目标存储方式，返回转换的表名列表（已是目标方式的表跳过）"""
+    if target not in STORAGES:
+        raise ValueError(f'未知的存储方式: {target}')
+    columns = guid_columns(metadata)
+    if engine.dialect.name == 'postgresql':
+        return _convert_postgresql(engine, columns, target, batch_size, log)
+    if engine.dialect.name == 'sqlite':
+        return _convert_sqlite(engine, metadata, columns, target, batch_size, log)
+    raise RuntimeError(f'不支持转换 {engine.dialect.name} 数据库的ID存储方式')
+
+
+# ---------- PostgreSQL：影子列 + 触发器 + 分批回填 ----------
+
+def _expression_index_error(table, index):
+    return RuntimeError(
+        f'索引 {index["name"]}（{table}）含表达式且涉及ID列，无法自动重建：'
+        f'请先删除该索引，转换完成后再手动创建'
+    )
+
+
+def _index_involves(index, table_columns):
+    """索引是否涉及待转换的列；含表达式的索引涉及这些列时无法按列名重建，直接报错"""
+    names = index['column_names']
+    involved = any(name in table_columns for name in names if name)
+    expressions = [expression for expression in index.get('expressions') or [] if expression]
+    if any(re.search(rf'\b{re.escape(name)}\b', expression) for expression in expressions for name in table_columns):
+        involved = True
+    if involved and None in names:
+        return None
+    return involved
+
+
+def _constraints_involving(inspector, tables, columns):
+    """记录涉及待转换列的主键、唯一约束、索引和外键（DROP COLUMN ... CASCADE 后按原样重建）"""
+    converted = {(table, name) for table in tables for name in columns[table]}
+    saved = {'primary_keys': [], 'uniques': [], 'indexes': [], 'foreign_keys': []}
+    for table in inspector.get_table_names():
+        pk = inspector.get_pk_constraint(table)
+        if any((table, name) in converted for name in pk.get('constrained_columns') or []):
+            saved['primary_keys'].append((table, pk))
+        for unique in inspector.get_unique_constraints(table):
+            if any((table, name) in converted for name in unique['column_names']):
+                saved['uniques'].append((table, unique))
+        for index in inspector.get_indexes(table):
+            if index.get('duplicates_constraint'):
+                continue
+            involved = _index_involves(index, columns[table] if table in tables else [])
+            if involved is None:
+                raise _expression_index_error(table, index)
+            if involved:
+                saved['indexes'].append((table, index))
+        for fk in inspector.get_foreign_keys(table):
+            if any((table, name) in converted for name in fk['constrained_columns']) or \
+                    any((fk['referred_table'], name) in converted for name in fk['referred_columns']):
+                saved['foreign_keys'].append((table, fk))
+    return saved
+
+
+def _shadow_name(name):
+    """影子列上的索引/约束名（超过 PostgreSQL 标识符长度时截断原名）"""
+    return name[:PG_MAX_IDENTIFIER - len(CONVERT_SUFFIX)] + CONVERT_SUFFIX
+
+
+def _shadow_columns(table, names, columns):
+    return ', '.join(f'{name}{CONVERT_SUFFIX}' if name in columns.get(table, ()) else name for name in names)
+
+
+def _create_index_concurrently(ddl, name, table, column_list, unique=False):
+    """在 autocommit 连接上用 CREATE INDEX CONCURRENTLY 建索引（不阻塞读写）；上次中断留下的无效索引先删除"""
+    valid = ddl.execute(text(
+        'SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name'
+    ), {'name': name}).scalar()
+    if valid is True:
+        return
+    if valid is False:
+        ddl.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+    unique_sql = 'UNIQUE ' if unique else ''
+    ddl.execute(text(f'CREATE {unique_sql}INDEX CONCURRENTLY {name} ON {table} ({column_list})'))
+
+
+def _convert_postgresql(engine, columns, target, batch_size, log):
+    target_type = 'UUID' if target == 'native' else 'VARCHAR(36)'
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        tables = [
+            table for table in columns
+            if inspector.has_table(table) and _reflected_storage(inspector, table, columns[table][0]) != target
+        ]
+        if not tables:
+            return []
+        converting = {table: columns[table] for table in tables}
+        nullable = {
+            (table, column['name']): column['nullable']
+            for table in tables for column in inspector.get_columns(table)
+        }
+        # 先记录需要重建的约束和索引（含表达式的索引在修改任何数据之前报错）
+        saved = _constraints_involving(inspector, tables, columns)
+        conn.commit()
+
+        # 1. 影子列和同步触发器（转换期间新写入/修改的行由触发器填写影子列）
+        for table in tables:
+            for name in columns[table]:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {name}{CONVERT_SUFFIX} {target_type}'))
+            assignments = ' '.join(
+                f'NEW.{name}{CONVERT_SUFFIX} := CAST(NEW.{name} AS {target_type});' for name in columns[table]
+            )
+            conn.execute(text(
+                f'CREATE OR REPLACE FUNCTION {table}{CONVERT_SUFFIX}_sync() RETURNS trigger AS $$ '
+                f'BEGIN {assignments} RETURN NEW; END $$ LANGUAGE plpgsql'
+            ))
+            conn.execute(text(f'DROP TRIGGER IF EXISTS {table}{CONVERT_SUFFIX}_sync ON {table}'))
+            conn.execute(text(
+                f'CREATE TRIGGER {table}{CONVERT_SUFFIX}_sync BEFORE INSERT OR UPDATE ON {table} '
+                f'FOR EACH ROW EXECUTE FUNCTION {table}{CONVERT_SUFFIX}_sync()'
+            ))
+            conn.commit()
+
+        # 2. 分批回填已有的行（每批一个短事务）
+        for table in tables:
+            assignments = ', '.join(
+                f'{name}{CONVERT_SUFFIX} = CAST({name} AS {target_type})' for name in columns[table]
+            )
+            pending = ' OR '.join(
+                f'({name}{CONVERT_SUFFIX} IS NULL AND {name} IS NOT NULL)' for name in columns[table]
+            )
+            total = 0
+            while True:
+                updated = conn.execute(text(
+                    f'UPDATE {table} SET {assignments} WHERE ctid = ANY(ARRAY('
+                    f'SELECT ctid FROM {table} WHERE {pending} LIMIT :batch_size))'
+                ), {'batch_size': batch_size}).rowcount
+                conn.commit()
+                total += updated
+                if updated == 0:
+                    break
+                log(f"  {table}: 已回填 {total} 行")
+
+        # 3. 锁表之前在影子列上建好索引、确认非空（不阻塞读写）：
+        #    主键/唯一约束先建唯一索引，替换时用 USING INDEX 挂为约束；
+        #    NOT NULL 先用已验证的 CHECK 约束证明，替换时 SET NOT NULL 不再扫描整表
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as ddl:
+            for table, pk in saved['primary_keys']:
+                _create_index_concurrently(ddl, _shadow_name(pk['name']), table,
+                                           _shadow_columns(table, pk['constrained_columns'], converting), unique=True)
+                log(f"  {table}: 已建好主键索引")
+            for table, unique in saved['uniques']:
+                _create_index_concurrently(ddl, _shadow_name(unique['name']), table,
+                                           _shadow_columns(table, unique['column_names'], converting), unique=True)
+            for table, index in saved['indexes']:
+                _create_index_concurrently(ddl, _shadow_name(index['name']), table,
+                                           _shadow_columns(table, index['column_names'], converting),
+                                           unique=bool(index.get('unique')))
+                log(f"  {table}: 已建好索引 {index['name']}")
+            for table in tables:
+                for name in columns[table]:
+                    if nullable.get((table, name), True):
+                        continue
+                    check_name = _shadow_name(f'{table}_{name}_nn')
+                    exists = ddl.execute(text('SELECT 1 FROM pg_constraint WHERE conname = :name'),
+                                         {'name': check_name}).first()
+                    if not exists:
+                        ddl.execute(text(
+                            f'ALTER TABLE {table} ADD CONSTRAINT {check_name} '
+                            f'CHECK ({name}{CONVERT_SUFFIX} IS NOT NULL) NOT VALID'
+                        ))
+                    ddl.execute(text(f'ALTER TABLE {table} VALIDATE CONSTRAINT {check_name}'))
+
+        # 4. 在一个事务中替换列（短暂锁表；只修改目录，不扫描、不建索引）
+        conn.execute(text(f'LOCK TABLE {", ".join(tables)} IN ACCESS EXCLUSIVE MODE'))
+        for table in tables:
+            conn.execute(text(f'DROP TRIGGER IF EXISTS {table}{CONVERT_SUFFIX}_sync ON {table}'))
+            conn.execute(text(f'DROP FUNCTION IF EXISTS {table}{CONVERT_SUFFIX}_sync()'))
+            for name in columns[table]:
+                conn.execute(text(f'ALTER TABLE {table} DROP COLUMN {name} CASCADE'))
+                conn.execute(text(f'ALTER TABLE {table} RENAME COLUMN {name}{CONVERT_SUFFIX} TO {name}'))
+                if not nullable.get((table, name), True):
+                    check_name = _shadow_name(f'{table}_{name}_nn')
+                    conn.execute(text(f'ALTER TABLE {table} ALTER COLUMN {name} SET NOT NULL'))
+                    conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT {check_name}'))
+        for table, pk in saved['primary_keys']:
+            conn.execute(text(
+                f'ALTER TABLE {table} ADD CONSTRAINT {pk["name"]} PRIMARY KEY USING INDEX {_shadow_name(pk["name"])}'
+            ))
+        for table, unique in saved['uniques']:
+            conn.execute(text(
+                f'ALTER TABLE {table} ADD CONSTRAINT {unique["name"]} UNIQUE USING INDEX {_shadow_name(unique["name"])}'
+            ))
+        for table, index in saved['indexes']:
+            conn.execute(text(f'ALTER INDEX {_shadow_name(index["name"])} RENAME TO {index["name"]}'))
+        for table, fk in saved['foreign_keys']:
+            ondelete = (fk.get('options') or {}).get('ondelete')
+            conn.execute(text(
+                f'ALTER TABLE {table} ADD CONSTRAINT {fk["name"]} FOREIGN KEY ({", ".join(fk["constrained_columns"])}) '
+                f'REFERENCES {fk["referred_table"]} ({", ".join(fk["referred_columns"])})'
+                + (f' ON DELETE {ondelete}' if ondelete else '') + ' NOT VALID'
+            ))
+        conn.commit()
+        log(f"✅ 已替换 {len(tables)} 张表的ID列")
+
+        # 5. 逐个验证外键（SHARE UPDATE EXCLUSIVE 锁，不阻塞读写）
+        for table, fk in saved['foreign_keys']:
+            conn.execute(text(f'ALTER TABLE {table} VALIDATE CONSTRAINT {fk["name"]}'))
+            conn.commit()
+        if saved['foreign_keys']:
+            log(f"✅ 已验证 {len(saved['foreign_keys'])} 个外键")
+    return tables
+
+
+# ---------- SQLite：逐表重建 ----------
+
+def _convert_sqlite(engine, metadata, columns, target, batch_size, log):
+    native = target == 'native'
+    # 复制整个模型定义，保证新表的外键能解析到被引用的表；
+    # 旧表按当前存储方式读取（ID得到字符串、日期得到 datetime），再按目标存储方式写入新表
+    target_metadata = MetaData()
+    source_metadata = MetaData()
+    for table in metadata.sorted_tables:
+        table.to_metadata(target_metadata)
+        table.to_metadata(source_metadata)
+    converted = []
+    for table_name, names in columns.items():
+        with engine.connect() as conn:
+            inspector = inspect(conn)
+            if not inspector.has_table(table_name) or _reflected_storage(inspector, table_name, names[0]) == target:
+                continue
+            # 按原始语句重建索引（包括含表达式的索引；约束自带的索引由新表的定义创建）
+            indexes = conn.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"
+            ), {'table': table_name}).scalars().all()
+            existing = {column['name'] for column in inspector.get_columns(table_name)}
+            temp_name = f'{table_name}{CONVERT_SUFFIX}'
+            new_table = metadata.tables[table_name].to_metadata(target_metadata, name=temp_name)
+            source_table = source_metadata.tables[table_name]
+            for name in names:
+                new_table.c[name].type = GUID(native=native)
+                source_table.c[name].type = GUID(native=not native)
+            copy_columns = [column.name for column in new_table.columns if column.name in existing]
+            rowid = literal_column('rowid')
+
+            conn.execute(text(f'DROP TABLE IF EXISTS {temp_name}'))
+            conn.execute(CreateTable(new_table))
+            conn.commit()
+
+            last_rowid, total = 0, 0
+            while True:
+                rows = conn.execute(
+                    select(rowid.label('_rowid'), *[source_table.c[name] for name in copy_columns])
+                    .where(rowid > last_rowid).order_by(rowid).limit(batch_size)
+                ).mappings().all()
+                if not rows:
+                    break
+                conn.execute(new_table.insert(), [{name: row[name] for name in copy_columns} for row in rows])
+                conn.commit()
+                last_rowid = rows[-1]['_rowid']
+                total += len(rows)
+                log(f"  {table_name}: 已复制 {total} 行")
+
+            # 替换旧表放在一个显式事务中（pysqlite 不会为 DDL 自动开启事务），中断时旧表保持不变
+            conn.exec_driver_sql('BEGIN')
+            conn.execute(text(f'DROP TABLE {table_name}'))
+            conn.execute(text(f'ALTER TABLE {temp_name} RENAME TO {table_name}'))
+            for index_sql in indexes:
+                conn.exec_driver_sql(index_sql)
+            conn.commit()
+            converted.append(table_name)
+            log(f"✅ {table_name}: 已转换为 {target} 存储")
+    return converted
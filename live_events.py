@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+课堂实时事件推送（Server-Sent Events）
+提交数量、评判结果、轮次变化等事件通过事件代理（broker）分发给订阅的浏览器
+
+- InProcessBroker：默认实现，只在本进程内分发（单 worker 或开发环境）
+- PostgresNotifyBroker：通过 PostgreSQL LISTEN/NOTIFY 在多个 gunicorn worker 之间分发
+
+gunicorn 使用线程 worker 时，每个 SSE 连接会占用一个线程，
+所以每条连接只保持一段时间（浏览器会自动重连并通过 Last-Event-ID 补发错过的事件），
+并且用 StreamLimiter 限制每个进程同时打开的连接数
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+
+
+def make_message(event, data):
+    """构造事件消息（id 使用纳秒时间戳，跨进程也大致有序）"""
+    return {'id': str(time.time_ns()), 'event': event, 'data': data}
+
+
+def format_sse(message):
+    """把事件消息格式化为 SSE 文本"""
+    data = json.dumps(message['data'], ensure_ascii=False)
+    return f"id: {message['id']}\nevent: {message['event']}\ndata: {data}\n\n"
+
+
+def _event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class InProcessBroker:
+    """进程内事件代理"""
+
+    def __init__(self, history_size=50, queue_size=100):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # channel -> {queue.Queue}
+        self._history = defaultdict(lambda: deque(maxlen=history_size))
+        self._queue_size = queue_size
+
+    def start(self):
+        """开始接收事件（进程内代理不需要）"""
+
+    def publish(self, channel, event, data):
+        """发布事件"""
+        message = make_message(event, data)
+        self._dispatch(channel, message)
+        return message
+
+    def _dispatch(self, channel, message):
+        """把消息推送给本进程内该频道的所有订阅者"""
+        with self._lock:
+            self._history[channel].append(message)
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # 客户端消费太慢，丢弃该消息（重连时可从历史中补发）
+                pass
+
+    def subscribe(self, channel):
+        """订阅频道，返回消息队列"""
+        subscriber = queue.Queue(maxsize=self._queue_size)
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        """取消订阅"""
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def history_since(self, channel, last_event_id):
+        """返回 id 大于 last_event_id 的历史消息（用于断线重连补发）"""
+        if not last_event_id:
+            return []
+        last_id = _event_id(last_event_id)
+        with self._lock:
+            return [m for m in self._history.get(channel, ()) if _event_id(m['id']) > last_id]
+
+    def stats(self):
+        """订阅统计"""
+        with self._lock:
+            return {
+                'broker': type(self).__name__,
+                'channels': len(self._subscribers),
+                'subscribers': sum(len(s) for s in self._subscribers.values())
+            }
+
+
+class PostgresNotifyBroker(InProcessBroker):
+    """基于 PostgreSQL LISTEN/NOTIFY 的跨进程事件代理
+
+    发布时执行 pg_notify，每个进程启动一个监听线程（start() 或第一次订阅时），
+    使用一条脱离连接池的独立连接接收通知，记入本进程的历史并分发给本进程的订阅者：
+    监听启动后其他进程发布的事件也在本进程的历史中，浏览器重连到任意进程都能补发
+    """
+
+    # NOTIFY 的消息体上限为 8000 字节
+    MAX_PAYLOAD = 7900
+
+    def __init__(self, engine_getter, pg_channel='classroom_events', poll_interval=0.25, **kwargs):
+        super().__init__(**kwargs)
+        self._engine_getter = engine_getter
+        self._pg_channel = pg_channel
+        self._poll_interval = poll_interval
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, channel, event, data):
+        from sqlalchemy import text
+        message = make_message(event, data)
+        payload = json.dumps({'channel': channel, 'message': message}, ensure_ascii=False)
+        if len(payload.encode('utf-8')) > self.MAX_PAYLOAD:
+            # 消息太大：只通知客户端重新拉取数据
+            message = dict(message, data={'reload': True})
+            payload = json.dumps({'channel': channel, 'message': message}, ensure_ascii=False)
+        with self._engine_getter().begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                         {'channel': self._pg_channel, 'payload': payload})
+        return message
+
+    def start(self):
+        listener = self._listener
+        if listener is None or not listener.is_alive():
+            self._ensure_listener()
+
+    def subscribe(self, channel):
+        self.start()
+        return super().subscribe(channel)
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                engine = self._engine_getter()
+                self._listener = threading.Thread(
+                    target=self._listen, args=(engine,), name='pg-event-listener', daemon=True
+                )
+                self._listener.start()
+
+    def _listen(self, engine):
+        """监听线程：断线后自动重连"""
+        while True:
+            raw = None
+            try:
+                raw = engine.raw_connection()
+                # 脱离连接池，避免长期占用池中的连接
+                raw.detach()
+                dbapi_conn = getattr(raw, 'driver_connection', None) or raw.connection
+                dbapi_conn.autocommit = True
+                cursor = dbapi_conn.cursor()
+                cursor.execute(f'LISTEN "{self._pg_channel}"')
+                print(f"✅ 实时事件监听已启动（频道 {self._pg_channel}）")
+                while True:
+                    # pg8000 在执行语句时接收通知，定期执行轻量查询来收取通知
+                    cursor.execute("SELECT 1")
+                    while dbapi_conn.notifications:
+                        _, _, payload = dbapi_conn.notifications.popleft()
+                        try:
+                            envelope = json.loads(payload)
+                            self._dispatch(envelope['channel'], envelope['message'])
+                        except (ValueError, KeyError, TypeError):
+                            continue
+                    time.sleep(self._poll_interval)
+            except Exception as e:
+                print(f"⚠️ 实时事件监听中断，1秒后重连: {type(e).__name__}: {str(e)}")
+                time.sleep(1)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+
+
+class StreamLimiter:
+    """限制每个进程同时打开的 SSE 连接数（每条连接占用一个 worker 线程）"""
+
+    def __init__(self, max_streams):
+        self.max_streams = max_streams
+        self._semaphore = threading.BoundedSemaphore(max_streams)
+
+    def acquire(self):
+        return self._semaphore.acquire(blocking=False)
+
+    def release(self):
+        try:
+            self._semaphore.release()
+        except ValueError:
+            pass
+
+
+def sse_stream(broker, channel, last_event_id=None, max_duration=25, heartbeat=10, retry_ms=1000):
+    """SSE 响应生成器：补发错过的事件，然后推送新事件，定期发送心跳，超时后结束让浏览器重连"""
+    subscriber = broker.subscribe(channel)
+    try:
+        yield f"retry: {retry_ms}\n\n"
+        last_sent = _event_id(last_event_id)
+        for message in broker.history_since(channel, last_event_id):
+            last_sent = max(last_sent, _event_id(message['id']))
+            yield format_sse(message)
+        deadline = time.monotonic() + max_duration
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                message = subscriber.get(timeout=min(heartbeat, remaining))
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            # 订阅与补发之间可能收到重复消息
+            if _event_id(message['id']) <= last_sent:
+                continue
+            last_sent = _event_id(message['id'])
+            yield format_sse(message)
+    finally:
+        broker.unsubscribe(channel, subscriber)
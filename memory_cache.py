@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+进程内缓存
+提供带容量上限（LRU淘汰）和过期时间（TTL）的线程安全缓存，并统计命中/未命中次数
+
+注意：gunicorn 每个 worker 进程各有一份缓存，写操作只能失效本进程的缓存，
+其他 worker 中的旧数据最多保留 TTL 时长，因此 TTL 应设置得较短
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# 所有已创建的缓存（用于统计接口）
+_registry = []
+_registry_lock = threading.Lock()
+
+
+class LRUTTLCache:
+    """LRU + TTL 缓存"""
+
+    def __init__(self, name, maxsize=128, ttl=5.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        with _registry_lock:
+            _registry.append(self)
+
+    def get(self, key, default=None):
+        """读取缓存，未命中或已过期返回 default"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """写入缓存；ttl 为 None 时使用默认过期时间，ttl <= 0 表示永不过期"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl and ttl > 0 else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """失效单个key"""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_where(self, predicate):
+        """失效所有满足 predicate(key, value) 的key"""
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+            for key in keys:
+                del self._data[key]
+            self.invalidations += len(keys)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        """统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total * 100, 1) if total else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+def all_cache_stats():
+    """所有缓存的统计信息"""
+    with _registry_lock:
+        caches = list(_registry)
+    return [cache.stats() for cache in caches]
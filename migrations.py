@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+数据库结构版本管理
+每个迁移有一个递增的版本号，已执行的版本记录在 schema_version 表中：
+- worker 启动时只需查询一次版本号判断结构是否最新，不再执行任何DDL
+- 迁移通过命令行执行一次：flask --app app migrate-db（查看状态：flask --app app schema-status）
+
+新增迁移：在 MIGRATIONS 末尾追加 (版本号, 说明, 函数)，函数接收 (conn, metadata)，
+需要对“表已由 create_all 按最新模型创建”的情况保持幂等
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+
+_metadata = MetaData()
+
+schema_version = Table(
+    'schema_version', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+# PostgreSQL advisory lock 的键（防止多个进程同时执行迁移）
+MIGRATION_LOCK_KEY = 20251001
+
+# 回填数据时每批处理的行数
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _column_names(conn, table_name):
+    inspector = inspect(conn)
+    if not inspector.has_table(table_name):
+        return None
+    return {column['name'] for column in inspector.get_columns(table_name)}
+
+
+def add_column_if_missing(conn, table_name, column_name, ddl_type):
+    """表存在且缺少该字段时添加字段（SQLite 不支持 ADD COLUMN IF NOT EXISTS，先检查再添加）"""
+    columns = _column_names(conn, table_name)
+    if columns is None or column_name in columns:
+        return False
+    conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl_type}'))
+    print(f"✅ 已添加字段 {table_name}.{column_name}")
+    return True
+
+
+def create_index_if_missing(conn, name, table_name, columns, unique=False):
+    """创建索引（PostgreSQL 和 SQLite 都支持 IF NOT EXISTS）"""
+    unique_sql = 'UNIQUE ' if unique else ''
+    conn.execute(text(f'CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table_name}({", ".join(columns)})'))
+
+
+# ---------- 迁移 ----------
+
+def _create_tables(conn, metadata):
+    # 按当前模型创建缺少的表（已存在的表不受影响）
+    metadata.create_all(conn, checkfirst=True)
+
+
+def _submission_behavior_columns(conn, metadata):
+    for column_name in ('guess_count', 'copy_count', 'noisy_count', 'distracted_count', 'penalty_score'):
+        add_column_if_missing(conn, 'student_submissions', column_name, 'INTEGER DEFAULT 0')
+
+
+def _legacy_columns(conn, metadata):
+    # 早期版本通过单独脚本添加的字段
+    add_column_if_missing(conn, 'students', 'status', "VARCHAR(20) DEFAULT 'active'")
+    add_column_if_missing(conn, 'competition_goals', 'goal_date', 'DATE')
+
+
+def _query_indexes(conn, metadata):
+    create_index_if_missing(conn, 'idx_student_submissions_student_course', 'student_submissions', ['student_id', 'course_id'])
+    create_index_if_missing(conn, 'idx_student_submissions_course', 'student_submissions', ['course_id'])
+    create_index_if_missing(conn, 'idx_course_rounds_course_round', 'course_rounds', ['course_id', 'round_number'])
+    create_index_if_missing(conn, 'idx_course_attendances_student_course', 'course_attendances', ['student_id', 'course_id'])
+    create_index_if_missing(conn, 'idx_students_class_id', 'students', ['class_id'])
+    create_index_if_missing(conn, 'idx_courses_class_id', 'courses', ['class_id'])
+
+
+def _unique_submissions(conn, metadata):
+    # 先合并重复提交：保留最早的一条，违规次数相加、扣分取最大值
+    duplicates = conn.execute(text(
+        'SELECT student_id, course_id, round_number FROM student_submissions '
+        'GROUP BY student_id, course_id, round_number HAVING COUNT(*) > 1'
+    )).all()
+    affected_courses = set()
+    for student_id, course_id, round_number in duplicates:
+        rows = conn.execute(text(
+            'SELECT id, guess_count, copy_count, noisy_count, distracted_count, penalty_score '
+            'FROM student_submissions WHERE student_id = :student_id AND course_id = :course_id '
+            'AND round_number = :round_number ORDER BY created_at, id'
+        ), {'student_id': student_id, 'course_id': course_id, 'round_number': round_number}).all()
+        keep, extra = rows[0], rows[1:]
+        conn.execute(text(
+            'UPDATE student_submissions SET guess_count = :guess, copy_count = :copy, noisy_count = :noisy, '
+            'distracted_count = :distracted, penalty_score = :penalty WHERE id = :id'
+        ), {
+            'id': keep.id,
+            'guess': sum(row.guess_count or 0 for row in rows),
+            'copy': sum(row.copy_count or 0 for row in rows),
+            'noisy': sum(row.noisy_count or 0 for row in rows),
+            'distracted': sum(row.distracted_count or 0 for row in rows),
+            'penalty': max(row.penalty_score or 0 for row in rows)
+        })
+        for row in extra:
+            conn.execute(text('DELETE FROM student_submissions WHERE id = :id'), {'id': row.id})
+        affected_courses.add(course_id)
+    if affected_courses:
+        print(f"⚠️ 已合并 {len(duplicates)} 组重复提交，涉及 {len(affected_courses)} 节课程，"
+              f"请执行 flask --app app rebuild-course-scores 重建计分板")
+    create_index_if_missing(conn, 'uq_submissions_student_course_round', 'student_submissions',
+                            ['student_id', 'course_id', 'round_number'], unique=True)
+
+
+def _student_name_index(conn, metadata):
+    create_index_if_missing(conn, 'idx_students_class_name', 'students', ['class_id', 'name'])
+
+
+def _data_versions(conn, metadata):
+    datetime_type = 'TIMESTAMP' if conn.dialect.name == 'postgresql' else 'DATETIME'
+    for table_name in ('classes', 'courses'):
+        add_column_if_missing(conn, table_name, 'data_version', 'INTEGER DEFAULT 0')
+        add_column_if_missing(conn, table_name, 'data_updated_at', datetime_type)
+
+
+def _normalized_answers(conn, metadata):
+    # 标准化答案由 Python 计算（与 app.normalize_answer 一致），已有的提交按 id 分页回填，
+    # 每批只读取 BACKFILL_BATCH_SIZE 行（不一次性把整张表读入内存）
+    add_column_if_missing(conn, 'student_submissions', 'normalized_answer', 'VARCHAR(200)')
+    last_id, total = None, 0
+    while True:
+        # 第一页不带 id 条件（原生 UUID 存储的 id 不能与字符串比较）
+        after = '' if last_id is None else 'AND id > :last_id '
+        rows = conn.execute(text(
+            f'SELECT id, answer FROM student_submissions WHERE normalized_answer IS NULL {after}'
+            f'ORDER BY id LIMIT {BACKFILL_BATCH_SIZE}'
+        ), {'last_id': last_id}).all()
+        if not rows:
+            break
+        conn.execute(
+            text('UPDATE student_submissions SET normalized_answer = :normalized WHERE id = :id'),
+            [{'id': row.id, 'normalized': (row.answer or '').strip().lower()} for row in rows]
+        )
+        last_id = rows[-1].id
+        total += len(rows)
+    if total:
+        print(f"✅ 已回填 {total} 条提交的标准化答案")
+
+
+MIGRATIONS = [
+    (1, '按模型创建数据表', _create_tables),
+    (2, 'student_submissions 违规计数和扣分字段', _submission_behavior_columns),
+    (3, 'students.status 和 competition_goals.goal_date 字段', _legacy_columns),
+    (4, '常用查询索引', _query_indexes),
+    (5, '提交记录 (student_id, course_id, round_number) 唯一索引', _unique_submissions),
+    (6, 'students (class_id, name) 索引', _student_name_index),
+    (7, 'classes/courses 数据版本字段', _data_versions),
+    (8, 'student_submissions.normalized_answer 标准化答案', _normalized_answers),
+]
+
+
+# ---------- 版本管理 ----------
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(engine):
+    """已执行到的版本（schema_version 表不存在时返回 0；连接失败等其他错误直接抛出，不当作空数据库）"""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table('schema_version'):
+            return 0
+        return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+
+
+def applied_migrations(engine):
+    """已执行的迁移记录"""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table('schema_version'):
+            return []
+        rows = conn.execute(schema_version.select().order_by(schema_version.c.version)).all()
+    return [{'version': row.version, 'description': row.description, 'applied_at': row.applied_at} for row in rows]
+
+
+def pending_migrations(engine):
+    version = current_version(engine)
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def migrate(engine, metadata, target=None):
+    """执行未执行的迁移（每个迁移一个事务），返回执行的版本号列表"""
+    applied = []
+    with engine.connect() as conn:
+        is_postgres = conn.dialect.name == 'postgresql'
+        if is_postgres:
+            # 会话级锁，整个迁移过程使用同一条连接
+            conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            conn.commit()
+        try:
+            schema_version.create(conn, checkfirst=True)
+            conn.commit()
+            for version, description, upgrade in MIGRATIONS:
+                if target is not None and version > target:
+                    break
+                # 持有锁期间再检查一次，其他进程可能已经执行过
+                done = conn.execute(
+                    text('SELECT 1 FROM schema_version WHERE version = :version'), {'version': version}
+                ).first()
+                if done:
+                    conn.commit()
+                    continue
+                print(f"🔧 执行迁移 {version}: {description}")
+                try:
+                    upgrade(conn, metadata)
+                    conn.execute(schema_version.insert().values(
+                        version=version, description=description, applied_at=datetime.utcnow()
+                    ))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(version)
+        finally:
+            if is_postgres:
+                conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+                conn.commit()
+    return applied
+
+
+def drop_schema_version(engine):
+    """删除版本表（基准测试重建数据库时使用）"""
+    with engine.begin() as conn:
+        schema_version.drop(conn, checkfirst=True)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+键集分页（keyset pagination）
+历史数据按 (排序时间, id) 倒序分页，下一页的条件是 (排序时间, id) 小于上一页的最后一条：
+不使用 OFFSET，无论翻到第几页，每次查询都只读取一页的行。
+
+- 游标是上一页最后一条的 (排序时间, id)，编码为 URL 安全的字符串
+- 排序时间为空的旧数据按 1970-01-01 排在最后（排序表达式用 sort_key() 包装）
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import DateTime, and_, func, literal, or_
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class InvalidCursor(ValueError):
+    """游标格式错误"""
+
+
+def sort_key(*columns):
+    """排序时间表达式：依次取第一个非空的时间列，都为空时按 EPOCH"""
+    return func.coalesce(*columns, literal(EPOCH, DateTime))
+
+
+def encode_cursor(sort_value, row_id):
+    payload = json.dumps([(sort_value or EPOCH).isoformat(), str(row_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (排序时间, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        return datetime.fromisoformat(sort_value), str(row_id)
+    except Exception as e:
+        raise InvalidCursor(f'分页游标无效: {cursor}') from e
+
+
+def keyset_page(query, sort_expression, id_column, key, cursor=None, limit=20):
+    """按 (sort_expression, id_column) 倒序读取一页
+
+    Args:
+        query: 已经加好过滤条件的查询（不要带 order_by/limit）
+        sort_expression: 排序时间表达式（一般为 sort_key(...)）
+        id_column: 唯一的 id 列（时间相同时的次序）
+        key: 从结果行取得 (排序时间, id) 的函数，与 sort_expression 一致
+        cursor: 上一页返回的游标，None 表示第一页
+        limit: 每页条数
+
+    Returns:
+        (本页的行, 下一页的游标；没有下一页时为 None)
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            sort_expression < sort_value,
+            and_(sort_expression == sort_value, id_column < row_id)
+        ))
+    rows = query.order_by(sort_expression.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+请求级性能分析
+通过 SQLAlchemy 的 before_cursor_execute / after_cursor_execute 事件统计每个请求的
+SQL 查询次数、数据库总耗时、最慢的语句，以及重复执行的相同语句（N+1 查询）
+
+- 每个请求结束后生成一条记录，写入结构化日志（JSON，logger 名为 perf）
+- 最近的请求记录和按端点汇总的统计保存在进程内，供 /debug/perf 页面查看
+  （gunicorn 每个 worker 进程各自统计）
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger('perf')
+
+
+def _short_sql(statement, limit=300):
+    """压缩 SQL 中的空白并截断，用于日志和页面展示"""
+    statement = ' '.join(str(statement).split())
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+
+class RequestProfile:
+    """单个请求的查询统计"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.slowest = []  # [(耗时秒, SQL)]
+        self.finished = False
+
+    def record(self, statement, elapsed, keep_slowest):
+        self.query_count += 1
+        self.db_time += elapsed
+        self.statements[statement] += 1
+        self.slowest.append((elapsed, statement))
+        if len(self.slowest) > keep_slowest * 4:
+            self.slowest = sorted(self.slowest, reverse=True)[:keep_slowest]
+
+
+class QueryProfiler:
+    """Flask 请求级 SQL 分析中间件"""
+
+    def __init__(self, slow_request_ms=500, n_plus_one_threshold=5, keep_slowest=5, history_size=200):
+        self.slow_request_ms = slow_request_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.keep_slowest = keep_slowest
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=history_size)
+        self._endpoints = defaultdict(lambda: {
+            'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0,
+            'max_queries': 0, 'db_ms': 0.0, 'slow_requests': 0, 'n_plus_one_requests': 0
+        })
+
+    def init_app(self, app, engine, log_level='INFO'):
+        """注册 Flask 请求钩子和 SQLAlchemy 事件（engine 需要在应用上下文中获取）"""
+        from sqlalchemy import event
+        if not logger.handlers:
+            # 每条记录是一行 JSON，直接输出到标准错误（Render 会收集）
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.propagate = False
+        logger.setLevel(getattr(logging, str(log_level).upper(), logging.INFO))
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    # ---------- SQLAlchemy 事件 ----------
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('perf_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('perf_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if not has_request_context():
+            return
+        profile = g.get('perf_profile')
+        if profile is not None and not profile.finished:
+            profile.record(statement, elapsed, self.keep_slowest)
+
+    # ---------- Flask 钩子 ----------
+
+    def _before_request(self):
+        if request.endpoint != 'static':
+            g.perf_profile = RequestProfile()
+
+    def _after_request(self, response):
+        profile = g.get('perf_profile')
+        if profile is None or profile.finished:
+            return response
+        profile.finished = True
+        try:
+            entry = self._build_entry(profile, response)
+            self._store(entry)
+            self._log(entry)
+        except Exception as e:
+            print(f"⚠️ 性能统计失败: {str(e)}")
+        return response
+
+    def _build_entry(self, profile, response):
+        duration_ms = (time.perf_counter() - profile.started) * 1000
+        repeated = [
+            {'sql': _short_sql(sql), 'count': count}
+            for sql, count in profile.statements.most_common()
+            if count >= self.n_plus_one_threshold
+        ]
+        slowest = sorted(profile.slowest, reverse=True)[:self.keep_slowest]
+        return {
+            'ts': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint or '(404)',
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+            'query_count': profile.query_count,
+            'db_time_ms': round(profile.db_time * 1000, 2),
+            'slowest_queries': [{'sql': _short_sql(sql), 'ms': round(elapsed * 1000, 2)} for elapsed, sql in slowest],
+            'n_plus_one': repeated,
+            'slow': duration_ms >= self.slow_request_ms
+        }
+
+    def _store(self, entry):
+        with self._lock:
+            self._recent.append(entry)
+            stats = self._endpoints[f"{entry['method']} {entry['endpoint']}"]
+            stats['requests'] += 1
+            stats['total_ms'] += entry['duration_ms']
+            stats['max_ms'] = max(stats['max_ms'], entry['duration_ms'])
+            stats['queries'] += entry['query_count']
+            stats['max_queries'] = max(stats['max_queries'], entry['query_count'])
+            stats['db_ms'] += entry['db_time_ms']
+            if entry['slow']:
+                stats['slow_requests'] += 1
+            if entry['n_plus_one']:
+                stats['n_plus_one_requests'] += 1
+
+    def _log(self, entry):
+        line = json.dumps(dict(entry, event='request_profile'), ensure_ascii=False)
+        if entry['slow'] or entry['n_plus_one']:
+            logger.warning(line)
+        else:
+            logger.info(line)
+
+    # ---------- 查询接口 ----------
+
+    def endpoint_stats(self):
+        """按端点汇总的统计（平均耗时降序）"""
+        with self._lock:
+            items = list(self._endpoints.items())
+        result = []
+        for name, stats in items:
+            count = stats['requests'] or 1
+            result.append({
+                'endpoint': name,
+                'requests': stats['requests'],
+                'avg_ms': round(stats['total_ms'] / count, 2),
+                'max_ms': round(stats['max_ms'], 2),
+                'avg_queries': round(stats['queries'] / count, 1),
+                'max_queries': stats['max_queries'],
+                'avg_db_ms': round(stats['db_ms'] / count, 2),
+                'slow_requests': stats['slow_requests'],
+                'n_plus_one_requests': stats['n_plus_one_requests']
+            })
+        result.sort(key=lambda item: item['avg_ms'], reverse=True)
+        return result
+
+    def recent(self, limit=50, slow_only=False):
+        """最近的请求记录（最新的在前）"""
+        with self._lock:
+            entries = list(self._recent)
+        if slow_only:
+            entries = [entry for entry in entries if entry['slow'] or entry['n_plus_one']]
+        return list(reversed(entries))[:limit]
+
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self._recent.clear()
+            self._endpoints.clear()
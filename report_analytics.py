@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+学生课程报告分析
+报告中的每轮统计、作废轮次判定、班级平均、排名/百分位和速度等级都在这里计算：
+全班数据来自一次按 (学生, 轮次) 分组的聚合查询，其余全部是字典查找，
+网页版、移动端和打印版报告共用同一份结果
+
+- build_course_analytics：班级层面的统计（与具体学生无关，可以整节课共用）
+- build_student_analytics：在班级统计的基础上合并某个学生自己的数据
+"""
+
+from collections import defaultdict
+
+
+def query_round_cells(session, submission_model, course_id, student_ids):
+    """一次分组查询：按 (学生, 轮次) 聚合某课程的提交记录
+
+    Args:
+        session: 数据库会话
+        submission_model: StudentSubmission 模型
+        course_id: 课程ID
+        student_ids: 参与统计的学生（活跃学生）
+
+    Returns:
+        [{'student_id', 'round_number', 'submissions', 'correct_count',
+          'time_sum', 'time_count', 'answered_time_sum', 'answered_time_count'}]
+    """
+    from sqlalchemy import func, case, and_
+    student_ids = list(student_ids)
+    if not student_ids:
+        return []
+    S = submission_model
+    has_answer = and_(S.answer.isnot(None), func.trim(S.answer) != '')
+    rows = session.query(
+        S.student_id,
+        S.round_number,
+        func.count(S.id).label('submissions'),
+        func.sum(case((S.is_correct == True, 1), else_=0)).label('correct_count'),
+        func.sum(S.answer_time).label('time_sum'),
+        func.count(S.answer_time).label('time_count'),
+        func.sum(case((has_answer, S.answer_time), else_=0)).label('answered_time_sum'),
+        func.sum(case((and_(has_answer, S.answer_time.isnot(None)), 1), else_=0)).label('answered_time_count')
+    ).filter(
+        S.course_id == course_id,
+        S.student_id.in_(student_ids)
+    ).group_by(S.student_id, S.round_number).all()
+    return [{
+        'student_id': row.student_id,
+        'round_number': row.round_number,
+        'submissions': int(row.submissions or 0),
+        'correct_count': int(row.correct_count or 0),
+        'time_sum': float(row.time_sum or 0),
+        'time_count': int(row.time_count or 0),
+        'answered_time_sum': float(row.answered_time_sum or 0),
+        'answered_time_count': int(row.answered_time_count or 0)
+    } for row in rows]
+
+
+def speed_level(t_student, t_class_avg):
+    """每题速度等级：与本题班级平均用时比较"""
+    try:
+        if not t_class_avg or t_class_avg <= 0:
+            return ''
+        # 最低时间保护，防止误触
+        if t_student is None:
+            t_student = 0
+        if t_student < 1.5:
+            t_student = 1.5
+        # 大题：全班平均时间很长时，使用绝对区间
+        if t_class_avg > 25:
+            if t_student <= 0.8 * t_class_avg:
+                return '快'
+            elif t_student <= 1.2 * t_class_avg:
+                return '正常'
+            else:
+                return '稍慢'
+        # 常规题：用比例判定
+        ratio = t_student / t_class_avg
+        if ratio <= 0.6:
+            return '很快'
+        elif ratio <= 1.0:
+            return '快'
+        elif ratio <= 1.4:
+            return '稍慢'
+        else:
+            return '很慢'
+    except Exception:
+        return ''
+
+
+# 用时之和精确累加：任何浮点数都是 2**-1074 的整数倍，换算成整数后相加没有误差
+# （浮点逐个累加的误差会让 round(平均值, 1) 在 .x5 处与 statistics.mean 进位不同）
+EXACT_SHIFT = 1074
+
+
+def _exact(value):
+    numerator, denominator = float(value).as_integer_ratio()
+    return numerator << (EXACT_SHIFT + 1 - denominator.bit_length())
+
+
+def _mean(total, count):
+    """_exact 累加结果的平均值（整数相除是正确舍入的，与 statistics.mean 一致）"""
+    return total / (count << EXACT_SHIFT) if count else 0
+
+
+def build_course_analytics(rounds, cells, active_count):
+    """班级层面的报告统计
+
+    Args:
+        rounds: [(round_number, question_score)]，课程的所有轮次记录
+        cells: query_round_cells 的结果
+        active_count: 班级活跃学生数
+
+    Returns:
+        统计字典（轮次号为整数键；保存为JSON时使用 dump_course_analytics）
+    """
+    active_count = active_count or 1
+    round_nums = sorted(set(rn for rn, _ in rounds))
+    round_scores = {}
+    for rn, score in rounds:
+        # 同一轮次如有多条记录，以第一条为准
+        round_scores.setdefault(rn, score if score else 1)
+
+    # 按轮次汇总
+    per_round = defaultdict(lambda: {
+        'participants': 0, 'correct': 0, 'time_sum': 0, 'time_count': 0,
+        'answered_time_sum': 0, 'answered_time_count': 0
+    })
+    for cell in cells:
+        stats = per_round[cell['round_number']]
+        stats['participants'] += 1
+        if cell['correct_count'] > 0:
+            stats['correct'] += 1
+        stats['time_sum'] += _exact(cell['time_sum'])
+        stats['time_count'] += cell['time_count']
+        stats['answered_time_sum'] += _exact(cell['answered_time_sum'])
+        stats['answered_time_count'] += cell['answered_time_count']
+
+    # 作废轮次：无人参与、无人答对且平均用时很短
+    invalid_rounds = []
+    round_stats = []
+    for rn in round_nums:
+        stats = per_round.get(rn)
+        participants = stats['participants'] if stats else 0
+        correct = stats['correct'] if stats else 0
+        acc = (correct / active_count) * 100
+        part = (participants / active_count) * 100
+        avg_t = round(_mean(stats['time_sum'], stats['time_count']), 1) if stats else 0
+        if part == 0 and acc == 0 and avg_t < 10:
+            invalid_rounds.append(rn)
+            continue
+        round_stats.append({'round': rn, 'accuracy': round(acc, 1), 'participation_rate': round(part, 1), 'avg_time': avg_t})
+    invalid_set = set(invalid_rounds)
+
+    # 每轮作答同学的平均用时（速度等级基准）
+    round_answered_avg_time = {
+        rn: _mean(stats['answered_time_sum'], stats['answered_time_count'])
+        for rn, stats in per_round.items()
+    }
+
+    # 按学生聚合（只统计有效轮次）
+    student_total_rounds = defaultdict(int)
+    student_correct_rounds = defaultdict(int)
+    student_scores = defaultdict(int)
+    participated_students = set()
+    class_time_sum = 0
+    class_time_count = 0
+    for cell in cells:
+        participated_students.add(cell['student_id'])
+        class_time_sum += _exact(cell['time_sum'])
+        class_time_count += cell['time_count']
+        rn = cell['round_number']
+        if rn in invalid_set:
+            continue
+        student_total_rounds[cell['student_id']] += 1
+        if cell['correct_count'] > 0:
+            student_correct_rounds[cell['student_id']] += 1
+            student_scores[cell['student_id']] += cell['correct_count'] * round_scores.get(rn, 1)
+
+    acc_list = [
+        (student_correct_rounds[sid] / total) * 100 if total > 0 else 0
+        for sid, total in student_total_rounds.items()
+    ]
+
+    return {
+        'round_numbers': round_nums,
+        'round_scores': round_scores,
+        'invalid_rounds': invalid_rounds,
+        'round_stats': round_stats,
+        'round_answered_avg_time': round_answered_avg_time,
+        'student_scores': dict(student_scores),
+        'class_avg_accuracy': round(sum(acc_list) / len(acc_list)) if acc_list else 0,
+        'class_avg_score': round(sum(student_scores.values()) / len(student_scores)) if student_scores else 0,
+        'class_avg_participation': round((len(participated_students) / active_count) * 100),
+        'class_avg_response_time': round(_mean(class_time_sum, class_time_count), 1) if class_time_count else 0,
+        'total_possible_score': sum((score or 1) for rn, score in rounds if rn not in invalid_set),
+        'valid_rounds_count': len(round_stats),
+        'all_rounds_count': len(rounds)
+    }
+
+
+def build_student_analytics(course_stats, rounds, submissions):
+    """合并某个学生自己的数据
+
+    Args:
+        course_stats: build_course_analytics 的结果
+        rounds: [(round_number, question_score)]，与 build_course_analytics 相同
+        submissions: 该学生在本课程的提交记录（按提交时间倒序）
+
+    Returns:
+        {'student_submissions', 'participated_rounds', 'student_total_score',
+         'avg_response_time', 'rank', 'percentile'}
+    """
+    invalid_set = set(course_stats['invalid_rounds'])
+    round_scores = course_stats['round_scores']
+    round_answered_avg_time = course_stats['round_answered_avg_time']
+
+    # 每轮取最近一次提交
+    latest_by_round = {}
+    for sub in submissions:
+        latest_by_round.setdefault(sub.round_number, sub)
+
+    participated_rounds = 0
+    views = []
+    for rn, score in rounds:
+        # 跳过作废轮次，不显示在报告中
+        if rn in invalid_set:
+            continue
+        rs = latest_by_round.get(rn)
+        # 识别该轮违规类型（优先级：猜题>抄题>打闹>走神）
+        violation_type = None
+        if rs:
+            if (rs.guess_count or 0) > 0:
+                violation_type = '猜题'
+            elif (rs.copy_count or 0) > 0:
+                violation_type = '抄题'
+            elif (rs.noisy_count or 0) > 0:
+                violation_type = '打闹'
+            elif (rs.distracted_count or 0) > 0:
+                violation_type = '走神'
+
+        if rs and (rs.answer is not None and str(rs.answer).strip() != ''):
+            participated_rounds += 1
+            views.append({
+                'round': rn,
+                'answer': rs.answer,
+                'is_correct': bool(rs.is_correct),
+                'question_score': score if score else 1,
+                'answer_time': rs.answer_time or 0,
+                'violation_type': violation_type,
+                'speed_level': speed_level(rs.answer_time or 0, round_answered_avg_time.get(rn, 0))
+            })
+        else:
+            views.append({
+                'round': rn,
+                'answer': '',
+                'is_correct': False,
+                'question_score': score if score else 1,
+                'answer_time': 0,
+                'violation_type': violation_type,
+                'speed_level': ''
+            })
+
+    # 学生总分（只计算有效轮次）
+    student_total_score = sum(
+        round_scores.get(sub.round_number, 1)
+        for sub in submissions
+        if sub.is_correct and sub.round_number not in invalid_set
+    )
+
+    times = [sub.answer_time for sub in submissions if sub.answer_time is not None]
+    avg_response_time = round(_mean(sum(map(_exact, times)), len(times)), 1) if times else 0
+
+    # 排名：比当前学生分数高的学生数 + 1
+    student_scores = course_stats['student_scores']
+    rank = None
+    percentile = None
+    if student_scores:
+        rank = sum(1 for score in student_scores.values() if score > student_total_score) + 1
+        percentile = round(((rank - 1) / len(student_scores)) * 100, 1)
+
+    return {
+        'student_submissions': views,
+        'participated_rounds': participated_rounds,
+        'student_total_score': student_total_score,
+        'avg_response_time': avg_response_time,
+        'rank': rank,
+        'percentile': percentile
+    }
+
+
+def dump_course_analytics(course_stats):
+    """班级统计 -> 可写入JSON的字典（JSON的键只能是字符串）"""
+    data = dict(course_stats)
+    data['round_scores'] = {str(rn): score for rn, score in course_stats['round_scores'].items()}
+    data['round_answered_avg_time'] = {str(rn): t for rn, t in course_stats['round_answered_avg_time'].items()}
+    return data
+
+
+def load_course_analytics(data):
+    """dump_course_analytics 的逆操作：把轮次号键还原为整数"""
+    course_stats = dict(data)
+    course_stats['round_scores'] = {int(rn): score for rn, score in data['round_scores'].items()}
+    course_stats['round_answered_avg_time'] = {int(rn): t for rn, t in data['round_answered_avg_time'].items()}
+    return course_stats
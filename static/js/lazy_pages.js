@@ -0,0 +1,71 @@
+// 分页列表懒加载（课程历史、历史班级、答题记录）
+
+// 转义HTML特殊字符（动态插入列表项时使用）
+function escapeHtml(value) {
+    const entities = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'};
+    return String(value === null || value === undefined ? '' : value).replace(/[&<>"']/g, ch => entities[ch]);
+}
+
+// sentinel 元素进入视口时请求下一页：
+// - sentinel.dataset.nextCursor 为下一页游标（为空时请求第一页）
+// - buildUrl(cursor) 返回接口地址，onPage(data) 把本页数据插入页面
+// - 接口返回的 next_cursor 为空时移除 sentinel
+function lazyLoadPages(sentinel, buildUrl, onPage) {
+    if (!sentinel) return;
+    let loading = false;
+    let done = false;
+    let failed = false;
+    let observer = null;
+    let idleHtml = sentinel.innerHTML;
+
+    const nearViewport = () => sentinel.getBoundingClientRect().top < window.innerHeight + 200;
+
+    const loadNext = () => {
+        if (loading || done) return;
+        loading = true;
+        failed = false;
+        fetch(buildUrl(sentinel.dataset.nextCursor || ''))
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) throw new Error(data.message || '加载失败');
+                sentinel.innerHTML = idleHtml;
+                onPage(data);
+                if (data.next_cursor) {
+                    sentinel.dataset.nextCursor = data.next_cursor;
+                } else {
+                    done = true;
+                    if (observer) observer.disconnect();
+                    sentinel.remove();
+                }
+            })
+            .catch(error => {
+                console.error('加载下一页失败:', error);
+                failed = true;
+                sentinel.textContent = '加载失败，点击重试';
+                sentinel.onclick = () => {
+                    // 不支持 IntersectionObserver 时恢复“点击加载”
+                    sentinel.onclick = observer ? null : loadNext;
+                    loadNext();
+                };
+            })
+            .finally(() => {
+                loading = false;
+                // 一页内容不足以填满屏幕时 sentinel 仍在视口内，观察器不会再次触发
+                if (!done && !failed && observer && nearViewport()) loadNext();
+            });
+    };
+
+    if ('IntersectionObserver' in window) {
+        observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) loadNext();
+        }, { rootMargin: '200px' });
+        observer.observe(sentinel);
+    } else {
+        // 不支持 IntersectionObserver 的旧浏览器：点击加载
+        sentinel.textContent = '加载更多';
+        sentinel.style.cursor = 'pointer';
+        idleHtml = sentinel.innerHTML;
+        sentinel.onclick = loadNext;
+    }
+    return loadNext;
+}
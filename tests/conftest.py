@@ -0,0 +1,107 @@
+"""
+测试公共设施：app.py 使用内存 SQLite 数据库导入一次，每个测试前重建数据库并清空缓存
+（与 benchmarks.routes.run_tier 重建数据库的方式相同）
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# 必须在导入 app 之前设置
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['REPORT_SNAPSHOT_ASYNC'] = 'false'
+os.environ['PERF_PROFILER'] = 'false'
+os.environ['SUBMISSION_BUFFER'] = 'false'
+os.environ.setdefault('UUID_STORAGE', 'text')
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as app_py  # noqa: E402
+
+from benchmarks.dataset import generate_dataset  # noqa: E402
+
+
+def reset_database(m):
+    with contextlib.redirect_stdout(io.StringIO()):
+        with m.app.app_context():
+            m.db.session.remove()
+            m.db.drop_all()
+            m.migrations.drop_schema_version(m.db.engine)
+        m.init_database()
+    for cache in (m.classroom_snapshot_cache, m.ceremony_podium_cache, m.roster_cache, m.course_context_cache,
+                  m.page_render_cache):
+        cache.clear()
+
+
+@pytest.fixture
+def m():
+    """已重建数据库的 app 模块，测试在应用上下文中执行"""
+    reset_database(app_py)
+    with app_py.app.app_context():
+        yield app_py
+        app_py.db.session.remove()
+
+
+@pytest.fixture
+def client(m):
+    return m.app.test_client()
+
+
+@pytest.fixture
+def dataset(m):
+    """确定性的模拟数据（见 benchmarks/dataset.py），返回 generate_dataset 的布局"""
+    def build(**options):
+        config = dict(classes=2, students=12, courses=3, rounds=6, accuracy=0.6, participation=0.85,
+                      behavior_rate=0.1, absent_rate=0.15, seed=11)
+        config.update(options)
+        return generate_dataset(m, **config)
+    return build
+
+
+@pytest.fixture
+def lesson(client):
+    """通过 HTTP 接口上一整节课：建班、添加学生、开课、每轮提交/行为标记/评判/下一轮
+
+    返回 {'class_id', 'course_id', 'names'}；rounds 轮全部评判并进入下一轮
+    """
+    def play(students=8, rounds=6, seed=7, end=False, answers='12', rejudge_round=None):
+        rng = random.Random(seed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            class_id = client.post('/api/create_class', json={'name': f'测试班级{seed}'}).get_json()['class_id']
+            names = [f'学生{i:02d}' for i in range(students)]
+            for name in names:
+                client.post('/api/add_student', json={'name': name, 'class_id': class_id})
+            course_id = client.post('/api/start_course',
+                                    json={'course_name': '测试课程', 'class_id': class_id}).get_json()['course_id']
+            for rn in range(1, rounds + 1):
+                for name in names:
+                    if rng.random() < 0.8:
+                        client.post('/submit_student_answer', json={
+                            'student_name': name, 'answer': rng.choice(answers),
+                            'answer_time': round(rng.uniform(2, 30), 1), 'course_id': course_id
+                        })
+                    if rng.random() < 0.1:
+                        client.post('/api/mark_behavior',
+                                    json={'student_name': name, 'behavior': 'copy', 'course_id': course_id})
+                client.post('/judge_answers', json={'correct_answer': answers[0],
+                                                    'question_score': rng.randint(1, 3), 'course_id': course_id})
+                for name in names:
+                    if rng.random() < 0.1:
+                        client.post('/api/mark_behavior',
+                                    json={'student_name': name, 'behavior': 'noisy', 'course_id': course_id})
+                if rn == rejudge_round:
+                    # 老师改判：同一轮用另一个正确答案重新评判
+                    client.post('/judge_answers', json={'correct_answer': answers[-1], 'question_score': 2,
+                                                        'course_id': course_id})
+                client.post('/next_round', json={'course_id': course_id})
+            if end:
+                client.post(f'/api/end_course/{course_id}')
+        return {'class_id': class_id, 'course_id': course_id, 'names': names}
+    return play
@@ -0,0 +1,49 @@
+"""
+开始课程时在数据库端为在读学生创建出勤记录（INSERT ... SELECT，ID 由 _sql_uuid 生成）
+"""
+
+import os
+import subprocess
+import sys
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+
+def test_start_course_creates_attendance(m, client):
+    class_id = client.post('/api/create_class', json={'name': '出勤测试'}).get_json()['class_id']
+    names = [f'学生{i}' for i in range(6)]
+    for name in names:
+        client.post('/api/add_student', json={'name': name, 'class_id': class_id})
+    ids = {name: m.db.session.query(m.Student.id).filter_by(class_id=class_id, name=name).scalar() for name in names}
+    for name in names[:2]:
+        assert client.post(f'/api/student_absent/{ids[name]}').status_code == 200
+    course_id = client.post('/api/start_course', json={'course_name': '课程', 'class_id': class_id}).get_json()['course_id']
+
+    rows = m.CourseAttendance.query.filter_by(course_id=course_id).all()
+    # 每个在读学生一条记录，请假学生没有记录
+    assert sorted(row.student_id for row in rows) == sorted(ids[name] for name in names[2:])
+    assert all(row.is_absent is False for row in rows)
+    assert len({row.id for row in rows}) == len(rows)
+    assert all(str(uuid.UUID(row.id)) == row.id for row in rows)
+
+    # 数据库中的原始值符合 UUID_STORAGE：text 为36位字符串，native 为16字节
+    raw = m.db.session.execute(text('SELECT id FROM course_attendances')).scalars().all()
+    if m.UUID_STORAGE == 'native':
+        assert all(isinstance(value, bytes) and len(value) == 16 for value in raw)
+    else:
+        assert all(isinstance(value, str) and str(uuid.UUID(value)) == value for value in raw)
+    assert len(set(raw)) == len(raw) == len(rows)
+
+
+@pytest.mark.skipif(os.environ.get('UUID_STORAGE') == 'native', reason='已经在 native 存储下运行')
+def test_start_course_creates_attendance_native_storage():
+    # UUID_STORAGE 在导入 app 时读取：在新的进程中以 native 存储运行上面的测试
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider',
+         f'{os.path.abspath(__file__)}::test_start_course_creates_attendance'],
+        cwd=root, env={**os.environ, 'UUID_STORAGE': 'native'}, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,25 @@
+"""
+领奖台缓存：其他 worker 课后修改成绩（递增课程数据版本）后不再返回旧的领奖台
+"""
+
+from sqlalchemy import text
+
+
+def test_podium_cache_follows_course_version(m, client, lesson):
+    played = lesson(students=4, rounds=2, seed=41, end=True)
+    course_id = played['course_id']
+    assert '9999' not in client.get(f'/ceremony/{course_id}').get_data(as_text=True)
+    # 模拟另一个 worker 课后改判：本 worker 的领奖台缓存没有失效
+    m.db.session.execute(text('UPDATE course_scores SET score = 9999 WHERE course_id = :id'), {'id': course_id})
+    m.db.session.commit()
+    assert '9999' not in client.get(f'/ceremony/{course_id}').get_data(as_text=True)  # 版本未变，使用缓存
+
+    m.db.session.execute(text('UPDATE courses SET data_version = data_version + 1 WHERE id = :id'), {'id': course_id})
+    m.db.session.commit()
+    assert '9999' in client.get(f'/ceremony/{course_id}').get_data(as_text=True)
+
+
+def test_podium_not_cached_for_course_in_progress(m, client, lesson):
+    played = lesson(students=3, rounds=1, seed=42)
+    assert client.get(f'/ceremony/{played["course_id"]}').status_code == 200
+    assert m.ceremony_podium_cache.stats()['size'] == 0
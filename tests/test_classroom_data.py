@@ -0,0 +1,39 @@
+"""
+课堂快照缓存：其他 worker 处理了写操作时，实时事件触发的刷新不能返回本 worker 的旧快照
+"""
+
+from sqlalchemy import text
+
+
+def classroom_data(client, class_id, **params):
+    response = client.get('/get_classroom_data', query_string=params, headers={'X-Class-ID': class_id})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_event_refresh_bypasses_stale_snapshot(m, client, lesson):
+    played = lesson(students=4, rounds=2, seed=31)
+    class_id, course_id = played['class_id'], played['course_id']
+    before = classroom_data(client, class_id)
+    assert before['current_round'] == 3
+    # 模拟另一个 worker 进入下一轮并修改成绩：本 worker 的快照和课程上下文都没有失效
+    m.db.session.execute(text('UPDATE courses SET current_round = 4 WHERE id = :id'), {'id': course_id})
+    m.db.session.execute(text('UPDATE course_scores SET score = score + 10 WHERE course_id = :id'), {'id': course_id})
+    m.db.session.commit()
+
+    assert classroom_data(client, class_id) == before  # 普通轮询仍可使用缓存
+    # round 事件：缓存中的轮次与事件不一致时重新读取
+    after_round = classroom_data(client, class_id, round=4)
+    assert after_round['current_round'] == 4
+    assert all(after_round['students'][name]['score'] == before['students'][name]['score'] + 10
+               for name in played['names'])
+    # 之后的普通轮询使用新快照
+    assert classroom_data(client, class_id) == after_round
+    assert classroom_data(client, class_id, round=4) == after_round
+
+    # 提交/评判的 reload 事件：fresh=1 总是重新读取
+    m.db.session.execute(text('UPDATE course_scores SET score = score + 1 WHERE course_id = :id'), {'id': course_id})
+    m.db.session.commit()
+    refreshed = classroom_data(client, class_id, fresh=1)
+    assert all(refreshed['students'][name]['score'] == after_round['students'][name]['score'] + 1
+               for name in played['names'])
@@ -0,0 +1,103 @@
+"""
+响应压缩：按 Accept-Encoding 选择编码，小响应/非文本/流式响应不压缩，压缩后 ETag 变为弱 ETag
+"""
+
+import gzip
+
+import pytest
+from flask import Flask, Response
+
+from compression import ResponseCompressor, choose_encoding
+
+BODY = '<p>' + '课堂答题 ' * 400 + '</p>'
+
+
+@pytest.fixture
+def compressor():
+    return ResponseCompressor(min_size=256)
+
+
+@pytest.fixture
+def client(compressor):
+    app = Flask(__name__, static_folder=None)
+
+    @app.route('/page')
+    def page():
+        response = Response(BODY, mimetype='text/html')
+        response.set_etag('v1')
+        return response
+
+    @app.route('/small')
+    def small():
+        return Response('<p>ok</p>', mimetype='text/html')
+
+    @app.route('/binary')
+    def binary():
+        return Response(b'\x89PNG' + b'\0' * 4096, mimetype='image/png')
+
+    @app.route('/events')
+    def events():
+        return Response((f'data: {i}\n\n' * 100 for i in range(3)), mimetype='text/event-stream')
+
+    @app.route('/streamed')
+    def streamed():
+        return Response((BODY for _ in range(3)), mimetype='text/html')
+
+    compressor.init_app(app)
+    return app.test_client()
+
+
+def test_choose_encoding():
+    assert choose_encoding('gzip, deflate, br', ('br', 'gzip')) == 'br'
+    assert choose_encoding('br;q=0.5, gzip', ('br', 'gzip')) == 'gzip'
+    assert choose_encoding('br;q=0, *', ('br', 'gzip')) == 'gzip'
+    assert choose_encoding('identity', ('br', 'gzip')) is None
+    assert choose_encoding('br', ('gzip',)) is None
+
+
+def test_gzip(client):
+    response = client.get('/page', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()).decode('utf-8') == BODY
+    assert 'Accept-Encoding' in response.vary
+    assert response.headers['ETag'] == 'W/"v1"'
+
+
+def test_brotli_preferred(client, compressor):
+    brotli = pytest.importorskip('brotli')
+    response = client.get('/page', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.get_data()).decode('utf-8') == BODY
+    assert response.headers['ETag'] == 'W/"v1"'
+
+
+def test_br_only_without_brotli(client, compressor):
+    if 'br' in compressor.encodings:
+        pytest.skip('已安装 brotli')
+    response = client.get('/page', headers={'Accept-Encoding': 'br'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data(as_text=True) == BODY
+    # 响应内容随 Accept-Encoding 变化，即使这次没有压缩
+    assert 'Accept-Encoding' in response.vary and response.headers['ETag'] == '"v1"'
+
+
+def test_identity_keeps_strong_etag(client):
+    response = client.get('/page')
+    assert 'Content-Encoding' not in response.headers and response.headers['ETag'] == '"v1"'
+
+
+@pytest.mark.parametrize('path', ['/small', '/binary'])
+def test_small_and_binary_responses_untouched(client, path):
+    response = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' not in response.vary
+
+
+@pytest.mark.parametrize('path', ['/events', '/streamed'])
+def test_streamed_responses_not_buffered(client, compressor, path):
+    response = client.get(path, headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert response.is_streamed and 'Content-Encoding' not in response.headers
+    first = next(iter(response.response))
+    assert first.startswith(b'data: 0' if path == '/events' else b'<p>')
+    response.close()
+    assert compressor.stats()['compressed'] == 0
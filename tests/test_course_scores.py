@@ -0,0 +1,82 @@
+"""
+课程计分板：评判/提交/行为标记时增量维护的 course_scores 与从提交记录重新聚合的结果一致
+"""
+
+ZERO = {'score': 0, 'correct_rounds': 0, 'rounds_answered': 0, 'penalty_total': 0}
+
+
+def assert_scoreboard_consistent(m, course_id):
+    table = {row.student_id: {field: getattr(row, field) for field in m.SCORE_FIELDS}
+             for row in m.CourseScore.query.filter_by(course_id=course_id)}
+    aggregated = m.aggregate_course_scores(course_id)
+    assert table, '计分板为空'
+    for student_id in set(table) | set(aggregated):
+        assert table.get(student_id, ZERO) == aggregated.get(student_id, ZERO), student_id
+
+
+def test_scoreboard_after_live_lesson(m, lesson):
+    played = lesson(students=10, rounds=8, seed=7, rejudge_round=4)
+    assert_scoreboard_consistent(m, played['course_id'])
+
+
+def test_scoreboard_after_batch_submissions(m, client, lesson):
+    played = lesson(students=6, rounds=1, seed=5)
+    course_id, names = played['course_id'], played['names']
+    for rn in range(2, 5):
+        response = client.post('/submit_answers_batch', json={
+            'course_id': course_id,
+            'submissions': [{'student_name': name, 'answer': str(i % 2 + 1), 'answer_time': 4}
+                            for i, name in enumerate(names[:rn + 1])]
+        })
+        assert response.get_json()['submitted'] == rn + 1
+        # 没有提交的学生被标记行为时补建提交记录
+        client.post('/api/mark_behavior', json={'student_name': names[-1], 'behavior': 'guess', 'course_id': course_id})
+        client.post('/judge_answers', json={'correct_answer': '1', 'question_score': rn, 'course_id': course_id})
+        client.post('/api/mark_behavior', json={'student_name': names[0], 'behavior': 'distracted',
+                                                'course_id': course_id})
+        assert_scoreboard_consistent(m, course_id)
+        client.post('/next_round', json={'course_id': course_id})
+    assert_scoreboard_consistent(m, course_id)
+
+
+def test_rebuild_command_repairs_scoreboard(m, lesson):
+    played = lesson(students=6, rounds=4, seed=9)
+    course_id = played['course_id']
+    expected = m.aggregate_course_scores(course_id)
+    m.CourseScore.query.filter_by(course_id=course_id).update({'score': 999, 'correct_rounds': 0})
+    m.db.session.commit()
+    result = m.app.test_cli_runner().invoke(m.rebuild_course_scores_command, ['--course-id', course_id])
+    assert result.exit_code == 0, result.output
+    m.db.session.expire_all()
+    assert m.load_course_scores(course_id) == expected
+
+
+def test_load_course_scores_without_scoreboard_aggregates(m, dataset):
+    layout = dataset(classes=1)
+    course_id = layout['classes'][0]['courses'][0]
+    expected = m.aggregate_course_scores(course_id)
+    m.CourseScore.query.filter_by(course_id=course_id).delete()
+    m.db.session.commit()
+    assert m.load_course_scores(course_id) == expected
+    assert m.load_courses_scores([course_id]) == {course_id: expected}
+
+
+def test_mark_behavior_races_with_submission(m, client, monkeypatch, lesson):
+    played = lesson(students=3, rounds=1, seed=5)
+    course_id, name = played['course_id'], played['names'][0]
+    student_id = m.db.session.query(m.Student.id).filter_by(class_id=played['class_id'], name=name).scalar()
+    insert_submission_once = m.insert_submission_once
+
+    def submitted_first(course_id, **values):
+        # 模拟另一个请求在标记行为读取提交记录之前写入了学生的答案
+        insert_submission_once(course_id, student_id=student_id, answer='7', answer_time=2.0, is_correct=False)
+        m.bump_course_score(course_id, student_id, rounds_answered=1)
+        return insert_submission_once(course_id, **values)
+
+    monkeypatch.setattr(m, 'insert_submission_once', submitted_first)
+    response = client.post('/api/mark_behavior', json={'student_name': name, 'behavior': 'copy', 'course_id': course_id})
+    assert response.status_code == 200, response.get_json()
+    rows = m.StudentSubmission.query.filter_by(course_id=course_id, student_id=student_id,
+                                             round_number=2).all()
+    assert [(row.answer, row.copy_count, row.penalty_score) for row in rows] == [('7', 1, 3)]
+    assert_scoreboard_consistent(m, course_id)
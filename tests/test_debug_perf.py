@@ -0,0 +1,25 @@
+"""
+/debug/perf 访问控制和参数解析
+"""
+
+
+def test_perf_page_requires_token(m, client, monkeypatch):
+    monkeypatch.setenv('PERF_DEBUG_TOKEN', 'secret')
+    assert client.get('/debug/perf?format=json').status_code == 403
+    assert client.get('/debug/perf?format=json&token=wrong').status_code == 403
+    assert client.post('/debug/perf/reset').status_code == 403
+    assert client.get('/debug/perf?format=json&token=secret').status_code == 200
+
+
+def test_perf_page_closed_without_token_outside_sqlite(m, client, monkeypatch):
+    monkeypatch.delenv('PERF_DEBUG_TOKEN', raising=False)
+    assert client.get('/debug/perf?format=json').status_code == 200
+    monkeypatch.setattr(m, 'database_url', 'postgresql+pg8000://user:pass@db/classroom')
+    assert client.get('/debug/perf?format=json').status_code == 403
+
+
+def test_perf_page_invalid_limit(client, monkeypatch):
+    monkeypatch.delenv('PERF_DEBUG_TOKEN', raising=False)
+    for limit in ('abc', '-5', '100000'):
+        response = client.get('/debug/perf', query_string={'format': 'json', 'limit': limit})
+        assert response.status_code == 200 and response.get_json()['success'] is True
@@ -0,0 +1,76 @@
+"""
+批量评判：一条 UPDATE 评判整轮的结果与逐条评判（judge_submission）一致
+"""
+
+import pytest
+
+ANSWERS = ['12', ' 12 ', '12\t', 'abc', ' ABC', 'Äbc', 'äBC ', 'ÄBC　', 'straße', 'STRASSE',
+           'Ⅻ', 'ⅻ', '十二', '', '1 2']
+
+
+def add_round_submissions(m, dataset, answers, penalties=()):
+    layout = dataset(classes=1, students=len(answers), courses=1, rounds=1, absent_rate=0)
+    class_info = layout['classes'][0]
+    course_id = class_info['courses'][0]
+    round_number = 50
+    for i, (student, answer) in enumerate(zip(class_info['students'], answers)):
+        m.db.session.add(m.StudentSubmission(
+            student_id=student['id'], course_id=course_id, round_number=round_number, answer=answer,
+            answer_time=3.0, is_correct=False, penalty_score=3 if i in penalties else 0
+        ))
+    m.db.session.commit()
+    return course_id, round_number
+
+
+@pytest.mark.parametrize('correct_answer', ['12', 'abc', 'ÄBC', 'äbc', 'Straße', 'ⅻ', '十二'])
+def test_bulk_grading_matches_per_row(m, dataset, correct_answer):
+    course_id, round_number = add_round_submissions(m, dataset, ANSWERS, penalties={0, 6})
+    expected = {
+        student_id: m.judge_submission(sub, correct_answer)[0]
+        for student_id, sub in m.fetch_round_submissions(course_id, round_number).items()
+    }
+    graded = m.grade_round_bulk(course_id, round_number, correct_answer)
+    m.db.session.commit()
+    assert {student_id: bool(row.is_correct) for student_id, row in graded.items()} == expected
+    stored = {sub.student_id: bool(sub.is_correct)
+              for sub in m.StudentSubmission.query.filter_by(course_id=course_id, round_number=round_number)}
+    assert stored == expected
+
+
+def test_bulk_grading_falls_back_for_rows_without_normalized_answer(m, dataset):
+    # 迁移之前写入的行没有 normalized_answer（ASCII 答案由 SQL 的 lower(trim()) 比较）
+    course_id, round_number = add_round_submissions(m, dataset, ['12', ' 12 ', 'Ab', 'ab ', 'x'])
+    m.StudentSubmission.query.update({'normalized_answer': None})
+    m.db.session.commit()
+    graded = m.grade_round_bulk(course_id, round_number, 'AB')
+    assert sorted(row.answer for row in graded.values() if row.is_correct) == ['Ab', 'ab ']
+
+
+def test_submission_writes_normalized_answer(m, dataset):
+    course_id, round_number = add_round_submissions(m, dataset, [' ÄBC '])
+    assert m.StudentSubmission.query.filter_by(course_id=course_id).filter(
+        m.StudentSubmission.round_number == round_number).one().normalized_answer == 'äbc'
+
+
+def test_judge_endpoint_bulk_and_per_row_agree(m, client, lesson):
+    results = []
+    for bulk in (True, False):
+        m.app.config['BULK_GRADING'] = bulk
+        try:
+            played = lesson(students=6, rounds=4, seed=3, answers='Äxä1', rejudge_round=2)
+        finally:
+            m.app.config['BULK_GRADING'] = True
+        course_id = played['course_id']
+        results.append((
+            m.load_course_scores(course_id),
+            sorted((s.round_number, s.answer, bool(s.is_correct))
+                   for s in m.StudentSubmission.query.filter_by(course_id=course_id))
+        ))
+    # 两节课由同一随机种子产生，学生ID不同：按提交内容和成绩分布比较
+    (bulk_scores, bulk_rows), (row_scores, row_rows) = results
+    assert bulk_rows == row_rows
+    assert sorted(map(sorted_items, bulk_scores.values())) == sorted(map(sorted_items, row_scores.values()))
+
+
+def sorted_items(stats):
+    return tuple(sorted(stats.items()))
@@ -0,0 +1,132 @@
+"""
+UUID 存储方式：GUID 类型的转换，以及 SQLite 数据库在 text / native 之间的分批转换
+"""
+
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+import id_storage
+import migrations
+
+SAMPLE = '0f749e12-5f20-494e-bca0-146a933b9886'
+
+
+def test_guid_bind_and_result():
+    native = id_storage.GUID(native=True)
+    sqlite_dialect = sqlite.dialect()
+    stored = native.process_bind_param(SAMPLE, sqlite_dialect)
+    assert stored == uuid.UUID(SAMPLE).bytes
+    assert native.process_result_value(stored, sqlite_dialect) == SAMPLE
+    assert native.process_bind_param(SAMPLE.upper(), postgresql.dialect()) == SAMPLE
+    # URL 中的错误ID按不存在处理，不抛出异常
+    assert native.process_bind_param('not-a-uuid', sqlite_dialect) is None
+    assert id_storage.GUID(native=False).process_bind_param(SAMPLE, sqlite_dialect) == SAMPLE
+
+
+@pytest.mark.parametrize('value', [SAMPLE, SAMPLE.upper(), uuid.UUID(SAMPLE), uuid.UUID(SAMPLE).bytes,
+                                   bytearray(uuid.UUID(SAMPLE).bytes), memoryview(uuid.UUID(SAMPLE).bytes)])
+def test_to_text(value):
+    assert id_storage.to_text(value) == SAMPLE
+
+
+def test_shadow_names_fit_postgresql_identifiers():
+    name = id_storage._shadow_name('uq_' + 'x' * 80)
+    assert len(name) == id_storage.PG_MAX_IDENTIFIER and name.endswith(id_storage.CONVERT_SUFFIX)
+
+
+def test_expression_indexes_on_id_columns_are_refused():
+    plain = {'name': 'idx', 'column_names': ['student_id', 'course_id']}
+    expression = {'name': 'idx', 'column_names': [None], 'expressions': ['lower(student_id::text)']}
+    other = {'name': 'idx', 'column_names': [None], 'expressions': ['lower(name)']}
+    assert id_storage._index_involves(plain, ['student_id']) is True
+    assert id_storage._index_involves(plain, ['class_id']) is False
+    assert id_storage._index_involves(expression, ['student_id']) is None
+    assert id_storage._index_involves(other, ['student_id']) is False
+
+
+@pytest.fixture
+def engine(m, tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "ids.db"}')
+    migrations.migrate(engine, m.db.metadata)
+    tables = m.db.metadata.tables
+    ids = [str(uuid.uuid4()) for _ in range(6)]
+    now = datetime(2025, 3, 1, 9, 30)
+    with engine.begin() as conn:
+        conn.execute(tables['classes'].insert(), [{'id': ids[0], 'name': '一班', 'is_active': True, 'created_date': now}])
+        conn.execute(tables['students'].insert(), [
+            {'id': sid, 'name': f'学生{i}', 'class_id': ids[0], 'status': 'active', 'created_date': now}
+            for i, sid in enumerate(ids[1:4])
+        ])
+        conn.execute(tables['courses'].insert(), [{'id': ids[4], 'class_id': ids[0], 'name': '第1节课',
+                                                   'is_active': False, 'current_round': 3, 'created_at': now}])
+        conn.execute(tables['student_submissions'].insert(), [
+            {'id': str(uuid.uuid4()), 'student_id': sid, 'course_id': ids[4], 'round_number': rn,
+             'answer': str(rn), 'normalized_answer': str(rn), 'is_correct': rn % 2 == 0, 'answer_time': 3.5,
+             'created_at': now, 'guess_count': 0, 'copy_count': 0, 'noisy_count': 0, 'distracted_count': 0,
+             'penalty_score': 0}
+            for sid in ids[1:4] for rn in (1, 2, 3)
+        ])
+        # 含表达式的索引：SQLite 按原始语句重建
+        conn.execute(text('CREATE INDEX idx_submissions_expr ON student_submissions (student_id, round_number * 2)'))
+    yield engine
+    engine.dispose()
+
+
+def dump(engine, metadata):
+    """所有含ID列的表的数据（ID统一为字符串），以及每张表的索引（inspect 不返回含表达式的索引，从 sqlite_master 读取）"""
+    result = {}
+    with engine.connect() as conn:
+        for table_name in id_storage.guid_columns(metadata):
+            rows = conn.execute(text(f'SELECT * FROM {table_name}')).mappings().all()
+            names = set(id_storage.guid_columns(metadata)[table_name])
+            data = sorted(
+                tuple((key, id_storage.to_text(value) if key in names else value) for key, value in row.items())
+                for row in rows
+            )
+            indexes = conn.execute(text(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :table ORDER BY name"
+            ), {'table': table_name}).all()
+            result[table_name] = (data, [tuple(index) for index in indexes])
+    return result
+
+
+def test_sqlite_conversion_round_trip(m, engine):
+    metadata = m.db.metadata
+    before = dump(engine, metadata)
+    assert id_storage.detect_storage(engine, metadata) == 'text'
+
+    converted = id_storage.convert_storage(engine, metadata, 'native', batch_size=2, log=lambda message: None)
+    assert set(converted) == set(id_storage.guid_columns(metadata))
+    assert id_storage.detect_storage(engine, metadata) == 'native'
+    with engine.connect() as conn:
+        raw = conn.execute(text('SELECT student_id FROM student_submissions')).scalars().all()
+        assert raw and all(isinstance(value, bytes) and len(value) == 16 for value in raw)
+        assert conn.execute(text('PRAGMA foreign_key_check')).all() == []
+    assert dump(engine, metadata) == before
+
+    # 已是目标方式的表跳过
+    assert id_storage.convert_storage(engine, metadata, 'native', log=lambda message: None) == []
+    id_storage.convert_storage(engine, metadata, 'text', batch_size=2, log=lambda message: None)
+    assert id_storage.detect_storage(engine, metadata) == 'text'
+    assert dump(engine, metadata) == before
+
+
+def test_check_storage(m, engine, tmp_path):
+    metadata = m.db.metadata
+    id_storage.check_storage(engine, metadata, 'text')
+    with pytest.raises(id_storage.StorageMismatch):
+        id_storage.check_storage(engine, metadata, 'native')
+    # 还没有建表时不检查
+    empty = create_engine(f'sqlite:///{tmp_path / "empty.db"}')
+    id_storage.check_storage(empty, metadata, 'native')
+    empty.dispose()
+
+
+def test_worker_refuses_to_start_on_storage_mismatch(m, monkeypatch):
+    monkeypatch.setattr(m, 'UUID_STORAGE', 'native')
+    with pytest.raises(id_storage.StorageMismatch):
+        m.init_database()
@@ -0,0 +1,135 @@
+"""
+数据库结构版本管理：在空数据库和旧版本数据库上执行迁移
+"""
+
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
+
+import migrations
+
+LEGACY_SCHEMA = [
+    'CREATE TABLE classes (id VARCHAR(36) PRIMARY KEY, name VARCHAR(100) NOT NULL, description TEXT, '
+    'created_date DATETIME, is_active BOOLEAN, ended_date DATETIME)',
+    'CREATE TABLE students (id VARCHAR(36) PRIMARY KEY, name VARCHAR(50) NOT NULL, class_id VARCHAR(36), '
+    'created_date DATETIME)',
+    'CREATE TABLE student_submissions (id VARCHAR(36) PRIMARY KEY, student_id VARCHAR(36) NOT NULL, '
+    'course_id VARCHAR(36) NOT NULL, round_number INTEGER NOT NULL, answer VARCHAR(200) NOT NULL, '
+    'is_correct BOOLEAN, answer_time FLOAT NOT NULL, created_at DATETIME)',
+]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "migrations.db"}')
+    yield engine
+    engine.dispose()
+
+
+def test_fresh_database_migrates_to_latest(m, engine):
+    assert migrations.current_version(engine) == 0
+    assert migrations.applied_migrations(engine) == []
+    assert migrations.migrate(engine, m.db.metadata) == [version for version, _, _ in migrations.MIGRATIONS]
+    assert migrations.current_version(engine) == migrations.latest_version()
+    assert migrations.pending_migrations(engine) == []
+    # 再次执行不做任何事
+    assert migrations.migrate(engine, m.db.metadata) == []
+    tables = set(inspect(engine).get_table_names())
+    assert set(m.db.metadata.tables) <= tables
+
+
+def test_migrate_to_target(m, engine):
+    assert migrations.migrate(engine, m.db.metadata, target=3) == [1, 2, 3]
+    assert migrations.current_version(engine) == 3
+    assert [version for version, _, _ in migrations.pending_migrations(engine)] == \
+        [version for version, _, _ in migrations.MIGRATIONS if version > 3]
+
+
+def test_current_version_raises_when_database_unreachable(tmp_path):
+    # 连接失败不能当作空数据库（否则 worker 会以为需要从头迁移）
+    engine = create_engine(f'sqlite:///{tmp_path / "missing" / "dir" / "db.sqlite"}')
+    with pytest.raises(OperationalError):
+        migrations.current_version(engine)
+
+
+def test_legacy_database_upgrade(m, engine):
+    with engine.begin() as conn:
+        for ddl in LEGACY_SCHEMA:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO students (id, name, class_id) VALUES ('s1', '张三', 'c1'), ('s2', '李四', 'c1')"))
+        rows = [
+            # 同一学生同一轮次的重复提交：保留最早的一条
+            ('a', 's1', 'k1', 1, ' ÄBC ', 1, 3.0, '2024-01-01 10:00:00'),
+            ('b', 's1', 'k1', 1, 'x', 0, 4.0, '2024-01-01 10:00:05'),
+            ('c', 's1', 'k1', 1, 'y', 0, 5.0, '2024-01-01 10:00:09'),
+            ('d', 's2', 'k1', 1, 'Straße', 1, 6.0, '2024-01-01 10:00:01'),
+            ('e', 's2', 'k1', 2, '12', 0, 7.0, '2024-01-01 10:03:00'),
+        ]
+        conn.execute(text(
+            'INSERT INTO student_submissions (id, student_id, course_id, round_number, answer, is_correct, '
+            'answer_time, created_at) VALUES (:id, :sid, :cid, :rn, :answer, :ok, :t, :at)'
+        ), [dict(zip(('id', 'sid', 'cid', 'rn', 'answer', 'ok', 't', 'at'), row)) for row in rows])
+    # 违规计数字段由迁移 2 添加：先迁移到 4，写入违规计数后再执行合并重复提交的迁移 5
+    assert migrations.migrate(engine, m.db.metadata, target=4) == [1, 2, 3, 4]
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE student_submissions SET copy_count = 1, penalty_score = 3 WHERE id = 'b'"))
+        conn.execute(text("UPDATE student_submissions SET noisy_count = 2 WHERE id = 'c'"))
+
+    migrations.migrate(engine, m.db.metadata)
+    assert migrations.current_version(engine) == migrations.latest_version()
+    inspector = inspect(engine)
+    columns = {column['name'] for column in inspector.get_columns('student_submissions')}
+    assert {'guess_count', 'copy_count', 'noisy_count', 'distracted_count', 'penalty_score',
+            'normalized_answer'} <= columns
+    assert 'status' in {column['name'] for column in inspector.get_columns('students')}
+    assert 'uq_submissions_student_course_round' in {index['name'] for index in inspector.get_indexes('student_submissions')}
+
+    with engine.connect() as conn:
+        merged = conn.execute(text(
+            'SELECT id, copy_count, noisy_count, penalty_score, normalized_answer FROM student_submissions ORDER BY id'
+        )).all()
+    assert [tuple(row) for row in merged] == [
+        ('a', 1, 2, 3, ' ÄBC '.strip().lower()),
+        ('d', 0, 0, 0, 'straße'),
+        ('e', 0, 0, 0, '12'),
+    ]
+    # 回填的标准化答案与写入提交时的 normalize_answer 一致（SQL 的 lower() 不处理非ASCII字符）
+    assert merged[0].normalized_answer == m.normalize_answer(' ÄBC ') == 'äbc'
+
+
+def test_worker_start_does_not_migrate_without_auto_migrate(m, monkeypatch):
+    migrations.drop_schema_version(m.db.engine)
+    monkeypatch.setattr(m, 'AUTO_MIGRATE', False)
+    m.init_database()
+    assert migrations.current_version(m.db.engine) == 0
+    monkeypatch.setattr(m, 'AUTO_MIGRATE', True)
+    m.init_database()
+    assert migrations.current_version(m.db.engine) == migrations.latest_version()
+
+
+def test_normalized_answer_backfill_is_paged(m, engine, monkeypatch):
+    migrations.migrate(engine, m.db.metadata, target=7)
+    answers = [' ÄBC ', 'x', ' Y', '12', 'Straße', 'ⅻ', ' 7 ']
+    with engine.begin() as conn:
+        conn.execute(text(
+            'INSERT INTO student_submissions (id, student_id, course_id, round_number, answer, is_correct, answer_time) '
+            'VALUES (:id, :id, :course_id, 1, :answer, 0, 1.0)'
+        ), [{'id': f'{i:02d}', 'course_id': 'k1', 'answer': answer} for i, answer in enumerate(answers)])
+
+    selects = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT id, answer FROM student_submissions'):
+            selects.append(statement)
+
+    monkeypatch.setattr(migrations, 'BACKFILL_BATCH_SIZE', 2)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        migrations.migrate(engine, m.db.metadata)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    # 每页最多 2 行：7 行需要 4 页，再加一次确认没有剩余
+    assert len(selects) == 5 and all('LIMIT 2' in statement for statement in selects)
+    with engine.connect() as conn:
+        stored = dict(conn.execute(text('SELECT answer, normalized_answer FROM student_submissions')).all())
+    assert stored == {answer: m.normalize_answer(answer) for answer in answers}
@@ -0,0 +1,75 @@
+"""
+首页和班级管理页面的渲染缓存：写操作之后不返回旧页面，缓存的页面与不使用缓存渲染的结果相同
+"""
+
+import uuid
+from datetime import date
+
+import pytest
+
+
+def render(client, class_id):
+    homepage = client.get('/')
+    classroom = client.get(f'/classroom/{class_id}')
+    assert homepage.status_code == 200 and classroom.status_code == 200
+    return homepage.get_data(as_text=True), classroom.get_data(as_text=True)
+
+
+def uncached(m, client, class_id):
+    m.page_render_cache.clear()
+    return render(client, class_id)
+
+
+@pytest.fixture
+def classroom(m, client):
+    class_id = client.post('/api/create_class', json={'name': '缓存测试班'}).get_json()['class_id']
+    for name in ('甲', '乙', '丙'):
+        client.post('/api/add_student', json={'name': name, 'class_id': class_id})
+    return class_id
+
+
+def test_cached_pages_match_uncached_render(m, client, classroom):
+    first = render(client, classroom)
+    hits = m.page_render_cache.stats()['hits']
+    assert render(client, classroom) == first
+    assert m.page_render_cache.stats()['hits'] == hits + 2
+    assert uncached(m, client, classroom) == first
+
+
+def test_writes_invalidate_cached_pages(m, client, classroom):
+    goal_id = str(uuid.uuid4())
+    m.db.session.add(m.CompetitionGoal(id=goal_id, title='期末竞赛', goal_date=date(2030, 6, 1), is_active=True))
+    m.db.session.commit()
+    state = {}
+
+    def start_course():
+        state['course_id'] = client.post('/api/start_course', json={'course_name': '第一课', 'class_id': classroom}
+                                         ).get_json()['course_id']
+
+    def judge():
+        for name in ('甲', '乙'):
+            client.post('/submit_student_answer', json={'student_name': name, 'answer': '1', 'answer_time': 3,
+                                                        'course_id': state['course_id']})
+        client.post('/judge_answers', json={'correct_answer': '1', 'question_score': 2,
+                                            'course_id': state['course_id']})
+
+    # (操作, 操作, 页面是否一定变化)：课程列表显示结束时间，与开始在同一秒内结束时页面可能不变
+    writes = [
+        ('添加学生', lambda: client.post('/api/add_student', json={'name': '丁', 'class_id': classroom}), True),
+        ('删除学生', lambda: client.post('/api/delete_student', json={'student_name': '丙', 'class_id': classroom}),
+         True),
+        ('开始课程', start_course, True),
+        ('评判', judge, True),
+        ('结束课程', lambda: client.post(f"/api/end_course/{state['course_id']}"), False),
+        ('分配竞赛目标', lambda: client.post('/api/assign_goal_to_class',
+                                            json={'class_id': classroom, 'goal_id': goal_id}), True),
+    ]
+    before = render(client, classroom)
+    for label, write, changes in writes:
+        render(client, classroom)  # 缓存当前版本的页面
+        response = write()
+        assert response is None or response.status_code < 400, label
+        after = render(client, classroom)
+        assert after != before or not changes, label
+        assert after == uncached(m, client, classroom), label
+        before = after
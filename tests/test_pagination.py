@@ -0,0 +1,96 @@
+"""
+键集分页：逐页读取的结果与一次性排序的结果一致（时间相同和时间为空的行不重复、不遗漏）
+"""
+
+import random
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import pagination
+
+BASE = datetime(2025, 1, 6, 8, 0)
+
+
+def walk(client, url, key, limit):
+    items, cursor, pages = [], None, 0
+    while True:
+        response = client.get(url, query_string={'limit': limit, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200, response.get_json()
+        data = response.get_json()
+        assert len(data[key]) <= limit
+        items.extend(data[key])
+        pages += 1
+        cursor = data['next_cursor']
+        if not cursor:
+            return items, pages
+        # 游标没有前进时不会结束
+        assert pages <= 200, '分页没有结束'
+
+
+def expected_order(rows):
+    """(排序时间, id) 倒序，排序时间为空按 EPOCH"""
+    return [row_id for _, row_id in sorted(((t or pagination.EPOCH, row_id) for t, row_id in rows), reverse=True)]
+
+
+def test_cursor_round_trip():
+    value = datetime(2025, 3, 1, 12, 30, 5, 123456)
+    assert pagination.decode_cursor(pagination.encode_cursor(value, 'abc')) == (value, 'abc')
+    assert pagination.decode_cursor(pagination.encode_cursor(None, 'abc')) == (pagination.EPOCH, 'abc')
+    with pytest.raises(pagination.InvalidCursor):
+        pagination.decode_cursor('not-a-cursor')
+
+
+def test_history_classes_pages(m, client):
+    rng = random.Random(5)
+    rows = []
+    for i in range(23):
+        # 结束时间有重复、有空值（空值按创建时间排序）
+        ended = None if i % 5 == 0 else BASE + timedelta(days=rng.randint(0, 4))
+        created = BASE - timedelta(days=rng.randint(0, 2))
+        class_obj = m.Class(id=str(uuid.uuid4()), name=f'历史班级{i}', is_active=False,
+                            ended_date=ended, created_date=created)
+        m.db.session.add(class_obj)
+        rows.append((ended or created, class_obj.id))
+    m.db.session.commit()
+    for limit in (1, 4, 7, 50):
+        items, pages = walk(client, '/api/history_classes', 'classes', limit)
+        assert [item['id'] for item in items] == expected_order(rows)
+        assert pages == max(1, -(-len(rows) // limit))
+
+
+def test_class_courses_pages(m, client):
+    class_obj = m.Class(id=str(uuid.uuid4()), name='课程班级', is_active=True, created_date=BASE)
+    m.db.session.add(class_obj)
+    rows = []
+    for i in range(17):
+        created = BASE + timedelta(hours=i // 3)
+        ended = created + timedelta(minutes=45) if i % 4 else None
+        course = m.Course(id=str(uuid.uuid4()), class_id=class_obj.id, name=f'第{i}节课', is_active=ended is None,
+                          current_round=1, created_at=created, ended_at=ended)
+        m.db.session.add(course)
+        rows.append((ended or created, course.id))
+    m.db.session.commit()
+    items, _ = walk(client, f'/api/class_courses/{class_obj.id}', 'courses', 5)
+    assert [item['id'] for item in items] == expected_order(rows)
+
+
+def test_student_submissions_pages(m, client, dataset):
+    layout = dataset(classes=1, students=3, courses=4, rounds=6, participation=1, absent_rate=0)
+    student_id = layout['classes'][0]['students'][0]['id']
+    submissions = m.StudentSubmission.query.filter_by(student_id=student_id).all()
+    # 时间相同的提交按 id 排序
+    for sub in submissions[::3]:
+        sub.created_at = BASE
+    m.db.session.commit()
+    rows = [(sub.created_at, sub.id) for sub in submissions]
+    items, _ = walk(client, f'/api/student_submissions/{student_id}', 'submissions', 4)
+    assert [item['id'] for item in items] == expected_order(rows)
+
+
+def test_invalid_cursor_is_rejected(client):
+    for url in ('/api/history_classes', f'/api/class_courses/{uuid.uuid4()}'):
+        response = client.get(url, query_string={'cursor': '!!!'})
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
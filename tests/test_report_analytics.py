@@ -0,0 +1,152 @@
+"""
+学生课程报告分析：report_analytics 的分组聚合结果与改写前逐条遍历提交记录的计算一致
+"""
+
+import statistics
+from collections import defaultdict
+
+import report_analytics
+
+
+def reference_report(m, course, student_id):
+    """改写前 generate_student_report 的算法（列表遍历，逐轮过滤全班提交）"""
+    rounds = m.CourseRound.query.filter_by(course_id=course.id).all()
+    active_ids = {s.id for s in m.Student.query.filter_by(class_id=course.class_id, status='active')}
+    active_count = len(active_ids) or 1
+    class_submissions = [s for s in m.StudentSubmission.query.filter_by(course_id=course.id) if s.student_id in active_ids]
+    submissions = m.StudentSubmission.query.filter_by(student_id=student_id, course_id=course.id).order_by(
+        m.StudentSubmission.created_at.desc()).all()
+
+    def round_score(rn):
+        r = next((rr for rr in rounds if rr.round_number == rn), None)
+        return r.question_score if r and r.question_score else 1
+
+    def round_numbers(rn):
+        rs = [s for s in class_submissions if s.round_number == rn]
+        acc = len({s.student_id for s in rs if s.is_correct}) / active_count * 100
+        part = len({s.student_id for s in rs}) / active_count * 100
+        times = [s.answer_time for s in rs if s.answer_time is not None]
+        avg_t = round(statistics.mean(times), 1) if times else 0
+        return acc, part, avg_t
+
+    round_nums = sorted({r.round_number for r in rounds})
+    invalid = set()
+    round_stats = []
+    for rn in round_nums:
+        acc, part, avg_t = round_numbers(rn)
+        if part == 0 and acc == 0 and avg_t < 10:
+            invalid.add(rn)
+        else:
+            round_stats.append({'round': rn, 'accuracy': round(acc, 1), 'participation_rate': round(part, 1),
+                                'avg_time': avg_t})
+
+    def answered(s):
+        return s.answer is not None and str(s.answer).strip() != ''
+
+    views, participated_rounds = [], 0
+    for r in rounds:
+        if r.round_number in invalid:
+            continue
+        rs = next((s for s in submissions if s.round_number == r.round_number), None)
+        violation = None
+        if rs:
+            for field, label in (('guess_count', '猜题'), ('copy_count', '抄题'),
+                                 ('noisy_count', '打闹'), ('distracted_count', '走神')):
+                if (getattr(rs, field) or 0) > 0:
+                    violation = label
+                    break
+        q_score = r.question_score if r.question_score else 1
+        if rs and answered(rs):
+            participated_rounds += 1
+            times = [s.answer_time for s in class_submissions
+                     if s.round_number == r.round_number and s.answer_time is not None and answered(s)]
+            views.append({'round': r.round_number, 'answer': rs.answer, 'is_correct': bool(rs.is_correct),
+                          'question_score': q_score, 'answer_time': rs.answer_time or 0, 'violation_type': violation,
+                          'speed_level': report_analytics.speed_level(rs.answer_time or 0,
+                                                                      statistics.mean(times) if times else 0)})
+        else:
+            views.append({'round': r.round_number, 'answer': '', 'is_correct': False, 'question_score': q_score,
+                          'answer_time': 0, 'violation_type': violation, 'speed_level': ''})
+
+    total_score = sum(round_score(s.round_number) for s in submissions if s.is_correct and s.round_number not in invalid)
+    correct_sets, total_sets, scores = defaultdict(set), defaultdict(set), defaultdict(int)
+    for s in class_submissions:
+        if s.round_number in invalid:
+            continue
+        total_sets[s.student_id].add(s.round_number)
+        if s.is_correct:
+            correct_sets[s.student_id].add(s.round_number)
+            scores[s.student_id] += round_score(s.round_number)
+    acc_list = [len(correct_sets[sid]) / len(total) * 100 for sid, total in total_sets.items()]
+    class_times = [s.answer_time for s in class_submissions if s.answer_time is not None]
+    st_times = [s.answer_time for s in submissions if s.answer_time is not None]
+    rank = sum(1 for score in scores.values() if score > total_score) + 1 if scores else None
+    return {
+        'invalid_rounds': sorted(invalid),
+        'round_stats': round_stats,
+        'class_avg_accuracy': round(sum(acc_list) / len(acc_list)) if acc_list else 0,
+        'class_avg_score': round(sum(scores.values()) / len(scores)) if scores else 0,
+        'class_avg_participation': round(len({s.student_id for s in class_submissions}) / active_count * 100),
+        'class_avg_response_time': round(statistics.mean(class_times), 1) if class_times else 0,
+        'total_possible_score': sum((r.question_score or 1) for r in rounds if r.round_number not in invalid),
+        'valid_rounds_count': len(round_stats),
+        'all_rounds_count': len(rounds),
+        'student_submissions': views,
+        'participated_rounds': participated_rounds,
+        'student_total_score': total_score,
+        'avg_response_time': round(statistics.mean(st_times), 1) if st_times else 0,
+        'rank': rank,
+        'percentile': round((rank - 1) / len(scores) * 100, 1) if rank else None
+    }
+
+
+def analytics_report(m, course, student_id):
+    active_ids = [s.id for s in m.Student.query.filter_by(class_id=course.class_id, status='active')]
+    rounds = [(r.round_number, r.question_score) for r in m.CourseRound.query.filter_by(course_id=course.id)]
+    cells = report_analytics.query_round_cells(m.db.session, m.StudentSubmission, course.id, active_ids)
+    course_stats = report_analytics.build_course_analytics(rounds, cells, len(active_ids))
+    submissions = m.StudentSubmission.query.filter_by(student_id=student_id, course_id=course.id).order_by(
+        m.StudentSubmission.created_at.desc()).all()
+    report = dict(course_stats)
+    report.update(report_analytics.build_student_analytics(course_stats, rounds, submissions))
+    return report
+
+
+def assert_reports_match(m, course_ids, student_ids):
+    for course_id in course_ids:
+        course = m.db.session.get(m.Course, course_id)
+        for student_id in student_ids:
+            expected = reference_report(m, course, student_id)
+            actual = analytics_report(m, course, student_id)
+            assert {key: actual[key] for key in expected} == expected, (course_id, student_id)
+
+
+def test_report_analytics_match_reference(m, dataset):
+    layout = dataset(rounds=8)
+    for class_info in layout['classes']:
+        assert_reports_match(m, class_info['courses'], [s['id'] for s in class_info['students']])
+
+
+def test_report_analytics_edge_rounds(m, dataset):
+    layout = dataset(classes=1, students=8, courses=1, rounds=5, participation=0.6, absent_rate=0)
+    class_info = layout['classes'][0]
+    course_id = class_info['courses'][0]
+    students = [s['id'] for s in class_info['students']]
+    # 无人参与的轮次（作废）、分值为空的轮次、没有轮次记录的提交、重复的轮次记录、空答案
+    m.db.session.add(m.CourseRound(course_id=course_id, round_number=9, correct_answer='1', question_score=2))
+    m.CourseRound.query.filter_by(course_id=course_id, round_number=2).update({'question_score': None})
+    m.db.session.add(m.CourseRound(course_id=course_id, round_number=3, correct_answer='1', question_score=5))
+    m.db.session.add(m.StudentSubmission(student_id=students[0], course_id=course_id, round_number=12,
+                                         answer='7', is_correct=True, answer_time=40.0))
+    m.db.session.add(m.StudentSubmission(student_id=students[1], course_id=course_id, round_number=12,
+                                         answer='', is_correct=False, answer_time=0.0))
+    # 请假学生的提交不参与统计
+    m.Student.query.filter_by(id=students[2]).update({'status': 'absent'})
+    m.db.session.commit()
+    assert_reports_match(m, [course_id], students)
+
+
+def test_course_without_submissions(m, dataset):
+    layout = dataset(classes=1, courses=1, participation=0)
+    class_info = layout['classes'][0]
+    assert_reports_match(m, class_info['courses'], [s['id'] for s in class_info['students'][:2]])
@@ -0,0 +1,78 @@
+"""
+课程报告快照：课程结束时保存的班级统计与实时计算一致，数据变化后失效
+"""
+
+import json
+
+import report_analytics
+
+
+def live_analytics(m, course, active_ids):
+    rounds = [(r.round_number, r.question_score) for r in m.CourseRound.query.filter_by(course_id=course.id)]
+    cells = report_analytics.query_round_cells(m.db.session, m.StudentSubmission, course.id, active_ids)
+    return rounds, report_analytics.build_course_analytics(rounds, cells, len(active_ids))
+
+
+def active_student_ids(m, class_id):
+    return [s.id for s in m.Student.query.filter_by(class_id=class_id, status='active')]
+
+
+def test_snapshot_saved_on_end_course_matches_live(m, lesson):
+    played = lesson(students=8, rounds=5, seed=21, end=True)
+    course = m.db.session.get(m.Course, played['course_id'])
+    active_ids = active_student_ids(m, played['class_id'])
+    snapshot = m.load_report_snapshot(course, active_ids)
+    assert snapshot is not None
+    assert snapshot == live_analytics(m, course, active_ids)
+
+
+def test_report_page_identical_with_snapshot(m, client, lesson):
+    played = lesson(students=6, rounds=4, seed=22, end=True)
+    course_id = played['course_id']
+    student = m.Student.query.filter_by(class_id=played['class_id'], name=played['names'][0]).one()
+    url = f'/generate_student_report/{student.id}?course_id={course_id}'
+    with_snapshot = client.get(url)
+    assert with_snapshot.status_code == 200
+
+    course = m.db.session.get(m.Course, course_id)
+    m.clear_report_snapshot(course)
+    m.db.session.commit()
+    assert m.load_report_snapshot(course, active_student_ids(m, played['class_id'])) is None
+    # 快照缺失时实时计算并补存
+    recomputed = client.get(url)
+    assert recomputed.get_data() == with_snapshot.get_data()
+    m.db.session.expire_all()
+    assert m.load_report_snapshot(m.db.session.get(m.Course, course_id),
+                                  active_student_ids(m, played['class_id'])) is not None
+
+
+def test_snapshot_ignored_when_active_students_change(m, client, lesson):
+    played = lesson(students=6, rounds=4, seed=23, end=True)
+    absent = m.Student.query.filter_by(class_id=played['class_id'], name=played['names'][1]).one()
+    assert client.post(f'/api/student_absent/{absent.id}').status_code == 200
+    m.db.session.expire_all()
+    course = m.db.session.get(m.Course, played['course_id'])
+    active_ids = active_student_ids(m, played['class_id'])
+    assert absent.id not in active_ids
+    assert m.load_report_snapshot(course, active_ids) is None
+    assert m.get_course_report_analytics(course, active_ids) == live_analytics(m, course, active_ids)
+
+
+def test_behavior_mark_after_end_clears_snapshot(m, client, lesson):
+    played = lesson(students=6, rounds=3, seed=24, end=True)
+    course_id = played['course_id']
+    response = client.post('/api/mark_behavior', json={'student_name': played['names'][0], 'behavior': 'guess',
+                                                        'course_id': course_id})
+    assert response.status_code == 200
+    m.db.session.expire_all()
+    course = m.db.session.get(m.Course, course_id)
+    assert m.REPORT_SNAPSHOT_KEY not in m._course_extra_data(course)
+
+
+def test_dump_and_load_round_trip(m, dataset):
+    layout = dataset(classes=1, rounds=7)
+    class_info = layout['classes'][0]
+    course = m.db.session.get(m.Course, class_info['courses'][0])
+    _, course_stats = live_analytics(m, course, active_student_ids(m, class_info['id']))
+    dumped = json.loads(json.dumps(report_analytics.dump_course_analytics(course_stats)))
+    assert report_analytics.load_course_analytics(dumped) == course_stats
@@ -0,0 +1,50 @@
+"""
+已结束课程报告的 ETag/Last-Modified：未变化时返回 304，课程结束后的修改使缓存失效，进行中的课程不带验证信息
+"""
+
+
+def report(client, course_id, **headers):
+    return client.get(f'/reports/{course_id}', headers=headers)
+
+
+def test_if_none_match_returns_304(lesson, client):
+    played = lesson(students=4, rounds=2, end=True)
+    first = report(client, played['course_id'])
+    assert first.status_code == 200 and first.headers.get('ETag')
+    second = report(client, played['course_id'], **{'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304 and second.headers['ETag'] == first.headers['ETag']
+    assert second.get_data() == b''
+
+
+def test_changes_after_end_change_the_etag(m, lesson, client):
+    played = lesson(students=4, rounds=2, end=True)
+    course_id = played['course_id']
+    etag = report(client, course_id).headers['ETag']
+
+    client.post('/api/mark_behavior', json={'student_name': played['names'][0], 'behavior': 'guess',
+                                            'course_id': course_id})
+    after_mark = report(client, course_id, **{'If-None-Match': etag})
+    assert after_mark.status_code == 200 and after_mark.headers['ETag'] != etag
+
+    etag = after_mark.headers['ETag']
+    student_id = m.db.session.query(m.Student.id).filter_by(class_id=played['class_id'],
+                                                            name=played['names'][1]).scalar()
+    assert client.post(f'/api/student_absent/{student_id}').status_code == 200
+    after_absence = report(client, course_id, **{'If-None-Match': etag})
+    assert after_absence.status_code == 200 and after_absence.headers['ETag'] != etag
+
+
+def test_in_progress_course_has_no_validators(lesson, client):
+    played = lesson(students=4, rounds=2)
+    response = report(client, played['course_id'], **{'If-None-Match': '*'})
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers and 'Last-Modified' not in response.headers
+
+
+def test_if_modified_since(lesson, client):
+    played = lesson(students=4, rounds=2, end=True)
+    first = report(client, played['course_id'])
+    last_modified = first.headers['Last-Modified']
+    assert report(client, played['course_id'], **{'If-Modified-Since': last_modified}).status_code == 304
+    stale = report(client, played['course_id'], **{'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'})
+    assert stale.status_code == 200 and stale.headers['Last-Modified'] == last_modified
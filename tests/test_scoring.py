@@ -0,0 +1,80 @@
+"""
+计分引擎：聚合查询的结果与逐条提交计算（改写前的逻辑）一致
+"""
+
+from collections import defaultdict
+
+
+def reference_course_scores(m, course_id, below_round=None):
+    """改写前的算法：逐条遍历提交，正确提交按该轮分值计分（没有轮次记录按1分）"""
+    round_scores = {}
+    for r in m.CourseRound.query.filter_by(course_id=course_id).all():
+        round_scores[r.round_number] = max(round_scores.get(r.round_number) or 0, r.question_score or 0) or None
+    stats = defaultdict(lambda: {'score': 0, 'correct': set(), 'answered': set(), 'penalty_total': 0})
+    for sub in m.StudentSubmission.query.filter_by(course_id=course_id).all():
+        if below_round is not None and sub.round_number >= below_round:
+            continue
+        entry = stats[sub.student_id]
+        entry['answered'].add(sub.round_number)
+        entry['penalty_total'] += sub.penalty_score or 0
+        if sub.is_correct:
+            entry['score'] += round_scores.get(sub.round_number) or 1
+            entry['correct'].add(sub.round_number)
+    return {
+        student_id: {'score': entry['score'], 'correct_rounds': len(entry['correct']),
+                     'rounds_answered': len(entry['answered']), 'penalty_total': entry['penalty_total']}
+        for student_id, entry in stats.items()
+    }
+
+
+def test_aggregate_course_scores_matches_per_submission_loop(m, dataset):
+    layout = dataset()
+    for class_info in layout['classes']:
+        for course_id in class_info['courses']:
+            assert m.aggregate_course_scores(course_id) == reference_course_scores(m, course_id)
+            assert m.aggregate_course_scores(course_id, below_round=4) == reference_course_scores(m, course_id, 4)
+
+
+def test_aggregate_course_scores_student_filter(m, dataset):
+    layout = dataset(classes=1)
+    class_info = layout['classes'][0]
+    course_id = class_info['courses'][0]
+    student_ids = [s['id'] for s in class_info['students'][:3]]
+    expected = {sid: v for sid, v in reference_course_scores(m, course_id).items() if sid in student_ids}
+    assert m.aggregate_course_scores(course_id, student_ids=student_ids) == expected
+
+
+def test_duplicate_round_records_are_not_double_counted(m, dataset):
+    layout = dataset(classes=1, courses=1, behavior_rate=0)
+    course_id = layout['classes'][0]['courses'][0]
+    before = m.aggregate_course_scores(course_id)
+    # 同一轮次的重复记录（旧版本改判时可能产生）：连接后不能让该轮的提交重复计分
+    first = m.CourseRound.query.filter_by(course_id=course_id, round_number=1).first()
+    m.db.session.add(m.CourseRound(course_id=course_id, round_number=1, correct_answer=first.correct_answer,
+                                   question_score=first.question_score, is_completed=True))
+    m.db.session.commit()
+    assert m.aggregate_course_scores(course_id) == before
+
+
+def test_correct_submission_without_round_record_scores_one(m, dataset):
+    layout = dataset(classes=1, courses=1, behavior_rate=0)
+    course_id = layout['classes'][0]['courses'][0]
+    m.CourseRound.query.filter_by(course_id=course_id, round_number=2).delete()
+    m.db.session.commit()
+    assert m.aggregate_course_scores(course_id) == reference_course_scores(m, course_id)
+
+
+def test_aggregate_class_student_totals(m, dataset):
+    layout = dataset()
+    for class_info in layout['classes']:
+        expected = {}
+        for student in class_info['students']:
+            score, courses = 0, 0
+            for course_id in class_info['courses']:
+                stats = reference_course_scores(m, course_id).get(student['id'])
+                if stats:
+                    score += stats['score']
+                    courses += 1
+            absences = m.CourseAttendance.query.filter_by(student_id=student['id'], is_absent=True).count()
+            expected[student['id']] = (score, courses, absences)
+        assert m.aggregate_class_student_totals(class_info['id']) == expected
@@ -0,0 +1,123 @@
+"""
+提交答案：名册缓存落后于数据库（其他 worker 修改了学生）时的处理
+"""
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import text
+
+
+def setup_course(client, names):
+    class_id = client.post('/api/create_class', json={'name': '提交测试'}).get_json()['class_id']
+    for name in names:
+        client.post('/api/add_student', json={'name': name, 'class_id': class_id})
+    course_id = client.post('/api/start_course', json={'course_name': '课程', 'class_id': class_id}).get_json()['course_id']
+    return class_id, course_id
+
+
+def submit(client, course_id, name, answer='1'):
+    return client.post('/submit_student_answer', json={'student_name': name, 'answer': answer, 'answer_time': 2,
+                                                        'course_id': course_id})
+
+
+@pytest.mark.parametrize('buffered', [False, True])
+def test_stale_roster_cache(m, client, monkeypatch, buffered):
+    monkeypatch.setattr(m, 'SUBMISSION_BUFFER', buffered)
+    class_id, course_id = setup_course(client, ['甲', '乙', '丙', '丁'])
+    assert submit(client, course_id, '甲').status_code == 200  # 名册已缓存
+    ids = {name: m.db.session.query(m.Student.id).filter_by(class_id=class_id, name=name).scalar()
+           for name in ('乙', '丙')}
+    # 模拟其他 worker 直接修改数据库：本进程的名册缓存没有失效
+    m.db.session.execute(text("UPDATE students SET status = 'absent' WHERE id = :id"), {'id': ids['乙']})
+    for table in ('course_scores', 'course_attendances'):
+        m.db.session.execute(text(f'DELETE FROM {table} WHERE student_id = :id'), {'id': ids['丙']})
+    m.db.session.execute(text('DELETE FROM students WHERE id = :id'), {'id': ids['丙']})
+    m.db.session.commit()
+
+    absent = submit(client, course_id, '乙')
+    assert absent.status_code == 403
+    deleted = submit(client, course_id, '丙')
+    assert deleted.status_code == 400 and deleted.get_json()['message'] == '学生不存在'
+    duplicate = submit(client, course_id, '甲')
+    assert duplicate.status_code == 400 and duplicate.get_json()['message'] == '您已经提交过答案了'
+
+    m.db.session.execute(text("UPDATE students SET status = 'active' WHERE id = :id"), {'id': ids['乙']})
+    m.db.session.commit()
+    assert submit(client, course_id, '乙').status_code == 200
+
+    batch = client.post('/submit_answers_batch', json={
+        'course_id': course_id, 'submissions': [{'student_name': name, 'answer': '2'} for name in ('丙', '丁')]
+    }).get_json()
+    assert [(r['student_name'], r['success']) for r in batch['results']] == [('丙', False), ('丁', True)]
+    orphans = m.db.session.execute(text(
+        'SELECT COUNT(*) FROM student_submissions s LEFT JOIN students t ON t.id = s.student_id WHERE t.id IS NULL'
+    )).scalar()
+    assert orphans == 0
+
+
+@pytest.mark.parametrize('returning', [True, False])
+def test_submission_after_course_ended_elsewhere(m, client, monkeypatch, returning):
+    # 不支持 RETURNING 时在 INSERT 之后另行读取结束时间
+    monkeypatch.setattr(m.db.engine.dialect, 'insert_returning', returning)
+    class_id, course_id = setup_course(client, ['甲', '乙'])
+    assert submit(client, course_id, '甲').status_code == 200  # 课程上下文已缓存
+    # 其他 worker 结束课程并生成了报告快照：本进程的课程上下文缓存没有失效
+    m.db.session.execute(text(
+        "UPDATE courses SET ended_at = CURRENT_TIMESTAMP, extra_data = :extra, data_version = 5 WHERE id = :id"
+    ), {'extra': '{"report_analytics": {"version": 1}}', 'id': course_id})
+    m.db.session.commit()
+
+    assert submit(client, course_id, '乙').status_code == 200
+    m.db.session.expire_all()
+    course = m.db.session.get(m.Course, course_id)
+    assert m.REPORT_SNAPSHOT_KEY not in m._course_extra_data(course)
+    assert course.data_version == 6
+
+
+def test_batch_round_number_validation(m, client):
+    class_id, course_id = setup_course(client, ['甲'])
+    payload = {'course_id': course_id, 'submissions': [{'student_name': '甲', 'answer': '1'}]}
+    assert client.post('/submit_answers_batch', json={**payload, 'round_number': 'abc'}).status_code == 400
+    stale = client.post('/submit_answers_batch', json={**payload, 'round_number': 2})
+    assert stale.status_code == 409 and stale.get_json()['round_number'] == 1
+    assert client.post('/submit_answers_batch', json={**payload, 'round_number': '1'}).get_json()['submitted'] == 1
+
+
+def test_buffered_submission_timeout(m, client, monkeypatch):
+    monkeypatch.setattr(m, 'SUBMISSION_BUFFER', True)
+    class_id, course_id = setup_course(client, ['甲'])
+
+    def timed_out(item, timeout=None):
+        raise m.FuturesTimeoutError()
+
+    monkeypatch.setattr(m.submission_buffer, 'submit', timed_out)
+    response = submit(client, course_id, '甲')
+    assert response.status_code == 503 and response.get_json()['message'] == '提交繁忙，请重新提交'
+    monkeypatch.undo()
+    # 超时的提交没有写入，重新提交成功
+    assert submit(client, course_id, '甲').status_code == 200
+
+
+def test_mark_behavior_flushes_buffered_submissions(m, client, monkeypatch):
+    class_id, course_id = setup_course(client, ['甲'])
+    student_id = m.db.session.query(m.Student.id).filter_by(class_id=class_id, name='甲').scalar()
+    # 缓冲区在标记行为之前不会自动写入
+    buffer = m.GroupCommitBuffer(m._write_submission_batch, max_delay_ms=60000)
+    monkeypatch.setattr(m, 'submission_buffer', buffer)
+    results = []
+    worker = threading.Thread(target=lambda: results.append(buffer.submit({
+        'course_id': course_id, 'student_id': student_id, 'answer': '1', 'answer_time': 2.0
+    }, timeout=10)))
+    worker.start()
+    deadline = time.monotonic() + 5
+    while buffer.stats()['pending'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    response = client.post('/api/mark_behavior', json={'student_name': '甲', 'behavior': 'guess',
+                                                        'course_id': course_id})
+    worker.join(5)
+    assert response.status_code == 200 and results[0]['inserted']
+    rows = m.StudentSubmission.query.filter_by(course_id=course_id, student_id=student_id).all()
+    assert [(row.answer, row.guess_count, row.penalty_score) for row in rows] == [('1', 1, 3)]
@@ -0,0 +1,52 @@
+"""
+组提交写缓冲：等待超时时的处理
+"""
+
+import threading
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from write_buffer import GroupCommitBuffer
+
+
+def blocking_buffer():
+    """第一批写入阻塞，直到 release 被设置"""
+    started, release, written = threading.Event(), threading.Event(), []
+
+    def write_batch(items):
+        started.set()
+        assert release.wait(5)
+        written.extend(items)
+        return [f'ok:{item}' for item in items]
+
+    return GroupCommitBuffer(write_batch, max_delay_ms=1), started, release, written
+
+
+def test_timed_out_pending_item_is_never_written():
+    buffer, started, release, written = blocking_buffer()
+    results = []
+    worker = threading.Thread(target=lambda: results.append(buffer.submit('a', timeout=5)))
+    worker.start()
+    assert started.wait(5)
+    # 'a' 正在写入，'b' 还在缓冲区中
+    with pytest.raises(TimeoutError):
+        buffer.submit('b', timeout=0.05)
+    assert buffer.stats()['pending'] == 0 and buffer.stats()['timeouts'] == 1
+    release.set()
+    worker.join(5)
+    assert results == ['ok:a']
+    assert buffer.flush() == 0
+    assert written == ['a']
+
+
+def test_timed_out_in_flight_item_waits_for_its_batch():
+    buffer, started, release, written = blocking_buffer()
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    try:
+        assert buffer.submit('a', timeout=0.05) == 'ok:a'
+    finally:
+        timer.cancel()
+    assert started.is_set() and written == ['a']
+    assert buffer.stats()['timeouts'] == 0
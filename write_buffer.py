@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+组提交写缓冲（group commit）
+每轮开始时几十个学生几乎同时提交答案，每个请求各自占用一条数据库连接、各自提交一次事务。
+开启缓冲后，请求线程只把写入放进本进程的缓冲区并等待；后台线程每隔几毫秒（或攒够 N 条）
+把缓冲区中的所有写入放在一个事务中执行，事务提交后一起唤醒等待的请求。
+
+- 请求返回时数据已经提交到数据库，其他 worker（例如评判）能看到所有已确认的写入
+- 等待中的请求不占用数据库连接，峰值时只有后台线程使用一条连接
+- flush() 立即写入缓冲区中已有的全部条目，返回时它们都已提交（评判、进入下一轮前调用）
+- 等待超时时，还在缓冲区中的条目被移除、不会再写入；已经在写入的批次中的条目等批次写完再返回
+"""
+
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+
+class GroupCommitBuffer:
+    """按时间窗口或条数把多个请求的写入合并为一个事务
+
+    Args:
+        write_batch: 写入一批条目的函数，接收条目列表、返回等长的结果列表；
+                     在一个事务中完成写入并提交，抛出异常时整批失败
+        max_rows: 攒够多少条立即写入
+        max_delay_ms: 第一条进入缓冲区后最多等待多久写入
+    """
+
+    def __init__(self, write_batch, max_rows=50, max_delay_ms=5.0, name='write_buffer'):
+        self.write_batch = write_batch
+        self.max_rows = max(1, max_rows)
+        self.max_delay = max(0.0, max_delay_ms) / 1000
+        self.name = name
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = []  # [(item, Future)]
+        self._write_lock = threading.Lock()  # 同一时间只写一个批次，flush() 会等正在写的批次完成
+        self._thread = None
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+        self.largest_batch = 0
+        self.flushes = 0
+        self.timeouts = 0
+
+    def submit(self, item, timeout=None):
+        """放入缓冲区并等待所在批次提交，返回该条目的写入结果（写入失败时抛出异常）
+
+        超过 timeout 秒仍在缓冲区中时移除该条目（不会再写入）并抛出 TimeoutError；
+        条目已经进入正在写入的批次时继续等待该批次完成，结果与数据库一致
+        """
+        future = Future()
+        entry = (item, future)
+        with self._lock:
+            self._ensure_thread()
+            self._pending.append(entry)
+            self._wakeup.notify()
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            with self._lock:
+                queued = any(pending is entry for pending in self._pending)
+                if queued:
+                    self._pending = [pending for pending in self._pending if pending is not entry]
+                    future.cancel()
+                    self.timeouts += 1
+            if queued:
+                raise
+            return future.result()
+
+    def flush(self):
+        """立即写入缓冲区中的全部条目，返回写入的条数"""
+        with self._lock:
+            if not self._pending and not self._write_lock.locked():
+                return 0
+            self.flushes += 1
+        return self._write_pending()
+
+    def _ensure_thread(self):
+        # 延迟到第一次使用时启动（gunicorn fork 之后每个 worker 各有一个后台线程）
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                deadline = time.monotonic() + self.max_delay
+                while len(self._pending) < self.max_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending = self._pending[:self.max_rows], self._pending[self.max_rows:]
+            written = 0
+            while batch:
+                written += self._write(batch)
+                with self._lock:
+                    batch, self._pending = self._pending[:self.max_rows], self._pending[self.max_rows:]
+                if not batch:
+                    break
+            return written
+
+    def _write(self, batch):
+        try:
+            results = self.write_batch([item for item, _ in batch])
+        except Exception as e:
+            self.errors += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return 0
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+        self.batches += 1
+        self.rows += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        return len(batch)
+
+    def stats(self):
+        """统计信息"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'name': self.name,
+            'pending': pending,
+            'batches': self.batches,
+            'rows': self.rows,
+            'avg_batch': round(self.rows / self.batches, 1) if self.batches else 0,
+            'largest_batch': self.largest_batch,
+            'flushes': self.flushes,
+            'timeouts': self.timeouts,
+            'errors': self.errors
+        }